@@ -0,0 +1,371 @@
+"""
+Login lookup, credential cache and session tokens.
+
+``find_account`` resolves a username to its role and password hash in one round
+trip. It is a UNION ALL over Lecturers, Administrators and students, with one
+branch per indexed column and only the columns login needs. When a login
+matches several tables, the first role in LOGIN_ROLES wins, as in the old
+sequential lookups.
+
+``check_password_hash`` is deliberately slow, so logins verified in the last
+LOGIN_CACHE_TTL_SECONDS are remembered. The cache key is an HMAC of the username
+and password with a per-process key, so the plain password is never stored.
+A repeat login inside the window needs neither the database nor the hash.
+
+A successful login returns a signed session token (itsdangerous, keyed by
+SESSION_SECRET) that /api/session verifies without touching the database.
+Tokens expire after SESSION_TTL_SECONDS. Logging out revokes the token in this
+process only. Set SESSION_SECRET when running several server processes, or
+each one will reject the others' tokens.
+
+Deleting or re-creating an account calls ``forget_user``. That drops the
+account's cached logins and rejects its tokens issued before then, in this
+process. Other processes find out through ``account_exists``: a token's account
+is looked up again once it has gone SESSION_ACCOUNT_CHECK_SECONDS unconfirmed.
+
+Password hashing and verification (werkzeug's scrypt or PBKDF2) run in a
+PasswordHasher, a pool of HASH_WORKERS ``spawn`` processes, so a burst of
+logins does not hold request threads on CPU. At most HASH_MAX_PENDING hashes may be queued or running; beyond that, and
+after HASH_TIMEOUT_SECONDS, callers get HashingBusy (HTTP 503). LoginThrottle
+caps hashing attempts per client address and per username in sliding windows,
+so credential stuffing cannot fill the queue. Both are per process.
+"""
+import collections
+import hashlib
+import hmac
+import logging
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from instrumentation import Counter, Gauge, Histogram, LATENCY_BUCKETS
+from response_cache import LRUBackend
+
+logger = logging.getLogger(__name__)
+
+LOGIN_CACHE_TTL_SECONDS = float(os.getenv('LOGIN_CACHE_TTL_SECONDS', '300'))
+LOGIN_CACHE_MAX_ENTRIES = int(os.getenv('LOGIN_CACHE_MAX_ENTRIES', '10000'))
+SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', '28800'))
+SESSION_SECRET = os.getenv('SESSION_SECRET')
+SESSION_ACCOUNT_CHECK_SECONDS = float(os.getenv('SESSION_ACCOUNT_CHECK_SECONDS', '60'))
+
+# 0 workers hashes on the calling thread
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+HASH_MAX_PENDING = int(os.getenv('HASH_MAX_PENDING', '64'))
+HASH_TIMEOUT_SECONDS = float(os.getenv('HASH_TIMEOUT_SECONDS', '10'))
+
+LOGIN_IP_LIMIT = int(os.getenv('LOGIN_IP_LIMIT', '30'))
+LOGIN_IP_WINDOW_SECONDS = float(os.getenv('LOGIN_IP_WINDOW_SECONDS', '60'))
+LOGIN_ACCOUNT_LIMIT = int(os.getenv('LOGIN_ACCOUNT_LIMIT', '10'))
+LOGIN_ACCOUNT_WINDOW_SECONDS = float(os.getenv('LOGIN_ACCOUNT_WINDOW_SECONDS', '300'))
+# Addresses/usernames tracked per limiter; the least recently seen are dropped
+LOGIN_THROTTLE_MAX_KEYS = 100000
+
+# Checked in this order when a username exists in several tables
+LOGIN_ROLES = ['lecturer', 'admin', 'student']
+
+LOGIN_LOOKUP_SQL = """
+    SELECT 'lecturer' AS role, lecturer_id AS user_id, full_name, NULL AS first_name, password AS credential
+    FROM Lecturers WHERE email = %(username)s
+    UNION ALL
+    SELECT 'admin', admin_id, full_name, NULL, password
+    FROM Administrators WHERE email = %(username)s
+    UNION ALL
+    SELECT 'student', student_id, NULL, first_name, password_hash
+    FROM students WHERE student_id = %(username)s
+    UNION ALL
+    SELECT 'student', student_id, NULL, first_name, password_hash
+    FROM students WHERE email = %(username)s
+"""
+
+
+def find_account(cursor, username):
+    """Return the account dict (role, user_id, full_name, first_name, credential) or None."""
+    cursor.execute(LOGIN_LOOKUP_SQL, {'username': username})
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    if not isinstance(rows[0], dict):
+        rows = [dict(zip(('role', 'user_id', 'full_name', 'first_name', 'credential'), row)) for row in rows]
+    return min(rows, key=lambda row: LOGIN_ROLES.index(row['role']))
+
+
+ACCOUNT_EXISTS_SQL = {
+    'lecturer': "SELECT 1 FROM Lecturers WHERE lecturer_id = %s",
+    'admin': "SELECT 1 FROM Administrators WHERE admin_id = %s",
+    'student': "SELECT 1 FROM students WHERE student_id = %s",
+}
+
+
+def account_exists(cursor, role, user_id):
+    cursor.execute(ACCOUNT_EXISTS_SQL[role], (user_id,))
+    return cursor.fetchone() is not None
+
+
+def verify_password(stored, password, hasher=None):
+    # Older rows hold plain-text passwords; hashed ones go through werkzeug
+    if not stored:
+        return False
+    stored = str(stored)
+    if hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8')):
+        return True
+    # werkzeug hashes look like "method$salt$hash"; anything else cannot match
+    if stored.count('$') < 2:
+        return False
+    return hasher.verify(stored, password) if hasher is not None else check_password_hash(stored, password)
+
+
+class HashingBusy(Exception):
+    """The password hash queue is full or a hash timed out."""
+
+
+class PasswordHasher:
+    """Bounded process pool for werkzeug password hashing and verification."""
+
+    def __init__(self, workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING, timeout=HASH_TIMEOUT_SECONDS):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.completed = 0
+        self._executor = None
+        self._lock = threading.Lock()
+        self.latency = Histogram('password_hash_seconds', 'Password hash time including queueing, by operation.',
+                                 LATENCY_BUCKETS, ('operation',))
+        self.rejected = Counter('password_hash_rejected_total', 'Hashes refused because the pool was saturated.',
+                                ('operation', 'reason'))
+        self.queue_depth = Gauge('password_hash_pending', 'Password hashes queued or running.', lambda: self.pending)
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The parent's worker processes are not ours to use
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0
+
+    def metrics(self):
+        return self.latency, self.rejected, self.queue_depth
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _run(self, operation, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected.inc((operation, 'queue_full'))
+                raise HashingBusy('Too many password checks in progress, try again shortly.')
+            self.pending += 1
+        start = time.perf_counter()
+        try:
+            if not self.workers:
+                return fn(*args)
+            executor = self._pool()
+            future = executor.submit(fn, *args)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                self.rejected.inc((operation, 'timeout'))
+                raise HashingBusy('Password check timed out, try again shortly.')
+            except BrokenProcessPool:
+                logger.error("Password hash pool broke; starting a new one")
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+            self.latency.observe((operation,), elapsed)
+
+    def verify(self, stored, password):
+        return self._run('verify', check_password_hash, stored, password)
+
+    def generate(self, password):
+        return self._run('generate', generate_password_hash, password)
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'completed': self.completed,
+        }
+
+
+class RateLimiter:
+    """Sliding-window attempt counter per key, bounded to ``max_keys`` keys."""
+
+    def __init__(self, limit, window, max_keys=LOGIN_THROTTLE_MAX_KEYS):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._attempts = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        """Record an attempt; returns 0 if allowed, else seconds until the next one is."""
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if attempts is None:
+                attempts = self._attempts[key] = collections.deque()
+                while len(self._attempts) > self.max_keys:
+                    self._attempts.popitem(last=False)
+            self._attempts.move_to_end(key)
+            while attempts and attempts[0] <= now - self.window:
+                attempts.popleft()
+            if len(attempts) >= self.limit:
+                return attempts[0] + self.window - now
+            attempts.append(now)
+            return 0
+
+    def __len__(self):
+        return len(self._attempts)
+
+
+class LoginThrottle:
+    """Per-address and per-username limits on logins that need a database lookup and hash."""
+
+    def __init__(self, ip_limit=LOGIN_IP_LIMIT, ip_window=LOGIN_IP_WINDOW_SECONDS,
+                 account_limit=LOGIN_ACCOUNT_LIMIT, account_window=LOGIN_ACCOUNT_WINDOW_SECONDS):
+        self.by_ip = RateLimiter(ip_limit, ip_window)
+        self.by_account = RateLimiter(account_limit, account_window)
+        self.limited = Counter('login_rate_limited_total', 'Logins refused by the rate limiter.', ('scope',))
+
+    def check(self, ip, username):
+        """Count a login attempt; returns 0 if allowed, else the Retry-After in seconds."""
+        retry_after = self.by_ip.hit(ip)
+        if retry_after:
+            self.limited.inc(('ip',))
+            return retry_after
+        retry_after = self.by_account.hit(username.strip().lower())
+        if retry_after:
+            self.limited.inc(('account',))
+        return retry_after
+
+    def stats(self):
+        return {
+            'ip_limit': f'{self.by_ip.limit}/{self.by_ip.window:g}s',
+            'account_limit': f'{self.by_account.limit}/{self.by_account.window:g}s',
+            'tracked_ips': len(self.by_ip),
+            'tracked_accounts': len(self.by_account),
+        }
+
+
+def public_account(account):
+    """The account without its credential, as returned to clients and kept in tokens."""
+    return {key: account[key] for key in ('role', 'user_id', 'full_name', 'first_name')}
+
+
+class SessionManager:
+    def __init__(self, secret=SESSION_SECRET, session_ttl=SESSION_TTL_SECONDS,
+                 login_cache_ttl=LOGIN_CACHE_TTL_SECONDS, login_cache_size=LOGIN_CACHE_MAX_ENTRIES,
+                 account_check_seconds=SESSION_ACCOUNT_CHECK_SECONDS):
+        if not secret:
+            logger.warning("SESSION_SECRET is not set; session tokens are only valid in this process")
+            secret = secrets.token_hex(32)
+        self._serializer = URLSafeTimedSerializer(secret, salt='session')
+        self._cache_key = secrets.token_bytes(32)
+        self.session_ttl = session_ttl
+        self.login_cache_ttl = login_cache_ttl
+        self.account_check_seconds = account_check_seconds
+        self._logins = LRUBackend(login_cache_size)
+        self._revoked = LRUBackend(login_cache_size)
+        # 'role:user_id' -> time.time() of forget_user; older logins and tokens are refused
+        self._forgotten = LRUBackend(login_cache_size)
+        # 'role:user_id' -> True while the account was recently found in the database
+        self._confirmed = LRUBackend(login_cache_size)
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _login_key(self, username, password):
+        return hmac.new(self._cache_key, f'{username}\0{password}'.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    @staticmethod
+    def _user_key(role, user_id):
+        return f'{role}:{user_id}'
+
+    def _forgotten_since(self, account, issued_at):
+        forgotten_at = self._forgotten.get(self._user_key(account['role'], account['user_id']))
+        return forgotten_at is not None and forgotten_at >= issued_at
+
+    def cached_login(self, username, password):
+        """The public account of a login verified within the cache TTL, or None."""
+        entry = self._logins.get(self._login_key(username, password))
+        if entry is not None and self._forgotten_since(*entry):
+            entry = None
+        if entry is None:
+            self.cache_misses += 1
+            return None
+        self.cache_hits += 1
+        return entry[0]
+
+    def remember_login(self, username, password, account):
+        self._logins.set(self._login_key(username, password), (account, time.time()), self.login_cache_ttl)
+
+    def forget_user(self, role, user_id):
+        """Drop cached logins of an account and reject the tokens issued to it so far."""
+        key = self._user_key(role, user_id)
+        self._forgotten.set(key, time.time(), max(self.session_ttl, self.login_cache_ttl))
+        self._confirmed.set(key, None, 0)
+
+    def issue(self, account):
+        return self._serializer.dumps(account)
+
+    def verify(self, token, exists=None):
+        """
+        The account a token was issued for, or None if it is invalid, expired,
+        revoked or issued before ``forget_user``.
+
+        With ``exists(account)``, the account is looked up again once it has gone
+        ``account_check_seconds`` unconfirmed, and forgotten if it is gone. If the
+        lookup raises, the token is accepted and checked again on the next call.
+        """
+        if not token or self._revoked.get(token) is not None:
+            return None
+        try:
+            account, issued_at = self._serializer.loads(token, max_age=self.session_ttl, return_timestamp=True)
+        except (SignatureExpired, BadSignature):
+            return None
+        # Token timestamps are whole seconds, so one issued in the same second is refused too
+        if self._forgotten_since(account, issued_at.timestamp()):
+            return None
+        key = self._user_key(account['role'], account['user_id'])
+        if exists is not None and self._confirmed.get(key) is None:
+            try:
+                found = exists(account)
+            except Exception as e:
+                logger.warning(f"Session account check failed: {e}")
+                return account
+            if not found:
+                self.forget_user(account['role'], account['user_id'])
+                return None
+            self._confirmed.set(key, True, self.account_check_seconds)
+        return account
+
+    def revoke(self, token):
+        self._revoked.set(token, True, self.session_ttl)
+
+    def stats(self):
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            'cached_logins': len(self._logins),
+            'login_cache_hits': self.cache_hits,
+            'login_cache_misses': self.cache_misses,
+            'login_cache_hit_rate': round(self.cache_hits / lookups, 4) if lookups else None,
+            'session_ttl_seconds': self.session_ttl,
+        }
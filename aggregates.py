@@ -0,0 +1,246 @@
+"""
+Running performance aggregates per student, plus the class trend rollups.
+
+performance_aggregates holds the sum of a student's performance percentages and
+the number of records. Performance writes adjust it by delta in the same
+transaction, reading only the rows being written, so a student's average is
+``percentage_sum / record_count`` without re-reading their performance history.
+The same deltas keep performance_rollup (per subject, semester, academic year
+and day) current; attendance_rollup holds the attendance sum per course.
+
+The reconciliation job recomputes the aggregates from the performance table in
+bulk, reports students whose stored values drifted, and repairs them along with
+the rollups:
+
+    python aggregates.py --reconcile [--dry-run]
+"""
+import argparse
+import logging
+
+import pandas as pd
+
+from db import chunked, placeholders
+
+logger = logging.getLogger(__name__)
+
+# Percentages are computed in double precision on the server so the deltas and
+# the reconciliation agree (DECIMAL division would round to 4 places).
+PERCENTAGE_SQL = "mark * 100e0 / max_mark"
+
+# Sums are floating point; differences below this are rounding, not drift
+DRIFT_TOLERANCE = 1e-6
+
+# Rollup key columns; NULLs map to fixed values because they are part of the primary key
+UNDATED_DAY = '1000-01-01'
+ROLLUP_KEY_SQL = (f"COALESCE(subject_code, ''), COALESCE(semester, ''), COALESCE(academic_year, 0), "
+                  f"COALESCE(assessment_date, '{UNDATED_DAY}')")
+DELTA_UPSERT = """
+    ON DUPLICATE KEY UPDATE
+        percentage_sum = percentage_sum + VALUES(percentage_sum),
+        record_count = record_count + VALUES(record_count)
+"""
+
+
+def _apply_delta(cursor, sign, where, params):
+    cursor.execute(f"""
+        INSERT INTO performance_aggregates (student_id, percentage_sum, record_count)
+        SELECT student_id, {sign} * SUM({PERCENTAGE_SQL}), {sign} * COUNT(*)
+        FROM performance
+        WHERE {where}
+        GROUP BY student_id
+        {DELTA_UPSERT}
+    """, params)
+    cursor.execute(f"""
+        INSERT INTO performance_rollup (subject_code, semester, academic_year, day, percentage_sum, record_count)
+        SELECT {ROLLUP_KEY_SQL}, {sign} * SUM({PERCENTAGE_SQL}), {sign} * COUNT(*)
+        FROM performance
+        WHERE {where}
+        GROUP BY {ROLLUP_KEY_SQL}
+        {DELTA_UPSERT}
+    """, params)
+
+
+def add_to_aggregates(cursor, where, params):
+    """Add the performance rows matching ``where`` (call after INSERT/UPDATE)."""
+    _apply_delta(cursor, 1, where, params)
+
+
+def subtract_from_aggregates(cursor, where, params):
+    """Remove the performance rows matching ``where`` (call before UPDATE/DELETE)."""
+    _apply_delta(cursor, -1, where, params)
+
+
+def add_rows_to_rollup(cursor, rows):
+    """
+    Add inserted performance rows to performance_rollup.
+
+    ``rows`` are ``(subject_code, semester, academic_year, day, mark, max_mark)``;
+    bulk loads use this because their rows cannot be addressed by ID.
+    """
+    totals = {}
+    for subject_code, semester, academic_year, day, mark, max_mark in rows:
+        key = (subject_code or '', semester or '', academic_year or 0, day or UNDATED_DAY)
+        percentage_sum, record_count = totals.get(key, (0.0, 0))
+        totals[key] = (percentage_sum + float(mark) * 100 / float(max_mark), record_count + 1)
+    if totals:
+        cursor.executemany(f"""
+            INSERT INTO performance_rollup (subject_code, semester, academic_year, day, percentage_sum, record_count)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            {DELTA_UPSERT}
+        """, [key + value for key, value in totals.items()])
+
+
+def _apply_attendance_delta(cursor, sign, where, params):
+    cursor.execute(f"""
+        INSERT INTO attendance_rollup (course_id, percentage_sum, record_count)
+        SELECT course_id, {sign} * SUM(attendance_percentage), {sign} * COUNT(*)
+        FROM attendance
+        WHERE {where}
+        GROUP BY course_id
+        {DELTA_UPSERT}
+    """, params)
+
+
+def add_attendance_to_rollup(cursor, where, params):
+    """Add the attendance rows matching ``where`` (call after INSERT/UPDATE)."""
+    _apply_attendance_delta(cursor, 1, where, params)
+
+
+def subtract_attendance_from_rollup(cursor, where, params):
+    """Remove the attendance rows matching ``where`` (call before UPDATE/DELETE)."""
+    _apply_attendance_delta(cursor, -1, where, params)
+
+
+def refresh_aggregates(cursor, student_ids):
+    """
+    Recompute the aggregates of the given students from their performance rows.
+
+    Used by bulk loads, where the inserted rows cannot be addressed by ID.
+    """
+    student_ids = list(dict.fromkeys(str(sid) for sid in student_ids))
+    for chunk in chunked(student_ids):
+        cursor.execute(f"""
+            INSERT INTO performance_aggregates (student_id, percentage_sum, record_count)
+            SELECT student_id, SUM({PERCENTAGE_SQL}), COUNT(*)
+            FROM performance
+            WHERE student_id IN ({placeholders(len(chunk))})
+            GROUP BY student_id
+            ON DUPLICATE KEY UPDATE
+                percentage_sum = VALUES(percentage_sum),
+                record_count = VALUES(record_count)
+        """, chunk)
+    return len(student_ids)
+
+
+def delete_aggregates(cursor, student_id):
+    cursor.execute("DELETE FROM performance_aggregates WHERE student_id = %s", (student_id,))
+
+
+def reconcile_aggregates(cursor, repair=True):
+    """
+    Compare stored aggregates with a bulk recomputation from performance.
+
+    Returns a report with the number of students checked and the drifted rows.
+    With ``repair`` the table and the rollups are rewritten from their source
+    tables; the caller commits.
+    """
+    cursor.execute(f"""
+        SELECT student_id, SUM({PERCENTAGE_SQL}), COUNT(*)
+        FROM performance
+        GROUP BY student_id
+    """)
+    actual = pd.DataFrame(cursor.fetchall(), columns=['student_id', 'actual_sum', 'actual_count'])
+    cursor.execute("SELECT student_id, percentage_sum, record_count FROM performance_aggregates")
+    stored = pd.DataFrame(cursor.fetchall(), columns=['student_id', 'stored_sum', 'stored_count'])
+
+    merged = actual.merge(stored, on='student_id', how='outer')
+    merged[['actual_sum', 'stored_sum']] = merged[['actual_sum', 'stored_sum']].astype(float).fillna(0.0)
+    merged[['actual_count', 'stored_count']] = merged[['actual_count', 'stored_count']].fillna(0).astype(int)
+    drifted = merged[
+        (merged['actual_count'] != merged['stored_count'])
+        | ((merged['actual_sum'] - merged['stored_sum']).abs() > DRIFT_TOLERANCE)
+    ]
+
+    if repair:
+        cursor.execute("DELETE FROM performance_aggregates")
+        cursor.execute(f"""
+            INSERT INTO performance_aggregates (student_id, percentage_sum, record_count)
+            SELECT student_id, SUM({PERCENTAGE_SQL}), COUNT(*)
+            FROM performance
+            GROUP BY student_id
+        """)
+        rebuild_rollups(cursor)
+
+    report = {
+        'students_checked': int(len(merged)),
+        'drifted': int(len(drifted)),
+        'repaired': bool(repair),
+        'drifted_students': drifted.to_dict(orient='records'),
+    }
+    if len(drifted):
+        logger.warning(f"Performance aggregates drifted for {len(drifted)} of {len(merged)} students")
+    return report
+
+
+def rebuild_rollups(cursor):
+    """Recompute performance_rollup and attendance_rollup from their source tables."""
+    cursor.execute("DELETE FROM performance_rollup")
+    cursor.execute(f"""
+        INSERT INTO performance_rollup (subject_code, semester, academic_year, day, percentage_sum, record_count)
+        SELECT {ROLLUP_KEY_SQL}, SUM({PERCENTAGE_SQL}), COUNT(*)
+        FROM performance
+        GROUP BY {ROLLUP_KEY_SQL}
+    """)
+    cursor.execute("DELETE FROM attendance_rollup")
+    cursor.execute("""
+        INSERT INTO attendance_rollup (course_id, percentage_sum, record_count)
+        SELECT course_id, SUM(attendance_percentage), COUNT(*)
+        FROM attendance
+        GROUP BY course_id
+    """)
+
+
+def ensure_aggregates(cursor):
+    """Build the aggregates and rollups on first start, when they are empty but their sources are not."""
+    cursor.execute("""
+        SELECT EXISTS (SELECT 1 FROM performance), EXISTS (SELECT 1 FROM performance_aggregates),
+               EXISTS (SELECT 1 FROM attendance),
+               EXISTS (SELECT 1 FROM performance_rollup), EXISTS (SELECT 1 FROM attendance_rollup)
+    """)
+    has_performance, has_aggregates, has_attendance, has_rollup, has_attendance_rollup = cursor.fetchone()
+    if has_performance and not has_aggregates:
+        logger.info("performance_aggregates is empty; building it from performance")
+        reconcile_aggregates(cursor, repair=True)
+        return True
+    if (has_performance and not has_rollup) or (has_attendance and not has_attendance_rollup):
+        logger.info("Class trend rollups are empty; building them")
+        rebuild_rollups(cursor)
+        return True
+    return False
+
+
+def main():
+    from db import apply_schema, db_cursor
+
+    parser = argparse.ArgumentParser(description='Maintain the performance_aggregates table.')
+    parser.add_argument('--reconcile', action='store_true', help='Recompute aggregates and report drift')
+    parser.add_argument('--dry-run', action='store_true', help='Report drift without repairing it')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    apply_schema()
+    with db_cursor() as (conn, cursor):
+        if args.reconcile:
+            report = reconcile_aggregates(cursor, repair=not args.dry_run)
+            for row in report['drifted_students']:
+                logger.info(f"Drift for {row['student_id']}: stored {row['stored_sum']:.4f}/{row['stored_count']}, "
+                            f"actual {row['actual_sum']:.4f}/{row['actual_count']}")
+            logger.info(f"Checked {report['students_checked']} students, {report['drifted']} drifted"
+                        f"{', repaired' if report['repaired'] else ''}")
+        else:
+            ensure_aggregates(cursor)
+        conn.commit()
+
+
+if __name__ == '__main__':
+    main()
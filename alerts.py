@@ -0,0 +1,374 @@
+"""
+Queued email alerts: risk alerts, cohort alerts and notification emails.
+
+Alerts are written to a local SQLite outbox (one row per recipient) and the
+request returns at once. A background worker claims due rows in batches, sends
+each batch over one SMTP connection and records the outcome in the outbox, so
+alerts queued before a restart are still delivered.
+
+* Failed sends are retried with exponential backoff (ALERT_RETRY_BASE_SECONDS,
+  doubling up to ALERT_RETRY_MAX_SECONDS) and marked failed after
+  ALERT_MAX_ATTEMPTS; a recipient the server refuses fails immediately.
+* Each recipient gets at most ALERT_RATE_LIMIT messages per
+  ALERT_RATE_WINDOW_SECONDS; messages over the limit wait for the window.
+* Claimed rows are leased for ALERT_LEASE_SECONDS, so several server processes
+  can share one outbox and rows held by a crashed process are picked up again.
+
+SMTP settings use the Flask-Mail names (MAIL_SERVER, MAIL_PORT, MAIL_USERNAME,
+MAIL_PASSWORD, MAIL_USE_TLS, MAIL_DEFAULT_SENDER); TO_MAIL receives a copy of
+every risk alert. Without MAIL_SERVER messages are logged instead of sent.
+
+Pending alerts can also be sent from the command line:
+
+    python alerts.py --drain
+"""
+import argparse
+import contextlib
+import logging
+import os
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+from email.message import EmailMessage
+
+logger = logging.getLogger(__name__)
+
+ALERT_OUTBOX_PATH = os.getenv('ALERT_OUTBOX_PATH', 'alert_outbox.sqlite3')
+ALERT_BATCH_SIZE = int(os.getenv('ALERT_BATCH_SIZE', '50'))
+ALERT_POLL_SECONDS = float(os.getenv('ALERT_POLL_SECONDS', '5'))
+ALERT_LEASE_SECONDS = float(os.getenv('ALERT_LEASE_SECONDS', '300'))
+ALERT_MAX_ATTEMPTS = int(os.getenv('ALERT_MAX_ATTEMPTS', '6'))
+ALERT_RETRY_BASE_SECONDS = float(os.getenv('ALERT_RETRY_BASE_SECONDS', '30'))
+ALERT_RETRY_MAX_SECONDS = float(os.getenv('ALERT_RETRY_MAX_SECONDS', '3600'))
+ALERT_RATE_LIMIT = int(os.getenv('ALERT_RATE_LIMIT', '5'))
+ALERT_RATE_WINDOW_SECONDS = float(os.getenv('ALERT_RATE_WINDOW_SECONDS', '3600'))
+
+MAIL_SERVER = os.getenv('MAIL_SERVER')
+MAIL_PORT = int(os.getenv('MAIL_PORT', '587'))
+MAIL_USERNAME = os.getenv('MAIL_USERNAME')
+MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
+MAIL_USE_TLS = os.getenv('MAIL_USE_TLS', '1') != '0'
+MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER', MAIL_USERNAME or 'alerts@unizulu.ac.za')
+TO_MAIL = os.getenv('TO_MAIL')
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_outbox_recipient ON outbox (recipient, sent_at);
+"""
+
+RISK_ALERT_BODY = """
+UNIZULU RISK ALERT SYSTEM - NEW ALERT SUBMISSION
+
+STUDENT INFORMATION:
+-------------------
+Name: {studentName}
+Email: {studentEmail}
+
+RISK ASSESSMENT:
+----------------
+Risk Level: {riskLevel}
+
+ALERT DETAILS:
+--------------
+{alertMessage}
+
+RECOMMENDATIONS & NEXT STEPS:
+-----------------------------
+{recommendations}
+
+---
+This alert was submitted through the Unizulu Risk Alert System.
+"""
+
+
+def risk_alert_messages(form_data, staff_copy=True):
+    """
+    ``(recipient, subject, body)`` for a risk alert: the student, if they have an
+    email address, and TO_MAIL unless ``staff_copy`` is False.
+    """
+    subject = f"Unizulu Risk Alert - {form_data['riskLevel']} Risk Level - {form_data['studentName']}"
+    student_email = (form_data.get('studentEmail') or '').strip()
+    body = RISK_ALERT_BODY.format(
+        studentName=form_data['studentName'],
+        studentEmail=student_email or 'Not provided',
+        riskLevel=form_data['riskLevel'],
+        alertMessage=form_data['alertMessage'],
+        recommendations=form_data.get('recommendations') or 'Not provided',
+    )
+    recipients = []
+    if '@' in student_email:
+        recipients.append(student_email)
+    if staff_copy and TO_MAIL and TO_MAIL not in recipients:
+        recipients.append(TO_MAIL)
+    return [(recipient, subject, body) for recipient in recipients]
+
+
+def cohort_digest_message(risk_levels, students, alert_message):
+    """One summary for TO_MAIL instead of a staff copy per student of a cohort alert."""
+    lines = [f"{s['student_id']}  {s['first_name']} {s['last_name']}  {s['risk_level']}  "
+             f"{s.get('email') or 'no email'}" for s in students]
+    body = (f"A risk alert was sent to {len(students)} students at risk level {', '.join(risk_levels)}.\n\n"
+            f"{alert_message}\n\nSTUDENTS:\n" + '\n'.join(lines) + '\n')
+    return TO_MAIL, f"Unizulu Risk Alert - Cohort ({', '.join(risk_levels)}) - {len(students)} students", body
+
+
+class LogTransport:
+    """Stands in for SMTP when MAIL_SERVER is not configured."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def send(self, recipient, subject, body):
+        logger.info(f"Alert to {recipient} (MAIL_SERVER not set, not sent): {subject}")
+
+
+class SMTPTransport:
+    """One SMTP connection, opened on enter and reused for every message of a batch."""
+
+    def __init__(self, host=MAIL_SERVER, port=MAIL_PORT, username=MAIL_USERNAME, password=MAIL_PASSWORD,
+                 use_tls=MAIL_USE_TLS, sender=MAIL_DEFAULT_SENDER, timeout=30):
+        self.host, self.port = host, port
+        self.username, self.password = username, password
+        self.use_tls = use_tls
+        self.sender = sender
+        self.timeout = timeout
+        self._smtp = None
+
+    def __enter__(self):
+        self._smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            self._smtp.starttls()
+        if self.username:
+            self._smtp.login(self.username, self.password)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self._smtp.quit()
+        except smtplib.SMTPException:
+            self._smtp.close()
+        return False
+
+    def send(self, recipient, subject, body):
+        message = EmailMessage()
+        message['Subject'] = subject
+        message['From'] = self.sender
+        message['To'] = recipient
+        message.set_content(body)
+        self._smtp.send_message(message)
+
+
+def default_transport():
+    return SMTPTransport() if MAIL_SERVER else LogTransport()
+
+
+class AlertDispatcher:
+    def __init__(self, outbox_path=ALERT_OUTBOX_PATH, transport_factory=default_transport,
+                 batch_size=ALERT_BATCH_SIZE, poll_seconds=ALERT_POLL_SECONDS):
+        self.outbox_path = outbox_path
+        self.transport_factory = transport_factory
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self.batches = 0
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # Threads do not survive fork; the child starts its own worker on demand
+        self._wake = threading.Event()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # SQLite connections are not shared between threads; opening one is cheap
+        conn = sqlite3.connect(self.outbox_path, timeout=30, isolation_level=None)
+        try:
+            if not self._schema_ready:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(OUTBOX_SCHEMA)
+                self._schema_ready = True
+            yield conn
+        finally:
+            conn.close()
+
+    # --- Producers ----------------------------------------------------------
+
+    def enqueue(self, messages):
+        """Queue ``(recipient, subject, body)`` messages in one transaction and return their ids."""
+        messages = [m for m in messages if m[0]]
+        if not messages:
+            return []
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = [conn.execute("""
+                INSERT INTO outbox (recipient, subject, body, next_attempt_at, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (recipient, subject, body, now, now)).lastrowid for recipient, subject, body in messages]
+            conn.execute("COMMIT")
+        self.start()
+        self._wake.set()
+        return ids
+
+    def enqueue_risk_alert(self, form_data):
+        return self.enqueue(risk_alert_messages(form_data))
+
+    # --- Worker -------------------------------------------------------------
+
+    def start(self):
+        """Start the background worker if it is not running (also sends alerts left from a previous run)."""
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name='alert-dispatcher', daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                while self.dispatch_once():
+                    pass
+            except Exception as e:
+                logger.error(f"Alert dispatch failed: {e}")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def _claim(self, conn, now):
+        """Lease up to batch_size due messages, postponing those over their recipient's rate limit."""
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute("""
+            SELECT id, recipient, subject, body, attempts FROM outbox
+            WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?
+            ORDER BY next_attempt_at, id
+            LIMIT ?
+        """, (now, self.batch_size)).fetchall()
+        recipients = sorted({row[1] for row in rows})
+        sent = {}
+        if recipients:
+            sent = {recipient: (count, oldest) for recipient, count, oldest in conn.execute(f"""
+                SELECT recipient, COUNT(*), MIN(sent_at) FROM outbox
+                WHERE status = 'sent' AND sent_at > ? AND recipient IN ({', '.join('?' * len(recipients))})
+                GROUP BY recipient
+            """, [now - ALERT_RATE_WINDOW_SECONDS] + recipients)}
+        claimed, postponed = [], []
+        for row in rows:
+            count, oldest = sent.get(row[1], (0, now))
+            if count >= ALERT_RATE_LIMIT:
+                postponed.append((oldest + ALERT_RATE_WINDOW_SECONDS, row[0]))
+            else:
+                sent[row[1]] = (count + 1, oldest)
+                claimed.append(row)
+        conn.executemany("UPDATE outbox SET next_attempt_at = ? WHERE id = ?", postponed)
+        conn.executemany("UPDATE outbox SET status = 'sending', next_attempt_at = ? WHERE id = ?",
+                         [(now + ALERT_LEASE_SECONDS, row[0]) for row in claimed])
+        conn.execute("COMMIT")
+        return claimed
+
+    def dispatch_once(self):
+        """Send one batch of due messages over one connection; returns how many were attempted."""
+        with self._connect() as conn:
+            now = time.time()
+            claimed = self._claim(conn, now)
+            if not claimed:
+                return 0
+            results = []
+            try:
+                with self.transport_factory() as transport:
+                    for message_id, recipient, subject, body, attempts in claimed:
+                        try:
+                            transport.send(recipient, subject, body)
+                            results.append((message_id, attempts, None, False))
+                        except smtplib.SMTPRecipientsRefused as e:
+                            results.append((message_id, attempts, e, True))
+                        except (smtplib.SMTPException, OSError) as e:
+                            results.append((message_id, attempts, e, False))
+            except (smtplib.SMTPException, OSError) as e:
+                # Connecting failed, or the connection broke after the last send
+                done = {result[0] for result in results}
+                results.extend((row[0], row[4], e, False) for row in claimed if row[0] not in done)
+            self._record(conn, results)
+            self.batches += 1
+        return len(claimed)
+
+    def _record(self, conn, results):
+        now = time.time()
+        updates = []
+        for message_id, attempts, error, permanent in results:
+            attempts += 1
+            if error is None:
+                updates.append(('sent', attempts, now, now, None, message_id))
+            elif permanent or attempts >= ALERT_MAX_ATTEMPTS:
+                updates.append(('failed', attempts, now, None, str(error), message_id))
+                logger.error(f"Alert {message_id} failed after {attempts} attempts: {error}")
+            else:
+                delay = min(ALERT_RETRY_BASE_SECONDS * 2 ** (attempts - 1), ALERT_RETRY_MAX_SECONDS)
+                updates.append(('pending', attempts, now + delay * random.uniform(0.8, 1.2), None, str(error),
+                                message_id))
+                logger.warning(f"Alert {message_id} attempt {attempts} failed, retrying in {delay:.0f}s: {error}")
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany("""
+            UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, sent_at = ?, last_error = ?
+            WHERE id = ?
+        """, updates)
+        conn.execute("COMMIT")
+
+    def drain(self):
+        """Send everything that is due now, in the calling thread; returns the number attempted."""
+        total = 0
+        while True:
+            attempted = self.dispatch_once()
+            if not attempted:
+                return total
+            total += attempted
+
+    def stats(self):
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+            oldest = conn.execute("SELECT MIN(created_at) FROM outbox WHERE status = 'pending'").fetchone()[0]
+        return {
+            'pending': counts.get('pending', 0),
+            'sending': counts.get('sending', 0),
+            'sent': counts.get('sent', 0),
+            'failed': counts.get('failed', 0),
+            'oldest_pending_seconds': round(time.time() - oldest, 1) if oldest else None,
+            'batches': self.batches,
+            'worker_alive': self._worker is not None and self._worker.is_alive(),
+            'transport': 'smtp' if MAIL_SERVER else 'log',
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send queued alerts from the outbox.')
+    parser.add_argument('--drain', action='store_true', help='Send every due alert and exit')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    dispatcher = AlertDispatcher()
+    if args.drain:
+        logger.info(f"Attempted {dispatcher.drain()} alerts")
+    logger.info(f"Outbox: {dispatcher.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,10 @@
+from alerts import AlertDispatcher
+
+# Alerts go to a persistent outbox and are sent by a background worker
+alert_dispatcher = AlertDispatcher()
+
+
 def send_risk_alert(data):
-	print('Risk alert sent:', data)
+	"""Queue a risk alert for the student and TO_MAIL; returns once it is in the outbox."""
+	alert_dispatcher.enqueue_risk_alert(data)
 	return True
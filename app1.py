@@ -1,16 +1,38 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 import mysql.connector
 import pandas as pd
-import joblib
 import datetime
 import logging
-import random
-from werkzeug.security import generate_password_hash, check_password_hash
-from sklearn.ensemble import RandomForestClassifier
+from db import db_cursor, pool_stats, chunked, placeholders, apply_schema, DatabaseUnavailable
+from model_registry import ModelRegistry, DEFAULT_MODEL_PATH
+from risk import summarize_performance, grade_for_percentage, RECOMMENDATIONS
+from inference import InferenceService, store_predictions
+from feature_store import FeatureStore
+from aggregates import (add_to_aggregates, subtract_from_aggregates, delete_aggregates, ensure_aggregates,
+                        subtract_attendance_from_rollup, UNDATED_DAY)
+from notifications import KEEPALIVE_SECONDS, NotificationBroker, NotificationFollower
+from summary import (refresh_student_summary, delete_student_summary, ensure_student_summary,
+                     fetch_students)
+from ingestion import IngestionService, csv_records, BULK_MAX_ROWS, UNKNOWN_STUDENT
+from response_cache import ResponseCache
+from search_index import StudentSearchIndex
+from recompute import RecomputeScheduler
+from alerts import AlertDispatcher, risk_alert_messages, cohort_digest_message, TO_MAIL
+from instrumentation import Instrumentation
+from performance import (fetch_performance, stream_performance, parse_performance_args,
+                         STREAM_FORMATS)
+from accounts import (SessionManager, PasswordHasher, LoginThrottle, HashingBusy, find_account, verify_password,
+                      public_account, account_exists)
+import csv
+import io
+import os
+import tempfile
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Next-After', 'X-Next-Cursor', 'X-Notification-Cursor', 'Server-Timing'])
+# Counts and times every SQL statement per request; see /metrics
+instrumentation = Instrumentation(app)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -22,143 +44,200 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-DB_CONFIG = {
-    "host": "localhost",
-    "user": "root",
-    "password": "12345",
-    "database": "Unizulu_db"
-}
-
-def get_db_connection():
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
-    except mysql.connector.Error as err:
-        logger.error(f"Error connecting to MySQL database: {err}")
-        return None
+@app.errorhandler(DatabaseUnavailable)
+def handle_database_unavailable(err):
+    logger.error(f"Database unavailable: {err}")
+    return jsonify({"error": "Database connection error"}), 500
 
 # === Machine Learning Model Setup ===
-# This section is fine, but you should only run it once to generate the model.
-# In a production environment, this part would be separate from the running app.
-student_id = [
-    '2023461840', '2023114749', '2021126242', '2021256778', '2022912401',
-    '2021824658', '2022365656', '2023736558', '2023000827', '2023629957',
-    '2023379256', '2021503071', '2022140921', '2023082152', '2021799850',
-    '2022916090', '2021098803', '2023655226', '2021551945', '2023553648',
-    '2022410504', '2021926763', '2022595898', '2022043110', '2022413944',
-    '2023059555', '2022469145', '2022439440', '2022602611', '2022316238',
-    '2022709488', '2023159479', '2023619625', '2021150598', '2022001361',
-    '2023531755', '2022984648', '2023461633', '2021284942', '2022330230',
-    '2022012162', '2022787706', '2021171493', '2021237612', '2021848723',
-    '2022863229', '2022100425', '2023197285', '2022082815'
-]
-num_students = len(student_id)
-attendance_rate = [random.uniform(20.0, 100.0) for _ in range(num_students)]
-assignment_avg = [random.uniform(30.0, 100.0) for _ in range(num_students)]
-test_score = [random.uniform(20.0, 100.0) for _ in range(num_students)]
-lms_activity = [random.uniform(10.0, 150.0) for _ in range(num_students)]
-risk_levels = ['Low', 'Medium', 'High']
-risk_level = [random.choice(risk_levels) for _ in range(num_students)]
-data = pd.DataFrame({
-    'student_id': student_id,
-    'attendance_rate': attendance_rate,
-    'assignment_avg': assignment_avg,
-    'test_score': test_score,
-    'lms_activity': lms_activity,
-    'risk_level': risk_level
-})
-X = data[['attendance_rate', 'assignment_avg', 'test_score', 'lms_activity']]
-y = data['risk_level']
-model = RandomForestClassifier()
-model.fit(X, y)
-joblib.dump(model, 'student_risk_model.pkl')
-logger.info("Machine learning model trained and saved.")
-try:
-    model = joblib.load('student_risk_model.pkl')
-    logger.info("Machine learning model loaded successfully.")
-except FileNotFoundError:
-    logger.error("Model file 'student_risk_model.pkl' not found. Please run the model training section.")
-    model = None
-
-def calculate_risk_for_student(student_id):
-    """
-    Calculate and update risk level for a student based on their performance data
+# The model is trained offline by python.py; the registry loads the saved
+# artifact lazily on first use instead of retraining on every start.
+model_registry = ModelRegistry(DEFAULT_MODEL_PATH)
+inference_service = InferenceService(model_registry)
+# Per-student feature vectors, refreshed by the write endpoints and read for scoring
+feature_store = FeatureStore()
+
+# Pushes newly created interventions/notifications to connected dashboards
+notification_broker = NotificationBroker()
+
+# Cached GET responses, invalidated by tag from the write endpoints
+response_cache = ResponseCache()
+
+# Signed session tokens and recently verified logins
+session_manager = SessionManager()
+
+# Password hashing off the request threads, and login attempt limits
+password_hasher = PasswordHasher()
+login_throttle = LoginThrottle()
+instrumentation.register(*password_hasher.metrics(), login_throttle.limited)
+
+# Student search by ID, name or program, kept current by the student write endpoints
+search_index = StudentSearchIndex()
+SEARCH_MAX_LIMIT = 200
+
+
+def reload_search_index(index=search_index):
+    with db_cursor() as (conn, cursor):
+        index.load(cursor)
+
+
+def on_ingestion_complete():
+    response_cache.invalidate_all()
+    reload_search_index()
+
+
+# Whole-population risk recomputation, run in a process pool off the request threads
+recompute_scheduler = RecomputeScheduler(model_path=model_registry.path, on_complete=response_cache.invalidate_all)
+
+# Risk alerts and notification emails are queued in a local outbox and sent in the background
+alert_dispatcher = AlertDispatcher()
+ALERT_COHORT_LEVELS = ['High', 'Very High']
+
+# Uploaded workbooks are streamed into the database by a background worker
+ingestion_service = IngestionService(inference_service, feature_store, on_complete=on_ingestion_complete)
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'unizulu_uploads'))
+
+def publish_intervention(cursor, intervention_id):
     """
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return None
-            
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get performance data for the student
-        cursor.execute("""
-            SELECT subject_code, subject_name, mark, max_mark, grade 
-            FROM performance 
-            WHERE student_id = %s
-        """, (student_id,))
-        performance_data = cursor.fetchall()
-        
-        if not performance_data:
-            # No performance data - set to "No Data"
-            risk_level = "No Data"
-            recommendation = "No performance data found for this student."
-            average_percentage = 0
-        else:
-            # Calculate average percentage
-            total_percentage = 0
-            for record in performance_data:
-                percentage = (record['mark'] / record['max_mark']) * 100
-                total_percentage += percentage
-            
-            average_percentage = total_percentage / len(performance_data)
-            
-            # Determine risk level based on average percentage
-            if average_percentage >= 75:
-                risk_level = "Low"
-                recommendation = "Student is performing excellently."
-            elif average_percentage >= 60:
-                risk_level = "Medium"
-                recommendation = "Student is performing adequately but could benefit from additional support."
-            elif average_percentage >= 50:
-                risk_level = "High"
-                recommendation = "Student is at risk of academic failure."
-            else:
-                risk_level = "Very High"
-                recommendation = "Student is in critical academic danger."
-        
-        # Update risk_predictions table
+    Publish a freshly inserted intervention in the same shape as /api/notifications rows.
+    ``cursor`` must be a dictionary cursor.
+    """
+    cursor.execute("""
+        SELECT i.*, s.first_name, s.last_name 
+        FROM interventions i 
+        JOIN students s ON i.student_id = s.student_id 
+        WHERE i.intervention_id = %s
+    """, (intervention_id,))
+    row = cursor.fetchone()
+    if row:
+        notification_broker.publish(row, row['intervention_id'])
+
+def latest_intervention_id():
+    with db_cursor() as (conn, cursor):
+        cursor.execute("SELECT COALESCE(MAX(intervention_id), 0) FROM interventions")
+        return cursor.fetchone()[0]
+
+def interventions_after(intervention_id):
+    """Interventions newer than ``intervention_id`` as ``(intervention_id, row)``, for the notification follower."""
+    with db_cursor(dictionary=True) as (conn, cursor):
         cursor.execute("""
-            INSERT INTO risk_predictions (student_id, risk_level, prediction_date, recommendation, risk_score)
-            VALUES (%s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE 
-                risk_level = VALUES(risk_level),
-                prediction_date = VALUES(prediction_date),
-                recommendation = VALUES(recommendation),
-                risk_score = VALUES(risk_score)
-        """, (student_id, risk_level, datetime.datetime.now().date(), recommendation, average_percentage))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
+            SELECT i.*, s.first_name, s.last_name
+            FROM interventions i
+            JOIN students s ON i.student_id = s.student_id
+            WHERE i.intervention_id > %s
+            ORDER BY i.intervention_id
+            LIMIT 500
+        """, (intervention_id,))
+        return [(row['intervention_id'], row) for row in cursor.fetchall()]
+
+# Publishes interventions created by other worker processes
+notification_follower = NotificationFollower(notification_broker, latest_intervention_id, interventions_after)
+
+def calculate_risk_for_student(student_id, conn=None):
+    """
+    Calculate and update risk level for a student using the risk model.
+    Pass the caller's connection to avoid checking out a second one.
+    """
+    try:
+        with db_cursor(conn=conn) as (conn, cursor):
+            features = feature_store.refresh(cursor, [student_id])
+            scored = inference_service.score(features)
+            store_predictions(cursor, scored)
+            refresh_student_summary(cursor, [student_id])
+            conn.commit()
+        
+        result = scored.iloc[0]
         return {
-            "risk_level": risk_level,
-            "average_percentage": round(average_percentage, 2),
-            "recommendation": recommendation
+            "risk_level": result['risk_level'],
+            "risk_score": float(result['risk_score']),
+            "average_percentage": float(result['average_percentage']),
+            "recommendation": result['recommendation'],
+            "scored_by": result['scored_by']
         }
         
     except Exception as e:
         logger.error(f"Error calculating risk for student {student_id}: {e}")
         return None
 
+def with_risk_update(response, risk_result):
+    """Add the recalculated risk level to a write endpoint's response."""
+    if risk_result:
+        response["risk_update"] = f"Risk level updated to: {risk_result['risk_level']}"
+    return response
+
 @app.route('/')
 def home():
     return 'Welcome to the Student Academic Risk Prediction & Intervention Platform'
 
+# === MODEL INFO ENDPOINT ===
+@app.route('/api/model', methods=['GET'])
+def model_info():
+    """
+    Report the loaded model version and how long it took to load
+    """
+    model_registry.get()
+    info = model_registry.info()
+    info["inference"] = inference_service.stats()
+    info["feature_store"] = feature_store.stats()
+    info["search_index"] = search_index.stats()
+    return jsonify(info), 200
+
+# === DATABASE POOL METRICS ENDPOINT ===
+@app.route('/api/db/pool', methods=['GET'])
+def db_pool_info():
+    """
+    Report connection pool usage and wait times
+    """
+    return jsonify(pool_stats()), 200
+
+# === RESPONSE CACHE METRICS ENDPOINT ===
+@app.route('/api/cache', methods=['GET'])
+def cache_info():
+    """
+    Report response cache hit rates per endpoint and the login cache
+    """
+    stats = response_cache.stats()
+    stats['sessions'] = session_manager.stats()
+    stats['password_hashing'] = password_hasher.stats()
+    stats['login_throttle'] = login_throttle.stats()
+    return jsonify(stats), 200
+
+# === PROMETHEUS METRICS ENDPOINT ===
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Per-route request latency, SQL statements and SQL time, password hash queue
+    depth and latency, in the Prometheus text format
+    """
+    return Response(instrumentation.render(), mimetype='text/plain; version=0.0.4')
+
 # === LOGIN ENDPOINT ===
+def login_response(account):
+    response = {
+        'message': 'Login successful',
+        'user_id': account['user_id'],
+        'role': account['role'],
+        'token': session_manager.issue(account),
+        'expires_in': session_manager.session_ttl
+    }
+    if account['role'] == 'student':
+        response['first_name'] = account['first_name']
+    else:
+        response['full_name'] = account['full_name']
+    return response
+
+def request_token():
+    auth = request.headers.get('Authorization', '')
+    return auth[7:] if auth.startswith('Bearer ') else request.args.get('token')
+
 @app.route('/api/login', methods=['POST'])
 def api_login():
+    """
+    Resolve the user's role and password hash in one query and return a session
+    token. Logins verified in the last few minutes skip the database and the hash;
+    the rest are rate limited per client address and username, and the hash is
+    checked in the password hashing pool.
+    """
     data = request.json
     username = data.get('username')
     password = data.get('password')
@@ -166,247 +245,303 @@ def api_login():
     if not username or not password:
         return jsonify({'message': 'Email/username and password required.'}), 400
 
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'message': 'Database connection error.'}), 500
-
-    cursor = conn.cursor(dictionary=True)
-    user = None
-    role = None
-    password_column = None
-
     try:
-        # Check Lecturers table
-        cursor.execute("SELECT * FROM Lecturers WHERE email = %s", (username,))
-        lecturer = cursor.fetchone()
-        if lecturer:
-            user = lecturer
-            role = 'lecturer'
-            password_column = 'password'
-
-        # If not found, check Admin table
-        if not user:
-            cursor.execute("SELECT * FROM Administrators WHERE email = %s", (username,))
-            admin = cursor.fetchone()
-            if admin:
-                user = admin
-                role = 'admin'
-                password_column = 'password'
-
-        # If not found, check Students table
-        if not user:
-            cursor.execute("SELECT * FROM students WHERE student_id = %s OR email = %s", (username, username))
-            student = cursor.fetchone()
-            if student:
-                user = student
-                role = 'student'
-                password_column = 'password_hash'
-
-        # Check password
-        if user:
-            stored_password = user.get(password_column)
-            if stored_password and (stored_password == password or check_password_hash(stored_password, password)):
-                if role == 'student':
-                    return jsonify({
-                        'message': 'Login successful',
-                        'user_id': user['student_id'],
-                        'first_name': user['first_name'],
-                        'role': role
-                    })
-                else:
-                    return jsonify({
-                        'message': 'Login successful',
-                        'user_id': user.get('lecturer_id') or user.get('admin_id'),
-                        'full_name': user.get('full_name'),
-                        'role': role
-                    })
-            else:
+        account = session_manager.cached_login(username, password)
+        if account is None:
+            retry_after = login_throttle.check(request.remote_addr or 'unknown', username)
+            if retry_after:
+                response = jsonify({'message': 'Too many login attempts, try again later.'})
+                response.headers['Retry-After'] = str(max(1, int(retry_after + 0.5)))
+                return response, 429
+            with db_cursor(dictionary=True) as (conn, cursor):
+                found = find_account(cursor, username)
+            if not found or not verify_password(found['credential'], password, password_hasher):
                 return jsonify({'message': 'Invalid credentials.'}), 401
-        else:
-            return jsonify({'message': 'Invalid credentials.'}), 401
+            account = public_account(found)
+            session_manager.remember_login(username, password, account)
+        return jsonify(login_response(account))
 
+    except HashingBusy as e:
+        response = jsonify({'message': str(e)})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    except DatabaseUnavailable:
+        return jsonify({'message': 'Database connection error.'}), 500
     except mysql.connector.Error as err:
         logger.error(f"Database error during login: {err}")
         return jsonify({'message': 'Database error occurred.'}), 500
-    except KeyError as e:
-        logger.error(f"Missing key in database result: {e}")
-        return jsonify({'message': f"Internal server error: Missing key {e} in database result."}), 500
-    finally:
-        cursor.close()
-        conn.close()
+
+def session_account_exists(account):
+    with db_cursor() as (conn, cursor):
+        return account_exists(cursor, account['role'], account['user_id'])
+
+@app.route('/api/session', methods=['GET'])
+def api_session():
+    """
+    Return the account of a session token (Authorization: Bearer <token>), so
+    dashboards need not log in again on every page. The account is looked up at
+    most once per SESSION_ACCOUNT_CHECK_SECONDS, so deleted accounts are refused.
+    """
+    account = session_manager.verify(request_token(), exists=session_account_exists)
+    if account is None:
+        return jsonify({'message': 'Session expired or invalid.'}), 401
+    return jsonify(account), 200
+
+@app.route('/api/logout', methods=['POST'])
+def api_logout():
+    token = request_token()
+    if token:
+        session_manager.revoke(token)
+    return jsonify({'message': 'Logged out'}), 200
 
 # === FIXED RISK CALCULATION ENDPOINT ===
 @app.route('/api/calculate_risk/<string:student_id>', methods=['GET'])
 def calculate_risk(student_id):
     """
-    Calculate academic risk based on performance data
+    Calculate academic risk with the risk model and store the prediction
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
+        with db_cursor(dictionary=True) as (conn, cursor):
+            # Check if student exists
+            cursor.execute("SELECT student_id, first_name, last_name FROM students WHERE student_id = %s", (student_id,))
+            student = cursor.fetchone()
             
-        cursor = conn.cursor(dictionary=True)
-        
-        # Check if student exists
-        cursor.execute("SELECT student_id, first_name, last_name FROM students WHERE student_id = %s", (student_id,))
-        student = cursor.fetchone()
-        
-        if not student:
-            return jsonify({"error": "Student not found."}), 404
+            if not student:
+                return jsonify({"error": "Student not found."}), 404
 
-        # Get performance data for the student
-        cursor.execute("""
-            SELECT subject_code, subject_name, mark, max_mark, grade 
-            FROM performance 
-            WHERE student_id = %s
-        """, (student_id,))
-        performance_data = cursor.fetchall()
-        
-        if not performance_data:
-            return jsonify({
-                "student_id": student_id,
-                "first_name": student['first_name'],
-                "last_name": student['last_name'],
-                "risk_level": "No Data",
-                "recommendation": "No performance data found for this student. Please add performance records to assess risk.",
-                "average_percentage": 0,
-                "performance_count": 0
-            })
+            # Get performance data for the student
+            cursor.execute("""
+                SELECT subject_code, subject_name, mark, max_mark, grade 
+                FROM performance 
+                WHERE student_id = %s
+            """, (student_id,))
+            performance_data = cursor.fetchall()
 
-        # Calculate average percentage
-        total_percentage = 0
-        for record in performance_data:
-            percentage = (record['mark'] / record['max_mark']) * 100
-            total_percentage += percentage
-        
-        average_percentage = total_percentage / len(performance_data)
-        
-        # Determine risk level based on average percentage
-        if average_percentage >= 75:
-            risk_level = "Low"
-            recommendation = "Student is performing excellently. Continue current support and consider advanced opportunities."
-        elif average_percentage >= 60:
-            risk_level = "Medium"
-            recommendation = "Student is performing adequately but could benefit from additional support and monitoring."
-        elif average_percentage >= 50:
-            risk_level = "High"
-            recommendation = "Student is at risk of academic failure. Implement immediate intervention strategies."
-        else:
-            risk_level = "Very High"
-            recommendation = "Student is in critical academic danger. Urgent and comprehensive intervention required."
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({
+            # Score with the model and keep risk_predictions in step
+            scored = inference_service.score(feature_store.get_features([student_id], cursor))
+            store_predictions(cursor, scored)
+            refresh_student_summary(cursor, [student_id])
+            conn.commit()
+            response_cache.invalidate_students([student_id], 'students', 'class_trends')
+        
+        result = scored.iloc[0]
+        risk_level = result['risk_level']
+        response = {
             "student_id": student_id,
             "first_name": student['first_name'],
             "last_name": student['last_name'],
             "risk_level": risk_level,
-            "recommendation": recommendation,
-            "average_percentage": round(average_percentage, 2),
-            "performance_count": len(performance_data),
-            "performance_data": performance_data
-        })
+            "risk_score": float(result['risk_score']),
+            "scored_by": result['scored_by'],
+            "model_version": model_registry.version,
+            "recommendation": RECOMMENDATIONS[risk_level],
+            "average_percentage": float(result['average_percentage']),
+            "performance_count": len(performance_data)
+        }
+        if performance_data:
+            response["performance_data"] = performance_data
+        
+        return jsonify(response)
         
     except Exception as e:
         logger.error(f"Error calculating risk for student {student_id}: {e}")
         return jsonify({"error": "Failed to calculate risk"}), 500
 
+# === BATCH RISK CALCULATION ENDPOINT ===
+@app.route('/api/calculate_risk/batch', methods=['POST'])
+def calculate_risk_batch():
+    """
+    Calculate academic risk for many students in one request.
+
+    Body: {"student_ids": [...]} and/or {"program": "...", "module": "<subject_code>"}.
+    Performance rows for all selected students are fetched with one query per
+    chunk of IDs and averaged with pandas. The cohort is scored with one model
+    call and stored. Risk always comes from the student's overall features, and
+    average_percentage is the overall average it was scored from. With a module
+    filter, module_average_percentage and module_performance_count cover that
+    module only (and performance_count is left out).
+    """
+    data = request.get_json(silent=True) or {}
+    student_ids = data.get('student_ids')
+    program = data.get('program')
+    module = data.get('module')
+
+    if student_ids is not None and not isinstance(student_ids, list):
+        return jsonify({"error": "student_ids must be a list"}), 400
+    if not student_ids and not program and not module:
+        return jsonify({"error": "Provide student_ids, program or module"}), 400
+    student_ids = list(dict.fromkeys(str(sid) for sid in student_ids or []))
+
+    try:
+        # Module filter applies to the joined performance rows and to the cohort
+        join_filter = " AND p.subject_code = %s" if module else ""
+        conditions = []
+        params = []
+        if program:
+            conditions.append("s.program = %s")
+            params.append(program)
+        if module and not student_ids:
+            conditions.append("EXISTS (SELECT 1 FROM performance m WHERE m.student_id = s.student_id AND m.subject_code = %s)")
+            params.append(module)
+
+        query = f"""
+            SELECT s.student_id, s.first_name, s.last_name, p.mark, p.max_mark
+            FROM students s
+            LEFT JOIN performance p ON p.student_id = s.student_id{join_filter}
+            WHERE {{where}}
+        """
+        join_params = [module] if module else []
+
+        rows = []
+        with db_cursor(dictionary=True) as (conn, cursor):
+            if student_ids:
+                for chunk in chunked(student_ids):
+                    where = " AND ".join(conditions + [f"s.student_id IN ({placeholders(len(chunk))})"])
+                    cursor.execute(query.format(where=where), join_params + params + chunk)
+                    rows.extend(cursor.fetchall())
+            else:
+                cursor.execute(query.format(where=" AND ".join(conditions)), join_params + params)
+                rows = cursor.fetchall()
+
+            frame = pd.DataFrame(rows, columns=['student_id', 'first_name', 'last_name', 'mark', 'max_mark'])
+            frame['student_id'] = frame['student_id'].astype(str)
+            students = frame.drop_duplicates('student_id')[['student_id', 'first_name', 'last_name']].set_index('student_id')
+            students = students.join(summarize_performance(frame))
+
+            # One feature pull and one predict_proba call for the whole cohort
+            scored = inference_service.score(feature_store.get_features(students.index.tolist(), cursor))
+            store_predictions(cursor, scored)
+            refresh_student_summary(cursor, students.index.tolist())
+            conn.commit()
+            response_cache.invalidate_students(students.index.tolist(), 'students', 'class_trends')
+
+        students['performance_count'] = students['performance_count'].fillna(0).astype(int)
+        students['average_percentage'] = students['average_percentage'].fillna(0).round(2)
+        if module:
+            students = students.rename(columns={'average_percentage': 'module_average_percentage',
+                                                'performance_count': 'module_performance_count'})
+        else:
+            students = students.drop(columns='average_percentage')
+        # The overall average the risk was scored from
+        students = students.join(scored[['average_percentage', 'risk_level', 'risk_score', 'scored_by']])
+        students['recommendation'] = students['risk_level'].map(RECOMMENDATIONS)
+
+        results = students.reset_index().to_dict(orient='records')
+        response = {
+            "count": len(results),
+            "model_version": model_registry.version,
+            "risk_distribution": students['risk_level'].value_counts().to_dict(),
+            "results": results
+        }
+        if student_ids:
+            found = set(students.index)
+            response["not_found"] = [sid for sid in student_ids if sid not in found]
+
+        return jsonify(response), 200
+
+    except Exception as e:
+        logger.error(f"Error calculating batch risk: {e}")
+        return jsonify({"error": "Failed to calculate risk"}), 500
+
+
+@app.route('/api/recompute_risk', methods=['POST'])
+def start_risk_recompute():
+    """
+    Start recomputing risk for every student in the background. Optional JSON
+    body: workers (1 to the CPU count), chunk_size (at least 1). Returns 202 with
+    the run, or the run already in progress with 409.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        run, started = recompute_scheduler.start(workers=data.get('workers'), chunk_size=data.get('chunk_size'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(run.to_dict()), 202 if started else 409
+
+@app.route('/api/recompute_risk', methods=['GET'])
+def risk_recompute_progress():
+    """Progress and throughput of the latest population recomputation."""
+    if recompute_scheduler.current is None:
+        return jsonify({"error": "No recomputation has run yet"}), 404
+    return jsonify(recompute_scheduler.current.to_dict()), 200
+
+
 # === PERFORMANCE MANAGEMENT ENDPOINTS ===
 @app.route('/api/performance', methods=['GET'])
 def get_all_performance():
     """
-    Get all performance records for all students
+    Performance records in performance_id order, filtered in SQL by academic_year,
+    semester, subject_code and lecturer_id.
+
+    With limit, returns one page; after is the last performance_id of the
+    previous page and X-Next-After carries the cursor when the page is full.
+    Otherwise, or with format=ndjson or format=csv, rows are streamed from a
+    server-side cursor (after and limit still apply).
     """
+    fmt = request.args.get('format', 'json')
+    if fmt not in STREAM_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(STREAM_FORMATS)}"}), 400
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
-            
-        cursor = conn.cursor(dictionary=True)
-        
-        query = """
-        SELECT 
-            p.performance_id,
-            p.student_id,
-            s.first_name,
-            s.last_name,
-            s.program,
-            p.subject_code,
-            p.subject_name,
-            p.mark,
-            p.max_mark,
-            ROUND((p.mark / p.max_mark) * 100, 2) as percentage,
-            p.grade,
-            p.assessment_type,
-            p.assessment_date,
-            p.semester,
-            p.academic_year,
-            p.lecturer_id,
-            l.full_name as lecturer_name
-        FROM performance p
-        LEFT JOIN students s ON p.student_id = s.student_id
-        LEFT JOIN Lecturers l ON p.lecturer_id = l.lecturer_id
-        ORDER BY p.academic_year DESC, p.semester, s.last_name, s.first_name
-        """
-        
-        cursor.execute(query)
-        performance_data = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify(performance_data), 200
+        after, limit, filters = parse_performance_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        if fmt == 'json' and limit:
+            with db_cursor(dictionary=True) as (conn, cursor):
+                performance_data = fetch_performance(cursor, after, limit, filters)
+            response = jsonify(performance_data)
+            if len(performance_data) == limit:
+                response.headers['X-Next-After'] = str(performance_data[-1]['performance_id'])
+            return response, 200
+
+        chunks, close = stream_performance(fmt, after, limit, filters, dumps=app.json.dumps)
+        response = Response(chunks, mimetype=STREAM_FORMATS[fmt])
+        response.call_on_close(close)
+        if fmt == 'csv':
+            response.headers['Content-Disposition'] = 'attachment; filename=performance.csv'
+        return response
         
     except Exception as e:
         logger.error(f"Error fetching performance data: {e}")
         return jsonify({"error": "Failed to fetch performance data"}), 500
 
 @app.route('/api/performance/student/<string:student_id>', methods=['GET'])
+@response_cache.cached('student:{student_id}', 'lecturers')
 def get_student_performance(student_id):
     """
     Get performance records for a specific student
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
+        with db_cursor(dictionary=True) as (conn, cursor):
+            query = """
+            SELECT 
+                p.performance_id,
+                p.student_id,
+                s.first_name,
+                s.last_name,
+                s.program,
+                p.subject_code,
+                p.subject_name,
+                p.mark,
+                p.max_mark,
+                ROUND((p.mark / p.max_mark) * 100, 2) as percentage,
+                p.grade,
+                p.assessment_type,
+                p.assessment_date,
+                p.semester,
+                p.academic_year,
+                p.lecturer_id,
+                l.full_name as lecturer_name
+            FROM performance p
+            LEFT JOIN students s ON p.student_id = s.student_id
+            LEFT JOIN Lecturers l ON p.lecturer_id = l.lecturer_id
+            WHERE p.student_id = %s
+            ORDER BY p.academic_year DESC, p.semester, p.subject_code
+            """
             
-        cursor = conn.cursor(dictionary=True)
-        
-        query = """
-        SELECT 
-            p.performance_id,
-            p.student_id,
-            s.first_name,
-            s.last_name,
-            s.program,
-            p.subject_code,
-            p.subject_name,
-            p.mark,
-            p.max_mark,
-            ROUND((p.mark / p.max_mark) * 100, 2) as percentage,
-            p.grade,
-            p.assessment_type,
-            p.assessment_date,
-            p.semester,
-            p.academic_year,
-            p.lecturer_id,
-            l.full_name as lecturer_name
-        FROM performance p
-        LEFT JOIN students s ON p.student_id = s.student_id
-        LEFT JOIN Lecturers l ON p.lecturer_id = l.lecturer_id
-        WHERE p.student_id = %s
-        ORDER BY p.academic_year DESC, p.semester, p.subject_code
-        """
-        
-        cursor.execute(query, (student_id,))
-        performance_data = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+            cursor.execute(query, (student_id,))
+            performance_data = cursor.fetchall()
         
         return jsonify(performance_data), 200
         
@@ -429,52 +564,37 @@ def add_performance():
         
         # Calculate grade based on percentage
         percentage = (data['mark'] / data['max_mark']) * 100
-        if percentage >= 75:
-            grade = 'A'
-        elif percentage >= 70:
-            grade = 'B'
-        elif percentage >= 60:
-            grade = 'C'
-        elif percentage >= 50:
-            grade = 'D'
-        else:
-            grade = 'F'
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
+        grade = grade_for_percentage(percentage)
+        
+        with db_cursor() as (conn, cursor):
+            insert_query = """
+            INSERT INTO performance (
+                student_id, subject_code, subject_name, mark, max_mark, grade,
+                assessment_type, assessment_date, semester, academic_year, lecturer_id
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """
             
-        cursor = conn.cursor()
-        
-        insert_query = """
-        INSERT INTO performance (
-            student_id, subject_code, subject_name, mark, max_mark, grade,
-            assessment_type, assessment_date, semester, academic_year, lecturer_id
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        cursor.execute(insert_query, (
-            data['student_id'],
-            data['subject_code'],
-            data['subject_name'],
-            data['mark'],
-            data['max_mark'],
-            grade,
-            data['assessment_type'],
-            data.get('assessment_date', datetime.datetime.now().date()),
-            data.get('semester', '2'),
-            data.get('academic_year', 2024),
-            data.get('lecturer_id')
-        ))
-        
-        conn.commit()
-        performance_id = cursor.lastrowid
-        
-        # Automatically calculate and update risk level for this student
-        risk_result = calculate_risk_for_student(data['student_id'])
-        
-        cursor.close()
-        conn.close()
+            cursor.execute(insert_query, (
+                data['student_id'],
+                data['subject_code'],
+                data['subject_name'],
+                data['mark'],
+                data['max_mark'],
+                grade,
+                data['assessment_type'],
+                data.get('assessment_date', datetime.datetime.now().date()),
+                data.get('semester', '2'),
+                data.get('academic_year', 2024),
+                data.get('lecturer_id')
+            ))
+            performance_id = cursor.lastrowid
+            add_to_aggregates(cursor, "performance_id = %s", (performance_id,))
+            
+            conn.commit()
+            
+            # Automatically calculate and update risk level for this student
+            risk_result = calculate_risk_for_student(data['student_id'], conn)
+            response_cache.invalidate_students([data['student_id']], 'students', 'class_trends')
         
         logger.info(f"Performance record added for student {data['student_id']} in subject {data['subject_code']}")
         
@@ -505,66 +625,57 @@ def update_performance(performance_id):
     try:
         data = request.get_json()
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
+        with db_cursor(dictionary=True) as (conn, cursor):
+            # First, get the current record
+            cursor.execute("SELECT * FROM performance WHERE performance_id = %s", (performance_id,))
+            current_record = cursor.fetchone()
             
-        cursor = conn.cursor(dictionary=True)
-        
-        # First, get the current record
-        cursor.execute("SELECT * FROM performance WHERE performance_id = %s", (performance_id,))
-        current_record = cursor.fetchone()
-        
-        if not current_record:
-            return jsonify({"error": "Performance record not found"}), 404
-        
-        # Calculate new grade if mark or max_mark is being updated
-        mark = data.get('mark', current_record['mark'])
-        max_mark = data.get('max_mark', current_record['max_mark'])
-        percentage = (mark / max_mark) * 100
-        
-        if percentage >= 75:
-            grade = 'A'
-        elif percentage >= 70:
-            grade = 'B'
-        elif percentage >= 60:
-            grade = 'C'
-        elif percentage >= 50:
-            grade = 'D'
-        else:
-            grade = 'F'
-        
-        update_query = """
-        UPDATE performance 
-        SET student_id = %s, subject_code = %s, subject_name = %s, 
-            mark = %s, max_mark = %s, grade = %s, assessment_type = %s,
-            assessment_date = %s, semester = %s, academic_year = %s, lecturer_id = %s
-        WHERE performance_id = %s
-        """
-        
-        cursor.execute(update_query, (
-            data.get('student_id', current_record['student_id']),
-            data.get('subject_code', current_record['subject_code']),
-            data.get('subject_name', current_record['subject_name']),
-            mark,
-            max_mark,
-            grade,
-            data.get('assessment_type', current_record['assessment_type']),
-            data.get('assessment_date', current_record['assessment_date']),
-            data.get('semester', current_record['semester']),
-            data.get('academic_year', current_record['academic_year']),
-            data.get('lecturer_id', current_record['lecturer_id']),
-            performance_id
-        ))
-        
-        conn.commit()
-        
-        # Automatically calculate and update risk level for this student
-        student_id = data.get('student_id', current_record['student_id'])
-        risk_result = calculate_risk_for_student(student_id)
-        
-        cursor.close()
-        conn.close()
+            if not current_record:
+                return jsonify({"error": "Performance record not found"}), 404
+            
+            # Calculate new grade if mark or max_mark is being updated
+            mark = data.get('mark', current_record['mark'])
+            max_mark = data.get('max_mark', current_record['max_mark'])
+            percentage = (mark / max_mark) * 100
+            grade = grade_for_percentage(percentage)
+            
+            # Take the old values out of the running aggregates before they change
+            subtract_from_aggregates(cursor, "performance_id = %s", (performance_id,))
+            
+            update_query = """
+            UPDATE performance 
+            SET student_id = %s, subject_code = %s, subject_name = %s, 
+                mark = %s, max_mark = %s, grade = %s, assessment_type = %s,
+                assessment_date = %s, semester = %s, academic_year = %s, lecturer_id = %s
+            WHERE performance_id = %s
+            """
+            
+            cursor.execute(update_query, (
+                data.get('student_id', current_record['student_id']),
+                data.get('subject_code', current_record['subject_code']),
+                data.get('subject_name', current_record['subject_name']),
+                mark,
+                max_mark,
+                grade,
+                data.get('assessment_type', current_record['assessment_type']),
+                data.get('assessment_date', current_record['assessment_date']),
+                data.get('semester', current_record['semester']),
+                data.get('academic_year', current_record['academic_year']),
+                data.get('lecturer_id', current_record['lecturer_id']),
+                performance_id
+            ))
+            add_to_aggregates(cursor, "performance_id = %s", (performance_id,))
+            
+            conn.commit()
+            response_cache.invalidate_students([data.get('student_id', current_record['student_id']),
+                                                current_record['student_id']], 'students', 'class_trends')
+            
+            # Automatically calculate and update risk level for this student
+            student_id = data.get('student_id', current_record['student_id'])
+            risk_result = calculate_risk_for_student(student_id, conn)
+            # A record moved to another student also changes the previous owner's risk
+            if str(student_id) != str(current_record['student_id']):
+                calculate_risk_for_student(current_record['student_id'], conn)
         
         logger.info(f"Performance record {performance_id} updated successfully")
         
@@ -592,29 +703,23 @@ def delete_performance(performance_id):
     Delete a performance record
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
+        with db_cursor() as (conn, cursor):
+            # First get the student_id before deleting
+            cursor.execute("SELECT student_id FROM performance WHERE performance_id = %s", (performance_id,))
+            result = cursor.fetchone()
             
-        cursor = conn.cursor()
-        
-        # First get the student_id before deleting
-        cursor.execute("SELECT student_id FROM performance WHERE performance_id = %s", (performance_id,))
-        result = cursor.fetchone()
-        
-        if not result:
-            return jsonify({"error": "Performance record not found"}), 404
-        
-        student_id = result[0]
-        
-        cursor.execute("DELETE FROM performance WHERE performance_id = %s", (performance_id,))
-        conn.commit()
-        
-        # Automatically recalculate risk level for this student
-        risk_result = calculate_risk_for_student(student_id)
-        
-        cursor.close()
-        conn.close()
+            if not result:
+                return jsonify({"error": "Performance record not found"}), 404
+            
+            student_id = result[0]
+            
+            subtract_from_aggregates(cursor, "performance_id = %s", (performance_id,))
+            cursor.execute("DELETE FROM performance WHERE performance_id = %s", (performance_id,))
+            conn.commit()
+            response_cache.invalidate_students([student_id], 'students', 'class_trends')
+            
+            # Automatically recalculate risk level for this student
+            risk_result = calculate_risk_for_student(student_id, conn)
         
         logger.info(f"Performance record {performance_id} deleted successfully")
         
@@ -631,63 +736,57 @@ def delete_performance(performance_id):
 
 # === STUDENT DATA ENDPOINTS ===
 @app.route('/api/students', methods=['GET'])
+@response_cache.cached('students')
 def api_students():
-    conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT
-                s.student_id,
-                s.first_name,
-                s.last_name,
-                s.program,
-                s.last_login, 
-                COALESCE(p.risk_level, 'No Data') as risk_level,
-                p.prediction_date,
-                p.risk_score,
-                a.attendance_percentage AS attendance_rate,
-                ROUND(AVG(ass.score / ass.max_score) * 100, 2) AS assignment_avg,
-                l.lms_activity_score AS lms_activity
-            FROM
-                students AS s
-            LEFT JOIN
-                risk_predictions AS p ON s.student_id = p.student_id
-            LEFT JOIN
-                attendance AS a ON s.student_id = a.student_id
-            LEFT JOIN
-                assessments AS ass ON s.student_id = ass.student_id
-            LEFT JOIN
-                lms_activity AS l ON s.student_id = l.student_id
-            GROUP BY
-                s.student_id, s.first_name, s.last_name,s.program, s.last_login, p.risk_level, p.prediction_date, p.risk_score, a.attendance_percentage, l.lms_activity_score
-            ORDER BY
-                s.student_id;
-
-        """)
-        students_data = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return jsonify(students_data)
-    else:
-        return jsonify([]), 500
+    """
+    List students from the precomputed student_summary table.
+
+    Optional query parameters: fields (comma separated), after (last student_id
+    of the previous page), limit, program and risk_level. When a page is full,
+    the X-Next-After header carries the cursor for the next page.
+    """
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    after = request.args.get('after')
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit <= 0:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    try:
+        with db_cursor(dictionary=True) as (conn, cursor):
+            students_data = fetch_students(cursor, fields=fields, after=after, limit=limit,
+                                           program=request.args.get('program'),
+                                           risk_level=request.args.get('risk_level'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = jsonify(students_data)
+    if limit and len(students_data) == limit:
+        response.headers['X-Next-After'] = students_data[-1]['student_id']
+    return response
 
 @app.route('/api/add_student', methods=['POST'])
 def add_student():
-    """Adds a new student to the database."""
+    """Adds a new student to the database, with a login password if one is given."""
     data = request.get_json()
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("INSERT INTO students (student_id, first_name, last_name, program) VALUES (%s, %s, %s, %s)",
-                       (data['student_id'], data['first_name'], data['last_name'], data['program']))
-        
-        # Initialize risk prediction for new student
-        cursor.execute("""
-            INSERT INTO risk_predictions (student_id, risk_level, prediction_date, recommendation, risk_score)
-            VALUES (%s, 'No Data', %s, 'No performance data available.', 0)
-        """, (data['student_id'], datetime.datetime.now().date()))
-        
-        conn.commit()
+        password_hash = password_hasher.generate(data['password']) if data.get('password') else None
+        with db_cursor() as (conn, cursor):
+            cursor.execute("INSERT INTO students (student_id, first_name, last_name, program, password_hash) "
+                           "VALUES (%s, %s, %s, %s, %s)",
+                           (data['student_id'], data['first_name'], data['last_name'], data['program'], password_hash))
+            
+            # Initialize risk prediction for new student
+            cursor.execute("""
+                INSERT INTO risk_predictions (student_id, risk_level, prediction_date, recommendation, risk_score)
+                VALUES (%s, 'No Data', %s, 'No performance data available.', 0)
+            """, (data['student_id'], datetime.datetime.now().date()))
+            feature_store.refresh(cursor, [data['student_id']])
+            refresh_student_summary(cursor, [data['student_id']])
+            
+            conn.commit()
+            response_cache.invalidate_students([data['student_id']], 'students', 'class_trends')
+            search_index.upsert(data['student_id'], first_name=data['first_name'], last_name=data['last_name'],
+                                program=data['program'])
         
         # Return success with risk info
         return jsonify({
@@ -695,51 +794,49 @@ def add_student():
             "risk_level": "No Data",
             "note": "Risk level will be calculated when performance data is added."
         }), 201
+    except HashingBusy as e:
+        return jsonify({"error": str(e)}), 503
     except mysql.connector.Error as err:
         return jsonify({"error": f"Database Error: {err.msg}"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 @app.route('/api/add_lecturer', methods=['POST'])
 def add_lecturer():
     """Adds a new lecturer to the database."""
     data = request.get_json()
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("INSERT INTO Lecturers (lecturer_id, full_name, email, password, department) VALUES (%s, %s, %s, %s, %s)",
-                       (data['lecturer_id'], data['full_name'], data['email'], data['password'], data['department']))
-        conn.commit()
+        password_hash = password_hasher.generate(data['password'])
+        with db_cursor() as (conn, cursor):
+            cursor.execute("INSERT INTO Lecturers (lecturer_id, full_name, email, password, department) VALUES (%s, %s, %s, %s, %s)",
+                           (data['lecturer_id'], data['full_name'], data['email'], password_hash, data['department']))
+            conn.commit()
+            response_cache.invalidate('lecturers')
         return jsonify({"message": "Lecturer added successfully!"}), 201
+    except HashingBusy as e:
+        return jsonify({"error": str(e)}), 503
     except mysql.connector.Error as err:
         return jsonify({"error": f"Database Error: {err.msg}"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 @app.route('/api/add_admin', methods=['POST'])
 def add_admin():
     """Adds a new admin to the database."""
     data = request.get_json()
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("INSERT INTO Administrators (admin_id, full_name, email, password, role) VALUES (%s, %s, %s, %s, %s)",
-                       (data['admin_id'], data['full_name'], data['email'], data['password'], data['role']))
-        conn.commit()
+        password_hash = password_hasher.generate(data['password'])
+        with db_cursor() as (conn, cursor):
+            cursor.execute("INSERT INTO Administrators (admin_id, full_name, email, password, role) VALUES (%s, %s, %s, %s, %s)",
+                           (data['admin_id'], data['full_name'], data['email'], password_hash, data['role']))
+            conn.commit()
         return jsonify({"message": "Admin added successfully!"}), 201
+    except HashingBusy as e:
+        return jsonify({"error": str(e)}), 503
     except mysql.connector.Error as err:
         return jsonify({"error": f"Database Error: {err.msg}"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 @app.route('/api/students/update_program/<string:student_id>', methods=['PUT'])
 def update_student_program(student_id):
@@ -747,92 +844,94 @@ def update_student_program(student_id):
     Updates a student's program.
     """
     data = request.get_json()
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("UPDATE students SET program = %s WHERE student_id = %s", (data['program'], student_id))
-        conn.commit()
-        if cursor.rowcount == 0:
-            return jsonify({"error": "Student not found or program not changed."}), 404
+        with db_cursor() as (conn, cursor):
+            cursor.execute("UPDATE students SET program = %s WHERE student_id = %s", (data['program'], student_id))
+            updated = cursor.rowcount
+            refresh_student_summary(cursor, [student_id])
+            conn.commit()
+            response_cache.invalidate_students([student_id], 'students')
+            if updated == 0:
+                return jsonify({"error": "Student not found or program not changed."}), 404
+            search_index.upsert(student_id, program=data['program'])
         return jsonify({"message": "Student program updated successfully!"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 @app.route('/api/delete_student/<string:student_id>', methods=['DELETE'])
 def delete_student(student_id):
     """Deletes a student record and all related records."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        # Delete from child tables first
-        cursor.execute("DELETE FROM assessments WHERE student_id = %s", (student_id,))
-        cursor.execute("DELETE FROM attendance WHERE student_id = %s", (student_id,))
-        cursor.execute("DELETE FROM performance WHERE student_id = %s", (student_id,))
-        cursor.execute("DELETE FROM lms_activity WHERE student_id = %s", (student_id,))
-        cursor.execute("DELETE FROM interventions WHERE student_id = %s", (student_id,))
-        cursor.execute("DELETE FROM risk_predictions WHERE student_id = %s", (student_id,))  # <-- Add this line
-        # Now delete from students
-        cursor.execute("DELETE FROM students WHERE student_id = %s", (student_id,))
-        conn.commit()
-        if cursor.rowcount == 0:
-            return jsonify({"error": "Student not found."}), 404
+        with db_cursor() as (conn, cursor):
+            # Delete from child tables first
+            cursor.execute("DELETE FROM assessments WHERE student_id = %s", (student_id,))
+            subtract_attendance_from_rollup(cursor, "student_id = %s", (student_id,))
+            cursor.execute("DELETE FROM attendance WHERE student_id = %s", (student_id,))
+            # Takes the rows out of the class trend rollup as well
+            subtract_from_aggregates(cursor, "student_id = %s", (student_id,))
+            cursor.execute("DELETE FROM performance WHERE student_id = %s", (student_id,))
+            delete_aggregates(cursor, student_id)
+            cursor.execute("DELETE FROM lms_activity WHERE student_id = %s", (student_id,))
+            cursor.execute("DELETE FROM interventions WHERE student_id = %s", (student_id,))
+            cursor.execute("DELETE FROM risk_predictions WHERE student_id = %s", (student_id,))  # <-- Add this line
+            delete_student_summary(cursor, student_id)
+            # Now delete from students
+            cursor.execute("DELETE FROM students WHERE student_id = %s", (student_id,))
+            conn.commit()
+            response_cache.invalidate_students([student_id], 'students', 'class_trends')
+            feature_store.discard(student_id)
+            search_index.remove(student_id)
+            session_manager.forget_user('student', student_id)
+            if cursor.rowcount == 0:
+                return jsonify({"error": "Student not found."}), 404
         return jsonify({"message": "Student deleted successfully!"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 @app.route('/api/delete_lecturer/<string:lecturer_id>', methods=['DELETE'])
 def delete_lecturer(lecturer_id):
     """Deletes a lecturer record."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM Lecturers WHERE lecturer_id = %s", (lecturer_id,))
-        conn.commit()
-        if cursor.rowcount == 0:
-            return jsonify({"error": "Lecturer not found."}), 404
+        with db_cursor() as (conn, cursor):
+            cursor.execute("DELETE FROM Lecturers WHERE lecturer_id = %s", (lecturer_id,))
+            conn.commit()
+            response_cache.invalidate('lecturers')
+            session_manager.forget_user('lecturer', lecturer_id)
+            if cursor.rowcount == 0:
+                return jsonify({"error": "Lecturer not found."}), 404
         return jsonify({"message": "Lecturer deleted successfully!"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 @app.route('/api/delete_admin/<string:admin_id>', methods=['DELETE'])
 def delete_admin(admin_id):
     """Deletes an admin record."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM Administrators WHERE admin_id = %s", (admin_id,))
-        conn.commit()
-        if cursor.rowcount == 0:
-            return jsonify({"error": "Admin not found."}), 404
+        with db_cursor() as (conn, cursor):
+            cursor.execute("DELETE FROM Administrators WHERE admin_id = %s", (admin_id,))
+            conn.commit()
+            session_manager.forget_user('admin', admin_id)
+            if cursor.rowcount == 0:
+                return jsonify({"error": "Admin not found."}), 404
         return jsonify({"message": "Admin deleted successfully!"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 @app.route('/api/delete_performance/<string:student_id>/<string:subject_code>', methods=['DELETE'])
 def delete_performance_by_student_subject(student_id, subject_code):
     """Deletes a performance record for a student and subject."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM performance WHERE student_id = %s AND subject_code = %s", (student_id, subject_code,))
-        conn.commit()
-        
-        # Automatically recalculate risk level
-        risk_result = calculate_risk_for_student(student_id)
+        with db_cursor() as (conn, cursor):
+            subtract_from_aggregates(cursor, "student_id = %s AND subject_code = %s", (student_id, subject_code))
+            cursor.execute("DELETE FROM performance WHERE student_id = %s AND subject_code = %s", (student_id, subject_code,))
+            deleted = cursor.rowcount
+            conn.commit()
+            response_cache.invalidate_students([student_id], 'students', 'class_trends')
+            
+            # Automatically recalculate risk level
+            risk_result = calculate_risk_for_student(student_id, conn)
         
-        if cursor.rowcount == 0:
+        if deleted == 0:
             return jsonify({"error": "Performance record not found."}), 404
         
         response = {"message": "Performance record deleted successfully!"}
@@ -842,111 +941,170 @@ def delete_performance_by_student_subject(student_id, subject_code):
         return jsonify(response), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 # === DATA MANAGEMENT ENDPOINTS ===
-@app.route('/api/attendance', methods=['POST'])
-def add_attendance():
-    """Adds attendance record."""
+def write_single_record(table, message):
+    """
+    Write one JSON record through the bulk path and recalculate the student's risk,
+    since attendance, assessments and LMS activity are model features.
+    """
     data = request.get_json()
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        # Check if student exists
-        cursor.execute("SELECT student_id FROM students WHERE student_id = %s", (data['student_id'],))
-        if not cursor.fetchone():
-            return jsonify({"error": "Student not found."}), 404
-            
-        cursor.execute("""
-            INSERT INTO attendance (student_id, course_id, attendance_percentage) 
-            VALUES (%s, 1, %s)
-            ON DUPLICATE KEY UPDATE attendance_percentage = %s
-        """, (data['student_id'], data['attendance_percentage'], data['attendance_percentage']))
-        
-        conn.commit()
-        return jsonify({"message": "Attendance record added/updated successfully!"}), 201
+        job, touched = ingestion_service.write_records(table, [(1, data)])
+        if job.rows_rejected:
+            error = job.errors[0]['error']
+            if error.startswith(UNKNOWN_STUDENT):
+                return jsonify({"error": "Student not found."}), 404
+            return jsonify({"error": error}), 400
+
+        student_id = next(iter(touched))
+        risk_result = calculate_risk_for_student(student_id)
+        response_cache.invalidate_students([student_id], 'students', 'class_trends')
+        return jsonify(with_risk_update({"message": message}, risk_result)), 201
     except mysql.connector.Error as err:
         return jsonify({"error": f"Database Error: {err.msg}"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
-@app.route('/api/assessments', methods=['POST'])
-def add_assessment():
-    """Adds assessment record."""
-    data = request.get_json()
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def request_records():
+    """
+    The records of a bulk request as (row_number, record) pairs: a JSON array
+    (or {"records": [...]}) numbered from 1, or CSV with a header row, sent as a
+    'file' upload or a text/csv body and numbered by line. Raises ValueError.
+    """
+    if 'file' in request.files:
+        stream = io.TextIOWrapper(request.files['file'].stream, encoding='utf-8-sig', newline='')
+        return list(csv_records(stream))
+    if request.mimetype == 'text/csv':
+        return list(csv_records(io.StringIO(request.get_data().decode('utf-8-sig'), newline='')))
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('records')
+    if not isinstance(data, list) or not all(isinstance(record, dict) for record in data):
+        raise ValueError("Send a JSON array of records, or CSV as a 'file' upload or a text/csv body")
+    return list(enumerate(data, start=1))
+
+def write_bulk_records(table):
+    """
+    Validate and write a bulk request's records in chunked transactions, then
+    rescore the touched students in batches. Rejected rows are listed in errors.
+    """
     try:
-        # Check if student exists
-        cursor.execute("SELECT student_id FROM students WHERE student_id = %s", (data['student_id'],))
-        if not cursor.fetchone():
-            return jsonify({"error": "Student not found."}), 404
-            
-        cursor.execute("""
-            INSERT INTO assessments (student_id, course_id, assessment_type, score, max_score) 
-            VALUES (%s, 1, %s, %s, %s)
-        """, (data['student_id'], data['assessment_type'], data['score'], data['max_score']))
-        
-        conn.commit()
-        return jsonify({"message": "Assessment record added successfully!"}), 201
+        records = request_records()
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({"error": str(e)}), 400
+    if len(records) > BULK_MAX_ROWS:
+        return jsonify({"error": f"At most {BULK_MAX_ROWS} records per request"}), 413
+
+    try:
+        job, touched = ingestion_service.write_records(table, records)
+        if touched:
+            ingestion_service.rescore(job, touched)
+            response_cache.invalidate_students(touched, 'students', 'class_trends')
+        return jsonify({
+            "rows_received": job.rows_read,
+            "rows_written": job.rows_written,
+            "rows_rejected": job.rows_rejected,
+            "students_scored": job.students_scored,
+            "errors": [{"row": e['row'], "error": e['error']} for e in job.errors]
+        }), 200
     except mysql.connector.Error as err:
         return jsonify({"error": f"Database Error: {err.msg}"}), 400
     except Exception as e:
+        logger.error(f"Bulk {table} write failed: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
+
+@app.route('/api/attendance', methods=['POST'])
+def add_attendance():
+    """Adds or replaces one attendance record."""
+    return write_single_record('attendance', "Attendance record added/updated successfully!")
+
+@app.route('/api/assessments', methods=['POST'])
+def add_assessment():
+    """Adds one assessment record."""
+    return write_single_record('assessments', "Assessment record added successfully!")
 
 @app.route('/api/lms_activity', methods=['POST'])
 def add_lms_activity():
-    """Adds LMS activity record."""
-    data = request.get_json()
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        # Check if student exists
-        cursor.execute("SELECT student_id FROM students WHERE student_id = %s", (data['student_id'],))
-        if not cursor.fetchone():
-            return jsonify({"error": "Student not found."}), 404
-            
-        cursor.execute("""
-            INSERT INTO lms_activity (student_id, lms_activity_score) 
-            VALUES (%s, %s)
-            ON DUPLICATE KEY UPDATE lms_activity_score = %s
-        """, (data['student_id'], data['lms_activity_score'], data['lms_activity_score']))
-        
-        conn.commit()
-        return jsonify({"message": "LMS activity record added/updated successfully!"}), 201
-    except mysql.connector.Error as err:
-        return jsonify({"error": f"Database Error: {err.msg}"}), 400
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    """Adds or replaces one LMS activity record."""
+    return write_single_record('lms_activity', "LMS activity record added/updated successfully!")
+
+@app.route('/api/attendance/bulk', methods=['POST'])
+def add_attendance_bulk():
+    """Adds or replaces attendance records (student_id, attendance_percentage[, course_id])."""
+    return write_bulk_records('attendance')
+
+@app.route('/api/assessments/bulk', methods=['POST'])
+def add_assessments_bulk():
+    """Adds assessment records (student_id, assessment_type, score, max_score[, course_id])."""
+    return write_bulk_records('assessments')
+
+@app.route('/api/lms_activity/bulk', methods=['POST'])
+def add_lms_activity_bulk():
+    """Adds or replaces LMS activity records (student_id, lms_activity_score)."""
+    return write_bulk_records('lms_activity')
 
 # === SEARCH AND NOTIFICATION ENDPOINTS ===
 @app.route('/api/search/students', methods=['GET'])
 def search_students():
     """
-    Search students by ID, name, or program
+    Search students by ID, name, or program.
+
+    Results are ranked by the in-memory search index (ID matches first, then
+    names, then program). Optional query parameters: limit (default 50, at most
+    SEARCH_MAX_LIMIT) and cursor (the X-Next-Cursor header of the previous page).
     """
     search_term = request.args.get('q', '')
     if not search_term:
         return jsonify({"error": "Search term is required"}), 400
-    
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-        
-    cursor = conn.cursor(dictionary=True)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), SEARCH_MAX_LIMIT)
+    offset = max(request.args.get('cursor', 0, type=int), 0)
     
     try:
+        if not search_index.loaded:
+            results = search_students_sql(search_term, limit, offset)
+            response = jsonify(results)
+            if len(results) == limit:
+                response.headers['X-Next-Cursor'] = str(offset + limit)
+            return response, 200
+
+        search_index.maybe_reload(reload_search_index)
+        matches, next_offset = search_index.search(search_term, limit=limit, offset=offset)
+        risk = {}
+        if matches:
+            with db_cursor(dictionary=True) as (conn, cursor):
+                ids = [m['student_id'] for m in matches]
+                cursor.execute(f"""
+                    SELECT student_id, risk_level, risk_score
+                    FROM student_summary
+                    WHERE student_id IN ({placeholders(len(ids))})
+                """, ids)
+                risk = {row['student_id']: row for row in cursor.fetchall()}
+
+        results = []
+        for match in matches:
+            row = risk.get(match['student_id'], {})
+            results.append({
+                'student_id': match['student_id'],
+                'first_name': match['first_name'],
+                'last_name': match['last_name'],
+                'program': match['program'],
+                'risk_level': row.get('risk_level') or 'No Data',
+                'risk_score': row.get('risk_score'),
+            })
+        response = jsonify(results)
+        if next_offset is not None:
+            response.headers['X-Next-Cursor'] = str(next_offset)
+        return response, 200
+        
+    except Exception as e:
+        logger.error(f"Error searching students: {e}")
+        return jsonify({"error": "Search failed"}), 500
+
+
+def search_students_sql(search_term, limit, offset):
+    """LIKE search used until the search index has been loaded."""
+    with db_cursor(dictionary=True) as (conn, cursor):
         query = """
         SELECT 
             s.student_id,
@@ -962,21 +1120,12 @@ def search_students():
            OR s.last_name LIKE %s 
            OR s.program LIKE %s
         ORDER BY s.student_id
-        LIMIT 50
+        LIMIT %s OFFSET %s
         """
         
         search_pattern = f"%{search_term}%"
-        cursor.execute(query, (search_pattern, search_pattern, search_pattern, search_pattern))
-        results = cursor.fetchall()
-        
-        return jsonify(results), 200
-        
-    except Exception as e:
-        logger.error(f"Error searching students: {e}")
-        return jsonify({"error": "Search failed"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+        cursor.execute(query, (search_pattern, search_pattern, search_pattern, search_pattern, limit, offset))
+        return cursor.fetchall()
 
 
 # === NOTIFICATIONS ENDPOINT ===
@@ -986,42 +1135,91 @@ def get_notifications():
     Get notifications/interventions for students
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
+        # Taken before the query so no event published meanwhile is skipped
+        cursor_position = notification_broker.cursor
+        with db_cursor(dictionary=True) as (conn, cursor):
+            # Get student ID from query parameter or all notifications
+            student_id = request.args.get('student_id')
             
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get student ID from query parameter or all notifications
-        student_id = request.args.get('student_id')
-        
-        if student_id:
-            cursor.execute("""
-                SELECT i.*, s.first_name, s.last_name 
-                FROM interventions i 
-                JOIN students s ON i.student_id = s.student_id 
-                WHERE i.student_id = %s 
-                ORDER BY i.intervention_date DESC
-            """, (student_id,))
-        else:
-            cursor.execute("""
-                SELECT i.*, s.first_name, s.last_name 
-                FROM interventions i 
-                JOIN students s ON i.student_id = s.student_id 
-                ORDER BY i.intervention_date DESC 
-                LIMIT 50
-            """)
-        
-        notifications = cursor.fetchall()
-        cursor.close()
-        conn.close()
+            if student_id:
+                cursor.execute("""
+                    SELECT i.*, s.first_name, s.last_name 
+                    FROM interventions i 
+                    JOIN students s ON i.student_id = s.student_id 
+                    WHERE i.student_id = %s 
+                    ORDER BY i.intervention_date DESC
+                """, (student_id,))
+            else:
+                cursor.execute("""
+                    SELECT i.*, s.first_name, s.last_name 
+                    FROM interventions i 
+                    JOIN students s ON i.student_id = s.student_id 
+                    ORDER BY i.intervention_date DESC 
+                    LIMIT 50
+                """)
+            
+            notifications = cursor.fetchall()
         
-        return jsonify(notifications), 200
+        response = jsonify(notifications)
+        response.headers['X-Notification-Cursor'] = str(cursor_position)
+        return response, 200
         
     except Exception as e:
         logger.error(f"Error fetching notifications: {e}")
         return jsonify({"error": "Failed to fetch notifications"}), 500
 
+def _notification_cursor():
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        return int(cursor) if cursor is not None else notification_broker.cursor
+    except ValueError:
+        return notification_broker.cursor
+
+@app.route('/api/notifications/stream', methods=['GET'])
+def stream_notifications():
+    """
+    Server-Sent Events stream of new notifications.
+    Resumes after Last-Event-ID (or ?since=) when given; ?student_id= filters.
+    Returns 503 when this process already holds its limit of open streams.
+    """
+    release = notification_broker.reserve()
+    if release is None:
+        response = jsonify({"error": "Too many open notification streams; retry later or use /api/notifications/poll"})
+        response.headers['Retry-After'] = str(KEEPALIVE_SECONDS)
+        return response, 503
+    cursor = _notification_cursor()
+    student_id = request.args.get('student_id')
+    response = Response(notification_broker.stream(cursor, student_id), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(release)
+    return response
+
+@app.route('/api/notifications/poll', methods=['GET'])
+def poll_notifications():
+    """
+    Long-poll for notifications newer than ?since=<cursor>.
+    Waits up to ?timeout= seconds (max 60) when there is nothing new yet, unless
+    this process already holds its limit of waiting clients; then it answers at once
+    with Retry-After so the client backs off before polling again.
+    """
+    cursor = _notification_cursor()
+    timeout = min(request.args.get('timeout', 25, type=float), 60)
+    release = notification_broker.reserve()
+    try:
+        events, new_cursor, reset = notification_broker.wait(cursor, timeout if release else 0,
+                                                             request.args.get('student_id'))
+    finally:
+        if release:
+            release()
+    response = jsonify({
+        "cursor": new_cursor,
+        "reset": reset,
+        "notifications": [event for _, event in events]
+    })
+    if release is None:
+        response.headers['Retry-After'] = str(KEEPALIVE_SECONDS)
+    return response, 200
+
 # === CREATE INTERVENTION ENDPOINT ===
 @app.route('/api/interventions', methods=['POST'])
 def create_intervention():
@@ -1036,33 +1234,26 @@ def create_intervention():
             if field not in data:
                 return jsonify({"error": f"Missing required field: {field}"}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
+        with db_cursor(dictionary=True) as (conn, cursor):
+            insert_query = """
+            INSERT INTO interventions 
+            (student_id, intervention_type, intervention_date, due_date, owner, description, outcome)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """
             
-        cursor = conn.cursor()
-        
-        insert_query = """
-        INSERT INTO interventions 
-        (student_id, intervention_type, intervention_date, due_date, owner, description, outcome)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        cursor.execute(insert_query, (
-            data['student_id'],
-            data['intervention_type'],
-            datetime.datetime.now().date(),
-            data['due_date'],
-            data['owner'],
-            data.get('description', ''),
-            data.get('outcome', 'Pending')
-        ))
-        
-        conn.commit()
-        intervention_id = cursor.lastrowid
-        
-        cursor.close()
-        conn.close()
+            cursor.execute(insert_query, (
+                data['student_id'],
+                data['intervention_type'],
+                datetime.datetime.now().date(),
+                data['due_date'],
+                data['owner'],
+                data.get('description', ''),
+                data.get('outcome', 'Pending')
+            ))
+            
+            conn.commit()
+            intervention_id = cursor.lastrowid
+            publish_intervention(cursor, intervention_id)
         
         logger.info(f"Intervention created for student {data['student_id']}: {data['intervention_type']}")
         
@@ -1082,7 +1273,8 @@ def create_intervention():
 @app.route('/api/upload_document', methods=['POST'])
 def upload_document():
     """
-    Handle Excel file uploads for student data
+    Queue an Excel workbook of student data for ingestion.
+    Returns 202 with a job ID; poll /api/upload_document/<job_id> for progress.
     """
     try:
         if 'document' not in request.files:
@@ -1092,88 +1284,89 @@ def upload_document():
         if file.filename == '':
             return jsonify({"error": "No file selected"}), 400
         
-        # Check if it's an Excel file
-        if not (file.filename.endswith('.xlsx') or file.filename.endswith('.xls')):
-            return jsonify({"error": "Only Excel files are allowed"}), 400
-        
-        # For now, we'll just log the upload and return success
-        # In a real implementation, we will need to parse the Excel file
-        # and insert data into the database
+        # openpyxl reads the .xlsx format only
+        if not file.filename.endswith('.xlsx'):
+            return jsonify({"error": "Only .xlsx Excel files are allowed"}), 400
         
         student_number = request.form.get('studentNumber', 'Unknown')
         
-        logger.info(f"File uploaded: {file.filename} for student {student_number}")
+        # Spool to disk so the worker can stream it instead of holding it in memory
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix='.xlsx', dir=UPLOAD_DIR)
+        with os.fdopen(fd, 'wb') as target:
+            file.save(target)
         
-        # 1. Read the Excel file (using pandas or openpyxl)
-        # 2. Validate the data
-        # 3. Insert into the appropriate tables
-        # 4. Return appropriate response
+        job = ingestion_service.submit(path, file.filename)
+        logger.info(f"File uploaded: {file.filename} for student {student_number}, ingestion job {job.job_id}")
         
         return jsonify({
-            "message": f"File '{file.filename}' uploaded successfully. Processing would be implemented here.",
+            "message": f"File '{file.filename}' uploaded successfully. Processing has started.",
             "filename": file.filename,
-            "student_number": student_number
-        }), 200
+            "student_number": student_number,
+            "job_id": job.job_id,
+            "progress_url": f"/api/upload_document/{job.job_id}"
+        }), 202
         
     except Exception as e:
         logger.error(f"Error uploading document: {e}")
         return jsonify({"error": "Upload failed"}), 500
 
+@app.route('/api/upload_document/<string:job_id>', methods=['GET'])
+def upload_document_progress(job_id):
+    """Progress of an ingestion job."""
+    job = ingestion_service.get(job_id)
+    if job is None:
+        return jsonify({"error": "Upload job not found"}), 404
+    return jsonify(job.to_dict())
+
 # === GET STUDENT DETAILS ENDPOINT ===
 @app.route('/api/student/<string:student_id>', methods=['GET'])
+@response_cache.cached('student:{student_id}')
 def get_student_details(student_id):
     """
     Get comprehensive student details
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
+        with db_cursor(dictionary=True) as (conn, cursor):
+            # Get basic student info
+            cursor.execute("""
+                SELECT student_id, first_name, last_name, email, program, year_of_study
+                FROM students WHERE student_id = %s
+            """, (student_id,))
             
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get basic student info
-        cursor.execute("""
-            SELECT student_id, first_name, last_name, email, program, year_of_study
-            FROM students WHERE student_id = %s
-        """, (student_id,))
-        
-        student = cursor.fetchone()
-        if not student:
-            return jsonify({"error": "Student not found"}), 404
-        
-        # Get attendance
-        cursor.execute("""
-            SELECT attendance_percentage 
-            FROM attendance 
-            WHERE student_id = %s 
-            ORDER BY attendance_id DESC 
-            LIMIT 1
-        """, (student_id,))
-        attendance = cursor.fetchone()
-        
-        # Get LMS activity
-        cursor.execute("""
-            SELECT lms_activity_score 
-            FROM lms_activity 
-            WHERE student_id = %s 
-            ORDER BY lms_activity_id DESC 
-            LIMIT 1
-        """, (student_id,))
-        lms_activity = cursor.fetchone()
-        
-        # Get risk prediction
-        cursor.execute("""
-            SELECT risk_level, risk_score, recommendation, prediction_date
-            FROM risk_predictions 
-            WHERE student_id = %s 
-            ORDER BY prediction_date DESC 
-            LIMIT 1
-        """, (student_id,))
-        risk_prediction = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
+            student = cursor.fetchone()
+            if not student:
+                return jsonify({"error": "Student not found"}), 404
+            
+            # Get attendance
+            cursor.execute("""
+                SELECT attendance_percentage 
+                FROM attendance 
+                WHERE student_id = %s 
+                ORDER BY attendance_id DESC 
+                LIMIT 1
+            """, (student_id,))
+            attendance = cursor.fetchone()
+            
+            # Get LMS activity
+            cursor.execute("""
+                SELECT lms_activity_score 
+                FROM lms_activity 
+                WHERE student_id = %s 
+                ORDER BY lms_activity_id DESC 
+                LIMIT 1
+            """, (student_id,))
+            lms_activity = cursor.fetchone()
+            
+            # Get risk prediction
+            cursor.execute("""
+                SELECT risk_level, risk_score, recommendation, prediction_date
+                FROM risk_predictions 
+                WHERE student_id = %s 
+                ORDER BY prediction_date DESC 
+                LIMIT 1
+            """, (student_id,))
+            risk_prediction = cursor.fetchone()
         
         return jsonify({
             "student_info": student,
@@ -1187,59 +1380,152 @@ def get_student_details(student_id):
         return jsonify({"error": "Failed to fetch student details"}), 500
 
 # === GET CLASS ANALYSIS DATA ===
+# Time series buckets for /api/analysis/class_trends?granularity=
+TREND_GRANULARITIES = {
+    'day': "day",
+    # %% because the query is formatted with parameters
+    'month': "DATE_FORMAT(day, '%%Y-%%m-01')",
+}
+
 @app.route('/api/analysis/class_trends', methods=['GET'])
+@response_cache.cached('class_trends')
 def get_class_trends():
     """
     Get data for class analysis and trends
+
+    Performance figures come from performance_rollup and can be filtered by
+    module (subject_code), start_date/end_date (assessment day, YYYY-MM-DD),
+    semester and academic_year; ``granularity`` (day or month) sets the
+    time series buckets. Undated records are left out of date-filtered queries
+    and of the time series.
+
+    Attendance and risk are not recorded per module or date. When filters are
+    given, the risk distribution and attendance average cover the students with
+    performance records matching them ("cohort": "filtered"); otherwise every
+    student ("cohort": "all").
     """
     try:
         module = request.args.get('module', 'all')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
+        semester = request.args.get('semester')
+        academic_year = request.args.get('academic_year')
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in TREND_GRANULARITIES:
+            return jsonify({"error": f"granularity must be one of: {', '.join(TREND_GRANULARITIES)}"}), 400
+        try:
+            start_date = request.args.get('start_date')
+            end_date = request.args.get('end_date')
+            start_date = datetime.date.fromisoformat(start_date) if start_date else None
+            end_date = datetime.date.fromisoformat(end_date) if end_date else None
+        except ValueError:
+            return jsonify({"error": "start_date and end_date must be YYYY-MM-DD dates"}), 400
+        
+        conditions = []
+        params = []
+        if module and module != 'all':
+            conditions.append("subject_code = %s")
+            params.append(module)
+        if semester:
+            conditions.append("semester = %s")
+            params.append(semester)
+        if academic_year:
+            conditions.append("academic_year = %s")
+            params.append(academic_year)
+        # The same filters on the performance rows, selecting the students they cover
+        cohort_conditions = list(conditions)
+        if start_date:
+            conditions.append("day >= %s")
+            cohort_conditions.append("assessment_date >= %s")
+            params.append(start_date)
+        if end_date:
+            conditions.append("day <= %s")
+            cohort_conditions.append("assessment_date <= %s")
+            params.append(end_date)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        dated_where = f"{where} {'AND' if conditions else 'WHERE'} day <> %s"
+        cohort_sql = f"SELECT DISTINCT student_id FROM performance WHERE {' AND '.join(cohort_conditions)}"
+        
+        with db_cursor(dictionary=True) as (conn, cursor):
+            if conditions:
+                cursor.execute(f"""
+                    SELECT 
+                        risk_level,
+                        COUNT(*) as count
+                    FROM student_summary
+                    WHERE prediction_date IS NOT NULL AND student_id IN ({cohort_sql})
+                    GROUP BY risk_level
+                """, params)
+                risk_distribution = cursor.fetchall()
+                
+                cursor.execute(f"""
+                    SELECT AVG(attendance_percentage) as avg_attendance
+                    FROM attendance
+                    WHERE student_id IN ({cohort_sql})
+                """, params)
+                attendance_trends = cursor.fetchone()
+            else:
+                # Risk distribution (current prediction per student, from the summary table)
+                cursor.execute("""
+                    SELECT 
+                        risk_level,
+                        COUNT(*) as count
+                    FROM student_summary
+                    WHERE prediction_date IS NOT NULL
+                    GROUP BY risk_level
+                """)
+                risk_distribution = cursor.fetchall()
+                
+                # Attendance trends
+                cursor.execute("""
+                    SELECT 
+                        SUM(percentage_sum) / NULLIF(SUM(record_count), 0) as avg_attendance
+                    FROM attendance_rollup
+                """)
+                attendance_trends = cursor.fetchone()
             
-        cursor = conn.cursor(dictionary=True)
-        
-        # Risk distribution
-        cursor.execute("""
-            SELECT 
-                risk_level,
-                COUNT(*) as count
-            FROM risk_predictions rp
-            JOIN students s ON rp.student_id = s.student_id
-            GROUP BY risk_level
-        """)
-        risk_distribution = cursor.fetchall()
-        
-        # Attendance trends
-        cursor.execute("""
-            SELECT 
-                AVG(attendance_percentage) as avg_attendance
-            FROM attendance
-        """)
-        attendance_trends = cursor.fetchone()
-        
-        # Performance by module
-        cursor.execute("""
-            SELECT 
-                subject_code,
-                AVG((mark / max_mark) * 100) as avg_percentage,
-                COUNT(*) as record_count
-            FROM performance
-            GROUP BY subject_code
-        """)
-        performance_by_module = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+            # Performance by module
+            cursor.execute(f"""
+                SELECT 
+                    subject_code,
+                    SUM(percentage_sum) / NULLIF(SUM(record_count), 0) as avg_percentage,
+                    SUM(record_count) as record_count
+                FROM performance_rollup
+                {where}
+                GROUP BY subject_code
+                HAVING SUM(record_count) > 0
+                ORDER BY subject_code
+            """, params)
+            performance_by_module = cursor.fetchall()
+            
+            # Time series of the average per bucket and module
+            bucket = TREND_GRANULARITIES[granularity]
+            cursor.execute(f"""
+                SELECT 
+                    {bucket} as period,
+                    subject_code,
+                    SUM(percentage_sum) / NULLIF(SUM(record_count), 0) as avg_percentage,
+                    SUM(record_count) as record_count
+                FROM performance_rollup
+                {dated_where}
+                GROUP BY period, subject_code
+                HAVING SUM(record_count) > 0
+                ORDER BY period, subject_code
+            """, params + [UNDATED_DAY])
+            time_series = cursor.fetchall()
         
         return jsonify({
+            "filters": {
+                "module": module,
+                "start_date": start_date.isoformat() if start_date else None,
+                "end_date": end_date.isoformat() if end_date else None,
+                "semester": semester,
+                "academic_year": academic_year,
+                "granularity": granularity
+            },
+            "cohort": "filtered" if conditions else "all",
             "risk_distribution": risk_distribution,
             "attendance_trends": attendance_trends,
-            "performance_by_module": performance_by_module
+            "performance_by_module": performance_by_module,
+            "time_series": time_series
         }), 200
         
     except Exception as e:
@@ -1248,32 +1534,125 @@ def get_class_trends():
 
 @app.route('/api/send_notification', methods=['POST'])
 def send_notification():
+    """
+    Record a notification for one student (student_number) or several
+    (student_numbers). With "email": true it is also emailed to the students
+    through the alert outbox.
+    """
     data = request.json
-    student_number = data.get('student_number')
+    student_numbers = data.get('student_numbers') or ([data['student_number']] if data.get('student_number') else [])
     message_content = data.get('message')
 
-    if not student_number or not message_content:
+    if not student_numbers or not message_content:
         return jsonify({'message': 'Student number and message are required'}), 400
+    student_numbers = list(dict.fromkeys(str(sid) for sid in student_numbers))
     
-    # Insert notification into the interventions table
-    conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor()
+    # Insert notifications into the interventions table in one transaction
+    with db_cursor(dictionary=True) as (conn, cursor):
         insert_query = """
         INSERT INTO interventions (student_id, intervention_type, description, intervention_date)
         VALUES (%s, %s, %s, %s)
         """
-        cursor.execute(insert_query, (
-            student_number,
-            'Notification',
-            message_content,
-            datetime.datetime.now().date()
-        ))
+        intervention_ids = []
+        for student_number in student_numbers:
+            cursor.execute(insert_query, (
+                student_number,
+                'Notification',
+                message_content,
+                datetime.datetime.now().date()
+            ))
+            intervention_ids.append(cursor.lastrowid)
         conn.commit()
-        cursor.close()
-        conn.close()
-        
-    return jsonify({'message': f'Notification sent successfully to student {student_number}.'}), 200
+        for intervention_id in intervention_ids:
+            publish_intervention(cursor, intervention_id)
+
+        queued = []
+        if data.get('email'):
+            cursor.execute(f"""
+                SELECT email FROM students
+                WHERE student_id IN ({placeholders(len(student_numbers))}) AND email LIKE '%%@%%'
+            """, student_numbers)
+            queued = alert_dispatcher.enqueue(
+                [(row['email'], 'Unizulu Notification', message_content) for row in cursor.fetchall()])
+        
+    if len(student_numbers) == 1:
+        message = f'Notification sent successfully to student {student_numbers[0]}.'
+    else:
+        message = f'Notification sent successfully to {len(student_numbers)} students.'
+    return jsonify({'message': message, 'emails_queued': len(queued)}), 200
+
+@app.route('/api/alerts/risk', methods=['POST'])
+def queue_risk_alert():
+    """
+    Queue a risk alert email (studentName, studentEmail, riskLevel, alertMessage,
+    recommendations) for the student and TO_MAIL. Returns 202 once it is queued.
+    """
+    data = request.get_json() or {}
+    missing = [field for field in ('studentName', 'riskLevel', 'alertMessage') if not data.get(field)]
+    if missing:
+        return jsonify({"error": f"Missing fields: {', '.join(missing)}"}), 400
+    try:
+        alert_ids = alert_dispatcher.enqueue_risk_alert(data)
+        return jsonify({"message": "Alert queued", "alert_ids": alert_ids}), 202
+    except Exception as e:
+        logger.error(f"Error queueing risk alert: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/alerts/cohort', methods=['POST'])
+def queue_cohort_alert():
+    """
+    Queue a risk alert to every student at the given risk levels (default High
+    and Very High), optionally within one program. TO_MAIL gets one summary
+    instead of a copy per student. Returns 202 once the alerts are queued.
+    """
+    data = request.get_json() or {}
+    risk_levels = data.get('risk_levels') or ALERT_COHORT_LEVELS
+    alert_message = data.get('message')
+    if not alert_message:
+        return jsonify({"error": "message is required"}), 400
+    try:
+        with db_cursor(dictionary=True) as (conn, cursor):
+            query = f"""
+                SELECT ss.student_id, ss.first_name, ss.last_name, ss.risk_level, s.email
+                FROM student_summary ss
+                JOIN students s ON s.student_id = ss.student_id
+                WHERE ss.risk_level IN ({placeholders(len(risk_levels))})
+            """
+            params = list(risk_levels)
+            if data.get('program'):
+                query += " AND ss.program = %s"
+                params.append(data['program'])
+            cursor.execute(query + " ORDER BY ss.student_id", params)
+            students = cursor.fetchall()
+
+        messages = []
+        for student in students:
+            messages.extend(risk_alert_messages({
+                'studentName': f"{student['first_name']} {student['last_name']}",
+                'studentEmail': student['email'],
+                'riskLevel': student['risk_level'],
+                'alertMessage': alert_message,
+                'recommendations': data.get('recommendations'),
+            }, staff_copy=False))
+        if students and TO_MAIL:
+            messages.append(cohort_digest_message(risk_levels, students, alert_message))
+        alert_ids = alert_dispatcher.enqueue(messages)
+        return jsonify({
+            "message": "Cohort alert queued",
+            "students": len(students),
+            "without_email": sum(1 for s in students if '@' not in (s['email'] or '')),
+            "queued": len(alert_ids)
+        }), 202
+    except mysql.connector.Error as err:
+        return jsonify({"error": f"Database Error: {err.msg}"}), 400
+    except Exception as e:
+        logger.error(f"Error queueing cohort alert: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/alerts/outbox', methods=['GET'])
+def alert_outbox_stats():
+    """Counts of queued, sent and failed alerts."""
+    return jsonify(alert_dispatcher.stats()), 200
 
 # === UPDATE STUDENT LOGIN TIME ===
 @app.route('/api/update_student_login/<string:student_id>', methods=['POST'])
@@ -1282,22 +1661,17 @@ def update_student_login(student_id):
     Update student's last login time
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
+        with db_cursor() as (conn, cursor):
+            # Update last login time
+            cursor.execute("""
+                UPDATE students 
+                SET last_login = %s 
+                WHERE student_id = %s
+            """, (datetime.datetime.now(), student_id))
+            refresh_student_summary(cursor, [student_id])
             
-        cursor = conn.cursor()
-        
-        # Update last login time
-        cursor.execute("""
-            UPDATE students 
-            SET last_login = %s 
-            WHERE student_id = %s
-        """, (datetime.datetime.now(), student_id))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+            conn.commit()
+            response_cache.invalidate_students([student_id], 'students')
         
         logger.info(f"Updated last login for student {student_id}")
         return jsonify({"message": "Login time updated successfully"}), 200
@@ -1313,22 +1687,15 @@ def update_risk_check(student_id):
     Update student's last risk check time
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
+        with db_cursor() as (conn, cursor):
+            # Update last risk check time
+            cursor.execute("""
+                UPDATE students 
+                SET last_risk_check = %s 
+                WHERE student_id = %s
+            """, (datetime.datetime.now(), student_id))
             
-        cursor = conn.cursor()
-        
-        # Update last risk check time
-        cursor.execute("""
-            UPDATE students 
-            SET last_risk_check = %s 
-            WHERE student_id = %s
-        """, (datetime.datetime.now(), student_id))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+            conn.commit()
         
         logger.info(f"Updated last risk check for student {student_id}")
         return jsonify({"message": "Risk check time updated successfully"}), 200
@@ -1344,26 +1711,19 @@ def get_student_activity(student_id):
     Get student's last login and risk check times
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
+        with db_cursor(dictionary=True) as (conn, cursor):
+            cursor.execute("""
+                SELECT 
+                    student_id,
+                    first_name,
+                    last_name,
+                    last_login,
+                    last_risk_check
+                FROM students 
+                WHERE student_id = %s
+            """, (student_id,))
             
-        cursor = conn.cursor(dictionary=True)
-        
-        cursor.execute("""
-            SELECT 
-                student_id,
-                first_name,
-                last_name,
-                last_login,
-                last_risk_check
-            FROM students 
-            WHERE student_id = %s
-        """, (student_id,))
-        
-        student_activity = cursor.fetchone()
-        cursor.close()
-        conn.close()
+            student_activity = cursor.fetchone()
         
         if not student_activity:
             return jsonify({"error": "Student not found"}), 404
@@ -1374,5 +1734,35 @@ def get_student_activity(student_id):
         logger.error(f"Error fetching student activity: {e}")
         return jsonify({"error": "Failed to fetch student activity"}), 500
 
+def start_background_workers():
+    """
+    Start the alert worker, which also sends anything left in the outbox, and
+    the follower that publishes other processes' notifications.
+    """
+    alert_dispatcher.start()
+    notification_follower.start()
+
+def init_database(start_workers=True):
+    """
+    Create the API-maintained tables, backfill the aggregates and student summary,
+    and load the feature store and search index.
+    Logged and skipped if the database is not reachable yet. Pre-fork servers pass
+    start_workers=False and call start_background_workers in each worker, since
+    threads do not survive fork (see gunicorn.conf.py).
+    """
+    if start_workers:
+        start_background_workers()
+    try:
+        apply_schema()
+        with db_cursor() as (conn, cursor):
+            ensure_aggregates(cursor)
+            ensure_student_summary(cursor)
+            conn.commit()
+            feature_store.load(cursor)
+            search_index.load(cursor)
+    except Exception as e:
+        logger.error(f"Database initialisation failed: {e}")
+
 if __name__ == '__main__':
+    init_database()
     app.run(debug=True, port=5000)
\ No newline at end of file
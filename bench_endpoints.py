@@ -0,0 +1,293 @@
+"""
+Load-test the Flask API's read endpoints against a seeded database.
+
+Seeds the database configured by DB_HOST/DB_USER/DB_PASSWORD/DB_NAME (use a
+scratch MySQL or MariaDB database that already has the core tables) with
+synthetic students whose IDs start with BENCH. It then drives each endpoint at
+the given concurrency and reports, per endpoint, p50/p95/p99 and mean latency,
+throughput, errors and database queries per request.
+
+By default requests go through the app in-process (Flask test client,
+init_database first, the real pool and caches). With --url they go over HTTP to
+a running server instead. Query counts come from the Server-Timing header in
+both modes.
+
+    python bench_endpoints.py --seed-students 10000 --reset
+    python bench_endpoints.py --requests 500 --concurrency 16 --json bench.json [--compare old.json]
+
+To compare the dev server with the production setup (gunicorn.conf.py):
+
+    python app1.py                                   # dev server on :5000
+    python bench_endpoints.py --url http://127.0.0.1:5000 --json dev.json
+    BIND=127.0.0.1:8000 gunicorn app1:app
+    python bench_endpoints.py --url http://127.0.0.1:8000 --compare dev.json
+"""
+import argparse
+import datetime
+import json
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import db
+
+BENCH_PREFIX = 'BENCH'
+FIRST_NAMES = ['Sipho', 'Thandi', 'Anisha', 'John', 'Lindiwe', 'Sibusiso', 'Nosipho', 'Zanele', 'Ayanda', 'Lerato']
+LAST_NAMES = ['Dlamini', 'Mkhize', 'Patel', 'Smith', 'Khanyile', 'Zuma', 'Ngcobo', 'Naidoo', 'Mthembu', 'Cele']
+PROGRAMS = ['BSc Mathematical Science', 'BSc Computer Science', 'BA Education', 'BCom Accounting']
+SUBJECTS = [('MATH101', 'Calculus'), ('COMP101', 'Programming'), ('STAT101', 'Statistics'), ('EDUC101', 'Pedagogy')]
+ASSESSMENT_TYPES = ['Test', 'Quiz', 'Assignment', 'Exam']
+
+PERCENTILES = [50, 95, 99]
+
+
+def bench_student_id(n):
+    return f'{BENCH_PREFIX}{n:08d}'
+
+
+# --- Seeding ----------------------------------------------------------------
+
+def reset_bench_data(cursor):
+    """Delete every row belonging to BENCH students, children first, and rebuild the rollups."""
+    from aggregates import rebuild_rollups
+
+    pattern = f'{BENCH_PREFIX}%'
+    for table in ['interventions', 'assessments', 'attendance', 'lms_activity', 'performance', 'risk_predictions',
+                  'student_summary', 'performance_aggregates', 'students']:
+        cursor.execute(f"DELETE FROM {table} WHERE student_id LIKE %s", (pattern,))
+    rebuild_rollups(cursor)
+
+
+def seed(students, performance_per_student, interventions_per_student, chunk_size=1000, seed=0):
+    """Insert synthetic students with performance, attendance, LMS and intervention rows."""
+    from aggregates import reconcile_aggregates
+    from ingestion import TABLE_SQL
+    from risk import grade_for_percentage
+    from summary import rebuild_student_summary
+
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    db.apply_schema()
+    with db.db_cursor() as (conn, cursor):
+        for start in range(0, students, chunk_size):
+            rows = {table: [] for table in TABLE_SQL}
+            interventions = []
+            for n in range(start, min(start + chunk_size, students)):
+                student_id = bench_student_id(n)
+                first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                rows['students'].append((student_id, first, last, rng.choice(PROGRAMS),
+                                         f'{student_id.lower()}@bench.example', rng.randint(1, 4)))
+                ability = rng.uniform(30, 95)
+                for _ in range(performance_per_student):
+                    subject_code, subject_name = rng.choice(SUBJECTS)
+                    mark = max(0.0, min(100.0, rng.gauss(ability, 12)))
+                    rows['performance'].append((
+                        student_id, subject_code, subject_name, round(mark, 1), 100, grade_for_percentage(mark),
+                        rng.choice(ASSESSMENT_TYPES), today - datetime.timedelta(days=rng.randint(0, 365)),
+                        rng.choice(['1', '2']), today.year))
+                rows['attendance'].append((student_id, 1, round(rng.uniform(40, 100), 2)))
+                rows['lms_activity'].append((student_id, round(rng.uniform(0, 100), 2)))
+                rows['assessments'].append((student_id, 1, 'Assignment', round(rng.uniform(20, 100), 1), 100))
+                for _ in range(interventions_per_student):
+                    interventions.append((student_id, 'Notification', 'Benchmark notification',
+                                          today - datetime.timedelta(days=rng.randint(0, 90))))
+            for table, sql in TABLE_SQL.items():
+                if rows[table]:
+                    cursor.executemany(sql, rows[table])
+            if interventions:
+                cursor.executemany("""
+                    INSERT INTO interventions (student_id, intervention_type, description, intervention_date)
+                    VALUES (%s, %s, %s, %s)
+                """, interventions)
+            conn.commit()
+            print(f"Seeded {min(start + chunk_size, students)}/{students} students", flush=True)
+        reconcile_aggregates(cursor, repair=True)
+        rebuild_student_summary(cursor)
+        conn.commit()
+
+
+def bench_student_ids(limit):
+    with db.db_cursor() as (conn, cursor):
+        cursor.execute("SELECT student_id FROM students WHERE student_id LIKE %s ORDER BY student_id LIMIT %s",
+                       (f'{BENCH_PREFIX}%', limit))
+        return [row[0] for row in cursor.fetchall()]
+
+
+# --- Query counting ---------------------------------------------------------
+
+_SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def queries_from_server_timing(header):
+    """Statement count from the Server-Timing header added by instrumentation.py."""
+    match = _SERVER_TIMING_QUERIES.search(header or '')
+    return int(match.group(1)) if match else None
+
+
+# --- Load generation ----------------------------------------------------------
+
+def endpoint_paths(name, student_ids, rng):
+    """Return a function producing the next request path for an endpoint."""
+    def student():
+        return rng.choice(student_ids)
+    return {
+        'students': lambda: '/api/students?limit=100',
+        'calculate_risk': lambda: f'/api/calculate_risk/{student()}',
+        'performance': lambda: '/api/performance',
+        'performance_page': lambda: '/api/performance?limit=500',
+        'search': lambda: f'/api/search/students?q={rng.choice(FIRST_NAMES + LAST_NAMES)[:rng.randint(2, 6)]}',
+        'notifications': lambda: f'/api/notifications?student_id={student()}',
+    }[name]
+
+
+ENDPOINTS = ['students', 'calculate_risk', 'performance', 'performance_page', 'search', 'notifications']
+
+
+class InProcessClient:
+    def __init__(self, cache):
+        import app1
+        app1.init_database()
+        app1.response_cache.enabled = cache
+        self._app = app1.app
+        self._local = threading.local()
+
+    def get(self, path):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self._app.test_client()
+        response = client.get(path)
+        response.get_data()
+        return response.status_code, queries_from_server_timing(response.headers.get('Server-Timing'))
+
+
+class HTTPClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def get(self, path):
+        try:
+            with urllib.request.urlopen(self.base_url + path, timeout=60) as response:
+                response.read()
+                return response.status, queries_from_server_timing(response.headers.get('Server-Timing'))
+        except urllib.error.HTTPError as e:
+            return e.code, queries_from_server_timing(e.headers.get('Server-Timing'))
+
+
+def run_endpoint(client, next_path, requests, concurrency, warmup):
+    for _ in range(warmup):
+        client.get(next_path())
+
+    def one(path):
+        start = time.perf_counter()
+        try:
+            status, queries = client.get(path)
+        except Exception:
+            status, queries = None, None
+        return time.perf_counter() - start, status, queries
+
+    paths = [next_path() for _ in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, paths))
+    wall = time.perf_counter() - start
+
+    latencies = np.array([r[0] for r in results]) * 1000
+    errors = sum(1 for r in results if r[1] is None or r[1] >= 400)
+    queries = [r[2] for r in results if r[2] is not None]
+    summary = {f'p{p}_ms': round(float(np.percentile(latencies, p)), 2) for p in PERCENTILES}
+    summary.update({
+        'mean_ms': round(float(latencies.mean()), 2),
+        'max_ms': round(float(latencies.max()), 2),
+        'throughput_rps': round(requests / wall, 1),
+        'requests': requests,
+        'errors': errors,
+        'queries_per_request': round(float(np.mean(queries)), 2) if queries else None,
+    })
+    return summary
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as fh:
+        baseline = json.load(fh)['results']
+    print(f"\nvs {baseline_path}")
+    print(f"{'endpoint':<16} {'p95 ms':>10} {'was':>10} {'change':>8}")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        change = (result['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0.0
+        print(f"{name:<16} {result['p95_ms']:>10.2f} {old['p95_ms']:>10.2f} {change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the API endpoints against a seeded database.')
+    parser.add_argument('--seed-students', type=int, default=0, help='Seed this many BENCH students first')
+    parser.add_argument('--performance-per-student', type=int, default=10, help='Performance rows per student')
+    parser.add_argument('--interventions-per-student', type=int, default=2, help='Interventions per student')
+    parser.add_argument('--reset', action='store_true', help='Delete existing BENCH rows before seeding')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='Comma-separated endpoints to drive')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per endpoint')
+    parser.add_argument('--url', help='Benchmark a running server at this URL instead of in-process')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the response cache (in-process only)')
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--compare', help='Print p95 changes against an earlier --json file')
+    args = parser.parse_args()
+
+    if args.reset:
+        with db.db_cursor() as (conn, cursor):
+            reset_bench_data(cursor)
+            conn.commit()
+    if args.seed_students:
+        seed(args.seed_students, args.performance_per_student, args.interventions_per_student)
+
+    student_ids = bench_student_ids(10000)
+    if not student_ids:
+        parser.error('No BENCH students in the database; run with --seed-students first')
+    client = HTTPClient(args.url) if args.url else InProcessClient(cache=not args.no_cache)
+
+    rng = random.Random(1)
+    results = {}
+    for name in [e.strip() for e in args.endpoints.split(',') if e.strip()]:
+        results[name] = run_endpoint(client, endpoint_paths(name, student_ids, rng), args.requests,
+                                     args.concurrency, args.warmup)
+
+    print(f"{'endpoint':<16} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'errors':>7} {'queries':>8}")
+    for name, r in results.items():
+        queries = f"{r['queries_per_request']:.1f}" if r['queries_per_request'] is not None else '-'
+        print(f"{name:<16} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+              f"{r['throughput_rps']:>9.1f} {r['errors']:>7} {queries:>8}")
+    if args.compare:
+        compare(results, args.compare)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fo:
+            json.dump({
+                'revision': git_revision(),
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'mode': 'http' if args.url else 'in-process',
+                'cache': None if args.url else not args.no_cache,
+                'requests': args.requests,
+                'concurrency': args.concurrency,
+                'sampled_students': len(student_ids),
+                'results': results,
+            }, fo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark python.py's preprocessing stage on synthetic student records.
+
+Reports wall-clock seconds and peak traced memory, both scaled to one million
+rows, for three modes: a preprocessed copy, in place, and over streamed chunks.
+
+    python bench_preprocess.py --rows 1000000 --chunk-rows 100000 [--json out.json]
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from python import preprocess, preprocess_chunks
+
+
+def synthetic_records(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'student_id': np.arange(rows).astype(str),
+        'first_name': 'Student',
+        'program': pd.Categorical(rng.choice(['BSc Mathematics', 'BSc Physics', 'BA Education'], rows)),
+        'attendance_rate': rng.uniform(40, 100, rows).astype(np.float32),
+        'lms_activity': rng.uniform(0, 100, rows).astype(np.float32),
+        'assessment_avg': rng.uniform(0, 100, rows).astype(np.float32),
+    })
+
+
+def _copy(df, chunk_rows):
+    preprocess(df, verbose=False)
+
+
+def _inplace(df, chunk_rows):
+    preprocess(df, inplace=True, verbose=False)
+
+
+def _chunked(df, chunk_rows):
+    chunks = (df.iloc[start:start + chunk_rows].copy() for start in range(0, len(df), chunk_rows))
+    for _ in preprocess_chunks(chunks):
+        pass
+
+
+MODES = {'copy': _copy, 'inplace': _inplace, 'chunked': _chunked}
+
+
+def run(rows, chunk_rows, repeat):
+    results = {}
+    per_million = 1_000_000 / rows
+    for name, fn in MODES.items():
+        seconds, peaks = [], []
+        for _ in range(repeat):
+            df = synthetic_records(rows)
+            gc.collect()
+            tracemalloc.start()
+            start = time.perf_counter()
+            fn(df, chunk_rows)
+            seconds.append(time.perf_counter() - start)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            del df
+        results[name] = {
+            'seconds_per_million_rows': round(min(seconds) * per_million, 4),
+            'peak_mb_per_million_rows': round(max(peaks) / 2 ** 20 * per_million, 2),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark training-data preprocessing.')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Synthetic rows to preprocess')
+    parser.add_argument('--chunk-rows', type=int, default=100_000, help='Rows per chunk in chunked mode')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per mode (best time, worst peak)')
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args()
+
+    results = run(args.rows, args.chunk_rows, args.repeat)
+    print(f"{'mode':<10} {'s / 1M rows':>12} {'peak MB / 1M rows':>18}")
+    for name, result in results.items():
+        print(f"{name:<10} {result['seconds_per_million_rows']:>12.4f} {result['peak_mb_per_million_rows']:>18.2f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fo:
+            json.dump({'rows': args.rows, 'chunk_rows': args.chunk_rows, 'results': results}, fo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+"""
+MySQL connection pooling for the Flask API and the background jobs.
+
+Connections are created on demand up to ``DB_POOL_SIZE`` and handed back to the
+pool when the caller closes them, so existing ``conn.close()`` calls keep working.
+A connection that has been idle longer than the health-check interval is pinged
+before it is handed out. Prefer the ``db_connection()`` / ``db_cursor()`` context
+managers in new code: they return the connection even on early ``return`` paths.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import errorcode
+
+logger = logging.getLogger(__name__)
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "user": os.getenv("DB_USER", "root"),
+    "password": os.getenv("DB_PASSWORD", "12345"),
+    "database": os.getenv("DB_NAME", "Unizulu_db")
+}
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+POOL_CONFIG = {
+    # Maximum number of open connections per process
+    "size": int(os.getenv("DB_POOL_SIZE", "10")),
+    # Seconds a request waits for a free connection before giving up
+    "timeout": float(os.getenv("DB_POOL_TIMEOUT", "5")),
+    # Connections idle for longer than this are pinged before reuse
+    "health_check_interval": float(os.getenv("DB_POOL_HEALTH_CHECK_SECONDS", "30"))
+}
+
+
+class DatabaseUnavailable(Exception):
+    """Raised by the context managers when no connection could be obtained."""
+
+
+# Wraps every cursor handed out by pooled connections (see set_cursor_wrapper)
+_cursor_wrapper = None
+
+
+def set_cursor_wrapper(wrapper):
+    """Install ``wrapper(cursor) -> cursor`` for all pooled connections, e.g. for instrumentation."""
+    global _cursor_wrapper
+    _cursor_wrapper = wrapper
+
+
+class PooledConnection:
+    """Proxy around a MySQL connection whose ``close()`` returns it to the pool."""
+
+    def __init__(self, pool, cnx):
+        self._pool = pool
+        self._cnx = cnx
+
+    def __getattr__(self, name):
+        return getattr(self._cnx, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._cnx.cursor(*args, **kwargs)
+        return _cursor_wrapper(cursor) if _cursor_wrapper is not None else cursor
+
+    def close(self):
+        if self._cnx is not None:
+            cnx, self._cnx = self._cnx, None
+            self._pool.release(cnx)
+
+
+class ConnectionPool:
+    def __init__(self, config, size=10, timeout=5.0, health_check_interval=30.0):
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        # LIFO keeps the most recently used (warm) connections in circulation
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "connections_created": 0,
+            "health_check_failures": 0,
+        }
+
+    def _connect(self):
+        cnx = mysql.connector.connect(**self.config)
+        with self._lock:
+            self._stats["connections_created"] += 1
+        return cnx
+
+    def acquire(self):
+        """Check out a connection, waiting up to ``timeout`` seconds for a free one."""
+        start = time.perf_counter()
+        waited = False
+        try:
+            cnx, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    cnx, last_used = self._connect(), time.monotonic()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                waited = True
+                try:
+                    cnx, last_used = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._stats["timeouts"] += 1
+                    raise DatabaseUnavailable(
+                        f"No database connection free after {self.timeout}s (pool size {self.size})")
+
+        if time.monotonic() - last_used > self.health_check_interval:
+            cnx = self._check_health(cnx)
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+            self._stats["wait_seconds_total"] += elapsed
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], elapsed)
+        return PooledConnection(self, cnx)
+
+    def _check_health(self, cnx):
+        try:
+            cnx.ping(reconnect=True, attempts=1, delay=0)
+            return cnx
+        except mysql.connector.Error:
+            with self._lock:
+                self._stats["health_check_failures"] += 1
+            self._discard(cnx)
+            with self._lock:
+                self._created += 1
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+    def _discard(self, cnx):
+        with self._lock:
+            self._created -= 1
+        try:
+            cnx.close()
+        except Exception:
+            pass
+
+    def release(self, cnx):
+        """Return a connection to the pool, rolling back any open transaction."""
+        try:
+            if cnx.unread_result:
+                cnx.consume_results()
+            if cnx.in_transaction:
+                cnx.rollback()
+        except mysql.connector.Error:
+            self._discard(cnx)
+            return
+        self._idle.put((cnx, time.monotonic()))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open_connections"] = self._created
+        stats["idle_connections"] = self._idle.qsize()
+        stats["in_use"] = stats["open_connections"] - stats["idle_connections"]
+        stats["size"] = self.size
+        stats["timeout"] = self.timeout
+        stats["health_check_interval"] = self.health_check_interval
+        checkouts = stats["checkouts"] or 1
+        stats["wait_seconds_avg"] = stats["wait_seconds_total"] / checkouts
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _reset_pool_after_fork():
+    # Sockets opened by the parent must not be shared with forked workers
+    global _pool
+    _pool = None
+
+
+os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use (after any fork)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_CONFIG, **POOL_CONFIG)
+    return _pool
+
+
+def get_db_connection():
+    """Check out a pooled connection, or return None if the database is unreachable."""
+    try:
+        return get_pool().acquire()
+    except (mysql.connector.Error, DatabaseUnavailable) as err:
+        logger.error(f"Error connecting to MySQL database: {err}")
+        return None
+
+
+@contextmanager
+def db_connection():
+    """Yield a pooled connection and always return it to the pool."""
+    conn = get_db_connection()
+    if conn is None:
+        raise DatabaseUnavailable("Database connection error")
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def db_cursor(dictionary=False, conn=None):
+    """
+    Yield ``(conn, cursor)`` and close both afterwards.
+
+    Pass ``conn`` to open a cursor on a connection the caller already holds;
+    that connection is then left open for the caller to close.
+    """
+    if conn is not None:
+        cursor = conn.cursor(dictionary=dictionary)
+        try:
+            yield conn, cursor
+        finally:
+            cursor.close()
+        return
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=dictionary)
+        try:
+            yield conn, cursor
+        finally:
+            cursor.close()
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+# Upper bound on placeholders per IN (...) clause
+IN_CLAUSE_CHUNK_SIZE = 1000
+
+
+def chunked(items, size=IN_CLAUSE_CHUNK_SIZE):
+    """Yield successive slices of ``items`` of at most ``size`` elements."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def placeholders(n):
+    """Return ``%s, %s, ...`` with n placeholders for an IN (...) clause."""
+    return ', '.join(['%s'] * n)
+
+
+def apply_schema(path=SCHEMA_PATH):
+    """
+    Create the tables and indexes the API maintains on top of the core schema.
+
+    Every statement in schema.sql is idempotent (CREATE ... IF NOT EXISTS), and
+    index statements that hit an existing index name are skipped.
+    """
+    with open(path, encoding="utf-8") as fh:
+        lines = [line for line in fh if not line.lstrip().startswith("--")]
+    statements = [s.strip() for s in "".join(lines).split(";") if s.strip()]
+    with db_cursor() as (conn, cursor):
+        for statement in statements:
+            try:
+                cursor.execute(statement)
+            except mysql.connector.Error as err:
+                if err.errno != errorcode.ER_DUP_KEYNAME:
+                    raise
+        conn.commit()
+    return len(statements)
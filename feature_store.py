@@ -0,0 +1,214 @@
+"""
+In-memory store of the model's feature vector per student.
+
+Feature values live in one float64 matrix with a row per student and a column
+per model feature, plus a dict from student_id to row. Rows are kept dense (a
+removed student's slot is filled with the last row), so ``view()`` and
+``to_frame()`` hand out zero-copy slices of the live matrix.
+
+Write endpoints refresh the rows of the students they touched from the database
+with ``refresh``, using the same queries as inference (build_feature_matrix).
+Readers call ``get_features(ids)``; rows older than FEATURE_STORE_TTL_SECONDS, or
+missing, are re-read first when a cursor is given, which bounds staleness when
+several server processes each keep their own store.
+
+Training reads an exported copy:
+
+    python feature_store.py --export features/
+    python python.py --features features/
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from inference import MODEL_FEATURES, build_feature_matrix
+
+logger = logging.getLogger(__name__)
+
+FEATURE_STORE_TTL_SECONDS = float(os.getenv('FEATURE_STORE_TTL_SECONDS', '300'))
+INITIAL_CAPACITY = 1024
+
+
+class FeatureStore:
+    def __init__(self, columns=MODEL_FEATURES, ttl_seconds=FEATURE_STORE_TTL_SECONDS, capacity=INITIAL_CAPACITY):
+        self.columns = list(columns)
+        self.ttl_seconds = ttl_seconds
+        self._values = np.full((capacity, len(self.columns)), np.nan)
+        self._ids = np.empty(capacity, dtype=object)
+        # time.monotonic() of each row's last refresh
+        self._refreshed = np.zeros(capacity)
+        self._index = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, student_id):
+        return str(student_id) in self._index
+
+    def _grow(self, needed):
+        capacity = len(self._values)
+        while capacity < needed:
+            capacity *= 2
+        if capacity == len(self._values):
+            return
+        values = np.full((capacity, len(self.columns)), np.nan)
+        values[:len(self)] = self._values[:len(self)]
+        ids = np.empty(capacity, dtype=object)
+        ids[:len(self)] = self._ids[:len(self)]
+        refreshed = np.zeros(capacity)
+        refreshed[:len(self)] = self._refreshed[:len(self)]
+        self._values, self._ids, self._refreshed = values, ids, refreshed
+
+    def put(self, features):
+        """Insert or overwrite rows from a DataFrame indexed by student_id."""
+        if features.empty:
+            return
+        ids = [str(sid) for sid in features.index]
+        values = features.reindex(columns=self.columns).to_numpy(dtype=float)
+        with self._lock:
+            self._grow(len(self) + len(ids))
+            rows = np.empty(len(ids), dtype=np.intp)
+            for i, student_id in enumerate(ids):
+                row = self._index.get(student_id)
+                if row is None:
+                    row = len(self._index)
+                    self._index[student_id] = row
+                    self._ids[row] = student_id
+                rows[i] = row
+            self._values[rows] = values
+            self._refreshed[rows] = time.monotonic()
+
+    def discard(self, student_id):
+        """Remove a student; the last row moves into its slot to keep rows dense."""
+        with self._lock:
+            row = self._index.pop(str(student_id), None)
+            if row is None:
+                return
+            last = len(self._index)
+            if row != last:
+                moved = self._ids[last]
+                self._values[row] = self._values[last]
+                self._ids[row] = moved
+                self._refreshed[row] = self._refreshed[last]
+                self._index[moved] = row
+            self._values[last] = np.nan
+            self._ids[last] = None
+
+    def refresh(self, cursor, student_ids):
+        """Re-read the given students' features from the database and return them."""
+        features = build_feature_matrix(cursor, student_ids)
+        self.put(features)
+        return features
+
+    def load(self, cursor):
+        """Replace the contents with the features of every student in the database."""
+        cursor.execute("SELECT student_id FROM students")
+        student_ids = [str(row[0]) for row in cursor.fetchall()]
+        features = build_feature_matrix(cursor, student_ids)
+        with self._lock:
+            self._index = {}
+            self._ids[:] = None
+            self._values[:] = np.nan
+            self.put(features)
+        logger.info(f"Feature store loaded for {len(self)} students")
+
+    def get_features(self, student_ids, cursor=None):
+        """
+        Return a DataFrame of features for ``student_ids``, in that order.
+
+        With a cursor, students that are missing or older than the TTL are
+        re-read from the database first; without one they come back as NaN rows
+        (missing) or as stored (expired).
+        """
+        student_ids = list(dict.fromkeys(str(sid) for sid in student_ids))
+        if cursor is not None:
+            cutoff = time.monotonic() - self.ttl_seconds
+            with self._lock:
+                stale = [sid for sid in student_ids
+                         if sid not in self._index or self._refreshed[self._index[sid]] < cutoff]
+            if stale:
+                self.refresh(cursor, stale)
+            self.misses += len(stale)
+            self.hits += len(student_ids) - len(stale)
+        with self._lock:
+            rows = np.array([self._index.get(sid, -1) for sid in student_ids], dtype=np.intp)
+            values = np.full((len(student_ids), len(self.columns)), np.nan)
+            found = rows >= 0
+            values[found] = self._values[rows[found]]
+        return pd.DataFrame(values, index=pd.Index(student_ids, name='student_id'), columns=self.columns)
+
+    def view(self):
+        """
+        Zero-copy, read-only ``(student_ids, values)`` of every stored row.
+
+        The arrays share memory with the store, so later writes show through
+        until the store next grows.
+        """
+        with self._lock:
+            n = len(self)
+            values = self._values[:n].view()
+            ids = self._ids[:n].view()
+        values.flags.writeable = False
+        ids.flags.writeable = False
+        return ids, values
+
+    def to_frame(self):
+        """DataFrame over ``view()`` without copying the feature matrix."""
+        ids, values = self.view()
+        return pd.DataFrame(values, index=pd.Index(ids, name='student_id'), columns=self.columns, copy=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'students': len(self),
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+    def export(self, directory):
+        """Write the store as .npy files that load_features can memory-map."""
+        os.makedirs(directory, exist_ok=True)
+        ids, values = self.view()
+        np.save(os.path.join(directory, 'values.npy'), values)
+        np.save(os.path.join(directory, 'student_id.npy'), ids.astype(str))
+        with open(os.path.join(directory, 'columns.json'), 'w', encoding='utf-8') as fo:
+            json.dump(self.columns, fo)
+
+
+def load_features(directory):
+    """Open an exported store as a DataFrame backed by a read-only memory map."""
+    values = np.load(os.path.join(directory, 'values.npy'), mmap_mode='r')
+    ids = np.load(os.path.join(directory, 'student_id.npy'))
+    with open(os.path.join(directory, 'columns.json'), encoding='utf-8') as fo:
+        columns = json.load(fo)
+    return pd.DataFrame(values, index=pd.Index(ids, name='student_id'), columns=columns, copy=False)
+
+
+def main():
+    from db import db_cursor
+
+    parser = argparse.ArgumentParser(description='Build and export the student feature store.')
+    parser.add_argument('--export', required=True, help='Directory to write the feature files to')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = FeatureStore()
+    with db_cursor() as (conn, cursor):
+        store.load(cursor)
+    store.export(args.export)
+    logger.info(f"Exported features for {len(store)} students to {args.export}")
+
+
+if __name__ == '__main__':
+    main()
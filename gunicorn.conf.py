@@ -0,0 +1,69 @@
+"""
+Gunicorn settings for serving the API in production.
+
+Gunicorn reads this file from the working directory:
+
+    gunicorn app1:app
+
+The app is imported once in the master (preload_app). The model is loaded and
+init_database run there too, before any worker forks, so workers share the
+model's memory copy-on-write and start serving warm. Connection pools, caches
+and worker threads are reset in each child (os.register_at_fork) and created
+again on first use. The alert worker and notification follower are started per
+worker after the fork.
+
+Workers share nothing in memory. With more than one worker:
+- The response cache must be shared: startup fails unless CACHE_REDIS_URL
+  points at a working server or CACHE_ENABLED=0, since an invalidation would
+  only reach the worker that made the write.
+- Each worker's notification broker polls for interventions created through the
+  others every NOTIFICATION_POLL_SECONDS (set to 2 here unless given), so events
+  can arrive that much later. A single worker does not poll.
+  Event cursors are per worker, so route SSE and long-poll clients to the same
+  worker (sticky sessions) or have them reload the list after reconnecting.
+  Each worker lets NOTIFICATION_MAX_WAITERS streams and long-polls hold a
+  thread at once (keep it below WEB_THREADS); extra streams get 503 and extra
+  long-polls are answered immediately.
+- Login caches, logouts and the search index are per worker. Deleted accounts
+  are refused everywhere within SESSION_ACCOUNT_CHECK_SECONDS.
+
+WEB_CONCURRENCY worker processes (default: one per CPU) each run WEB_THREADS
+request threads. Keep WEB_THREADS at or below DB_POOL_SIZE, or requests queue
+for connections. Each worker hashes passwords in its own HASH_WORKERS
+processes, so that default drops to 1 here.
+
+Compare with the dev server by pointing bench_endpoints.py --url at each.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+worker_class = os.getenv('WORKER_CLASS', 'gthread')
+threads = int(os.getenv('WEB_THREADS', '8'))
+preload_app = True
+# Uploads are ingested in the background, but workbooks can still take a while to arrive
+timeout = int(os.getenv('WEB_TIMEOUT', '120'))
+keepalive = 5
+accesslog = '-'
+
+os.environ.setdefault('HASH_WORKERS', '1')
+if workers > 1:
+    os.environ.setdefault('NOTIFICATION_POLL_SECONDS', '2')
+
+
+def when_ready(server):
+    # Master, after the preloaded import and before the first fork
+    import app1
+    from response_cache import RedisBackend
+    app1.model_registry.preload()
+    app1.init_database(start_workers=False)
+    if workers > 1 and app1.response_cache.enabled and not isinstance(app1.response_cache.backend, RedisBackend):
+        raise RuntimeError(f"The response cache is per process, so {workers} workers would serve stale responses; "
+                           "set CACHE_REDIS_URL to a reachable Redis server or CACHE_ENABLED=0")
+    server.log.info(f"Model {app1.model_registry.version} preloaded; starting {workers} workers")
+
+
+def post_worker_init(worker):
+    import app1
+    app1.start_background_workers()
@@ -0,0 +1,218 @@
+"""
+Model-backed risk scoring for one or many students.
+
+Features are pulled for a whole set of students with one grouped query per
+source table, and scored with a single ``predict_proba`` call. Concurrent
+requests are micro-batched: each request hands its rows to a background worker,
+which waits a few milliseconds for other requests and scores them all together.
+"""
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+from db import chunked, placeholders
+from risk import classify_averages, classify_probabilities, CLASS_RISK_WEIGHTS, STORED_RECOMMENDATIONS
+
+logger = logging.getLogger(__name__)
+
+MODEL_FEATURES = ['attendance_rate', 'assignment_avg', 'test_score', 'lms_activity']
+
+# One query per source table; {ids} is replaced with the IN placeholders
+FEATURE_QUERIES = {
+    'attendance_rate': """
+        SELECT student_id, AVG(attendance_percentage) AS value
+        FROM attendance WHERE student_id IN ({ids}) GROUP BY student_id
+    """,
+    'assignment_avg': """
+        SELECT student_id, AVG(score / max_score) * 100 AS value
+        FROM assessments WHERE student_id IN ({ids}) GROUP BY student_id
+    """,
+    # Read from the running aggregates instead of the student's performance rows
+    'test_score': """
+        SELECT student_id, percentage_sum / record_count AS value
+        FROM performance_aggregates WHERE student_id IN ({ids}) AND record_count > 0
+    """,
+    'lms_activity': """
+        SELECT student_id, AVG(lms_activity_score) AS value
+        FROM lms_activity WHERE student_id IN ({ids}) GROUP BY student_id
+    """,
+}
+
+MICRO_BATCH_MAX_ROWS = int(os.getenv('MICRO_BATCH_MAX_ROWS', '256'))
+MICRO_BATCH_WAIT_MS = float(os.getenv('MICRO_BATCH_WAIT_MS', '5'))
+
+
+def build_feature_matrix(cursor, student_ids):
+    """
+    Return a DataFrame indexed by student_id with one column per model feature.
+
+    Students without rows in a source table get NaN for that feature.
+    """
+    student_ids = list(dict.fromkeys(str(sid) for sid in student_ids))
+    features = pd.DataFrame(index=pd.Index(student_ids, name='student_id'), columns=MODEL_FEATURES, dtype=float)
+    for feature, query in FEATURE_QUERIES.items():
+        for chunk in chunked(student_ids):
+            cursor.execute(query.format(ids=placeholders(len(chunk))), chunk)
+            rows = cursor.fetchall()
+            if rows:
+                if isinstance(rows[0], dict):
+                    rows = [(row['student_id'], row['value']) for row in rows]
+                ids, values = zip(*rows)
+                found = pd.Series(np.asarray(values, dtype=float), index=[str(sid) for sid in ids])
+                found = found[found.index.isin(features.index)]
+                features.loc[found.index, feature] = found
+    return features
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent ``predict_proba`` calls into one.
+
+    ``submit(frame)`` returns a Future. A daemon worker takes the first pending
+    frame, collects whatever else arrives within ``max_wait_ms`` (up to
+    ``max_rows`` rows), scores the concatenation once and splits the result.
+    """
+
+    def __init__(self, predict_fn, max_rows=MICRO_BATCH_MAX_ROWS, max_wait_ms=MICRO_BATCH_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_rows = max_rows
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # Threads do not survive fork; the child starts its own worker on demand
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, frame):
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((frame, future))
+        return future
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name='risk-micro-batcher', daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            rows = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.max_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                rows += len(item[0])
+            self._score(pending)
+
+    def _score(self, pending):
+        try:
+            combined = pd.concat([frame for frame, _ in pending]) if len(pending) > 1 else pending[0][0]
+            probabilities = self.predict_fn(combined)
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.rows += len(combined)
+        offset = 0
+        for frame, future in pending:
+            future.set_result(probabilities[offset:offset + len(frame)])
+            offset += len(frame)
+
+
+class InferenceService:
+    """Scores feature matrices with the registry's model, falling back to thresholds."""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.batcher = MicroBatcher(self._predict_proba)
+
+    def _predict_proba(self, features):
+        model = self.registry.get()
+        columns = list(getattr(model, 'feature_names_in_', MODEL_FEATURES))
+        probabilities = model.predict_proba(features[columns])
+        weights = np.array([CLASS_RISK_WEIGHTS.get(c, 0.0) for c in model.classes_])
+        return probabilities @ weights
+
+    def score(self, features):
+        """
+        Score a feature matrix and return a DataFrame with risk_score, risk_level,
+        recommendation and scored_by ('model' or 'thresholds') per student.
+
+        Rows with every feature present are scored by the model in one
+        micro-batched ``predict_proba`` call. Rows with missing features, or all
+        rows when no model is loaded, fall back to the performance-average bands.
+        """
+        result = pd.DataFrame(index=features.index)
+        test_score = features['test_score']
+        result['average_percentage'] = test_score.fillna(0).round(2)
+        # Threshold fallback: the band of the performance average, and a score that
+        # grows as the average drops
+        result['risk_level'] = classify_averages(test_score)
+        result['risk_score'] = (1 - test_score / 100).clip(0, 1).fillna(0)
+        result['scored_by'] = 'thresholds'
+
+        complete = features.notna().all(axis=1)
+        if complete.any() and self.registry.get() is not None:
+            try:
+                scores = self.batcher.submit(features[complete]).result()
+            except Exception as e:
+                logger.error(f"Model scoring failed, using threshold bands: {e}")
+            else:
+                result.loc[complete, 'risk_score'] = scores
+                result.loc[complete, 'risk_level'] = classify_probabilities(scores)
+                result.loc[complete, 'scored_by'] = 'model'
+
+        result['risk_score'] = result['risk_score'].astype(float).round(4)
+        result['recommendation'] = result['risk_level'].map(STORED_RECOMMENDATIONS)
+        return result
+
+    def stats(self):
+        return {
+            'model_version': self.registry.version,
+            'micro_batches': self.batcher.batches,
+            'rows_scored': self.batcher.rows,
+        }
+
+
+def store_predictions(cursor, scored):
+    """Upsert scored rows into risk_predictions with a single executemany."""
+    today = datetime.datetime.now().date()
+    rows = [
+        (student_id, row.risk_level, today, row.recommendation, float(row.risk_score))
+        for student_id, row in scored.iterrows()
+    ]
+    if rows:
+        cursor.executemany("""
+            INSERT INTO risk_predictions (student_id, risk_level, prediction_date, recommendation, risk_score)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                risk_level = VALUES(risk_level),
+                prediction_date = VALUES(prediction_date),
+                recommendation = VALUES(recommendation),
+                risk_score = VALUES(risk_score)
+        """, rows)
+    return len(rows)
@@ -0,0 +1,501 @@
+"""
+Background ingestion of uploaded ``unizulu_*.xlsx`` workbooks.
+
+Two layouts are understood:
+
+* the multi-sheet workbook produced by Upload.html, with ``Students``,
+  ``Performance``, ``Attendance``, ``LMS_Activity`` and ``Assessments`` sheets
+  whose header rows use the database column names;
+* the single-sheet records file (``unizulu_student_records.xlsx``) with one row
+  per student: ``Student_Number, First_Name, Surname, Test1..3, Quiz1..2,
+  Assignment, Attendance, Email, Password``, either in separate cells or
+  comma-joined in the first cell.
+
+Workbooks are opened with ``read_only=True`` and streamed row by row. Valid rows
+are buffered and written with ``executemany`` in one transaction per chunk;
+invalid rows are counted and the first errors are kept on the job. When every
+sheet is written, the touched students are scored once in batches. Passwords in
+the records file are not imported.
+
+``IngestionService.write_records`` runs the same validation and chunked writes
+synchronously for records sent to the bulk API endpoints as JSON or CSV
+(``csv_records``).
+"""
+import collections
+import csv
+import datetime
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import openpyxl
+
+from aggregates import (add_attendance_to_rollup, add_rows_to_rollup, refresh_aggregates,
+                        subtract_attendance_from_rollup)
+from db import chunked, db_cursor, placeholders
+from inference import store_predictions
+from risk import grade_for_percentage
+from summary import refresh_student_summary
+
+logger = logging.getLogger(__name__)
+
+INGEST_CHUNK_SIZE = int(os.getenv('INGEST_CHUNK_SIZE', '1000'))
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '1'))
+# Errors kept per job; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+# Most records accepted by one write_records call (one bulk API request)
+BULK_MAX_ROWS = int(os.getenv('BULK_MAX_ROWS', '50000'))
+# Finished jobs kept for the progress endpoint
+MAX_FINISHED_JOBS = 100
+
+DEFAULT_PROGRAM = 'Unassigned'
+# Start of the error for rows whose student does not exist
+UNKNOWN_STUDENT = 'Unknown student'
+DEFAULT_SUBJECT = ('GEN101', 'General Assessment')
+
+# Marks in the records file and what they are out of
+RECORD_ASSESSMENTS = [
+    ('test1', 'Test', 100),
+    ('test2', 'Test', 100),
+    ('test3', 'Test', 100),
+    ('quiz1', 'Quiz', 20),
+    ('quiz2', 'Quiz', 20),
+    ('assignment', 'Assignment', 100),
+]
+
+# Written in this order inside each transaction so foreign keys resolve
+TABLE_SQL = collections.OrderedDict([
+    ('students', """
+        INSERT INTO students (student_id, first_name, last_name, program, email, year_of_study)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            first_name = VALUES(first_name),
+            last_name = VALUES(last_name),
+            program = COALESCE(VALUES(program), program),
+            email = COALESCE(VALUES(email), email),
+            year_of_study = COALESCE(VALUES(year_of_study), year_of_study)
+    """),
+    ('performance', """
+        INSERT INTO performance (
+            student_id, subject_code, subject_name, mark, max_mark, grade,
+            assessment_type, assessment_date, semester, academic_year
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """),
+    ('attendance', """
+        INSERT INTO attendance (student_id, course_id, attendance_percentage)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE attendance_percentage = VALUES(attendance_percentage)
+    """),
+    ('lms_activity', """
+        INSERT INTO lms_activity (student_id, lms_activity_score)
+        VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE lms_activity_score = VALUES(lms_activity_score)
+    """),
+    ('assessments', """
+        INSERT INTO assessments (student_id, course_id, assessment_type, score, max_score)
+        VALUES (%s, %s, %s, %s, %s)
+    """),
+])
+
+
+# --- Cell parsing ---------------------------------------------------------
+
+def _text(value, field, required=False):
+    if value is None or str(value).strip() == '':
+        if required:
+            raise ValueError(f"{field} is required")
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _number(value, field, required=True, minimum=None, maximum=None):
+    if value is None or str(value).strip() == '':
+        if required:
+            raise ValueError(f"{field} is required")
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number, got {value!r}")
+    if minimum is not None and number < minimum:
+        raise ValueError(f"{field} must be at least {minimum}, got {number:g}")
+    if maximum is not None and number > maximum:
+        raise ValueError(f"{field} must be at most {maximum}, got {number:g}")
+    return number
+
+
+def _date(value, field):
+    if value is None or str(value).strip() == '':
+        return datetime.date.today()
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value).strip()[:10])
+    except ValueError:
+        raise ValueError(f"{field} must be a YYYY-MM-DD date, got {value!r}")
+
+
+def _performance_row(student_id, subject_code, subject_name, mark, max_mark, assessment_type,
+                     assessment_date, semester, academic_year, grade=None):
+    if mark > max_mark:
+        raise ValueError(f"mark {mark:g} exceeds max_mark {max_mark:g}")
+    grade = grade or grade_for_percentage(mark / max_mark * 100)
+    return (student_id, subject_code, subject_name, mark, max_mark, grade,
+            assessment_type, assessment_date, semester, academic_year)
+
+
+# --- Row converters: header-keyed row -> {table: [row, ...]} ---------------
+
+def _convert_student(row):
+    student_id = _text(row.get('student_id'), 'student_id', required=True)
+    year = _number(row.get('year_of_study'), 'year_of_study', required=False, minimum=1)
+    return {'students': [(
+        student_id,
+        _text(row.get('first_name'), 'first_name', required=True),
+        _text(row.get('last_name'), 'last_name', required=True),
+        _text(row.get('program'), 'program') or DEFAULT_PROGRAM,
+        _text(row.get('email'), 'email'),
+        int(year) if year is not None else None,
+    )]}
+
+
+def _convert_performance(row):
+    max_mark = _number(row.get('max_mark'), 'max_mark', minimum=0)
+    if max_mark == 0:
+        raise ValueError("max_mark must be positive")
+    academic_year = _number(row.get('academic_year'), 'academic_year', required=False)
+    return {'performance': [_performance_row(
+        _text(row.get('student_id'), 'student_id', required=True),
+        _text(row.get('subject_code'), 'subject_code', required=True),
+        _text(row.get('subject_name'), 'subject_name', required=True),
+        _number(row.get('mark'), 'mark', minimum=0),
+        max_mark,
+        _text(row.get('assessment_type'), 'assessment_type', required=True),
+        _date(row.get('assessment_date'), 'assessment_date'),
+        _text(row.get('semester'), 'semester') or '2',
+        int(academic_year) if academic_year is not None else datetime.date.today().year,
+        grade=_text(row.get('grade'), 'grade'),
+    )]}
+
+
+def _convert_attendance(row):
+    course_id = _number(row.get('course_id'), 'course_id', required=False)
+    return {'attendance': [(
+        _text(row.get('student_id'), 'student_id', required=True),
+        int(course_id) if course_id is not None else 1,
+        _number(row.get('attendance_percentage'), 'attendance_percentage', minimum=0, maximum=100),
+    )]}
+
+
+def _convert_lms_activity(row):
+    return {'lms_activity': [(
+        _text(row.get('student_id'), 'student_id', required=True),
+        _number(row.get('lms_activity_score'), 'lms_activity_score', minimum=0),
+    )]}
+
+
+def _convert_assessment(row):
+    max_score = _number(row.get('max_score'), 'max_score', minimum=0)
+    if max_score == 0:
+        raise ValueError("max_score must be positive")
+    score = _number(row.get('score'), 'score', minimum=0, maximum=max_score)
+    course_id = _number(row.get('course_id'), 'course_id', required=False)
+    return {'assessments': [(
+        _text(row.get('student_id'), 'student_id', required=True),
+        int(course_id) if course_id is not None else 1,
+        _text(row.get('assessment_type'), 'assessment_type', required=True),
+        score,
+        max_score,
+    )]}
+
+
+def _convert_record(row):
+    """One row of the records file: a student, their marks and their attendance."""
+    student_id = _text(row.get('student_number'), 'Student_Number', required=True)
+    tables = {
+        'students': [(
+            student_id,
+            _text(row.get('first_name'), 'First_Name', required=True),
+            _text(row.get('surname'), 'Surname', required=True),
+            DEFAULT_PROGRAM,
+            _text(row.get('email'), 'Email'),
+            None,
+        )],
+        'performance': [],
+    }
+    today = datetime.date.today()
+    subject_code, subject_name = DEFAULT_SUBJECT
+    for column, assessment_type, max_mark in RECORD_ASSESSMENTS:
+        mark = _number(row.get(column), column.capitalize(), required=False, minimum=0, maximum=max_mark)
+        if mark is not None:
+            tables['performance'].append(_performance_row(
+                student_id, subject_code, subject_name, mark, max_mark, assessment_type,
+                today, '2', today.year))
+    attendance = _number(row.get('attendance'), 'Attendance', required=False, minimum=0, maximum=100)
+    if attendance is not None:
+        # Stored as a fraction in the records file, as a percentage in the database
+        percentage = attendance * 100 if attendance <= 1 else attendance
+        tables['attendance'] = [(student_id, 1, round(percentage, 2))]
+    return tables
+
+
+# Multi-sheet layout, processed in this order so students exist before their rows
+SHEET_CONVERTERS = collections.OrderedDict([
+    ('students', _convert_student),
+    ('performance', _convert_performance),
+    ('attendance', _convert_attendance),
+    ('lms_activity', _convert_lms_activity),
+    ('assessments', _convert_assessment),
+])
+
+
+def _header_and_rows(worksheet):
+    """Yield the normalised header and then each data row as a list of cells."""
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if not header:
+        return None, iter(())
+    # The records file keeps each row comma-joined in the first cell
+    joined = len([c for c in header if c is not None]) == 1 and ',' in str(header[0])
+    if joined:
+        header = str(header[0]).split(',')
+        rows = (str(row[0]).split(',') if row and row[0] is not None else [] for row in rows)
+    header = [str(c).strip().lower() if c is not None else '' for c in header]
+    return header, rows
+
+
+def csv_records(stream):
+    """Yield ``(line_number, record)`` for each non-blank row of a CSV text stream with a header."""
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if not header:
+        return
+    header = [c.strip().lower() for c in header]
+    for cells in reader:
+        if any(c.strip() for c in cells):
+            yield reader.line_num, dict(zip(header, cells))
+
+
+class IngestionJob:
+    """Progress of one workbook; read by the progress endpoint while the worker updates it."""
+
+    def __init__(self, filename, max_errors=MAX_REPORTED_ERRORS):
+        self.job_id = uuid.uuid4().hex
+        self.filename = filename
+        self.status = 'queued'
+        self.sheet = None
+        self.rows_read = 0
+        self.rows_written = 0
+        self.rows_rejected = 0
+        self.students_scored = 0
+        self.errors = []
+        self.max_errors = max_errors
+        self.error = None
+        self.created_at = datetime.datetime.now()
+        self.finished_at = None
+
+    def reject(self, sheet, row_number, message):
+        self.rows_rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'sheet': sheet, 'row': row_number, 'error': message})
+
+    @property
+    def finished(self):
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'filename': self.filename,
+            'status': self.status,
+            'sheet': self.sheet,
+            'rows_read': self.rows_read,
+            'rows_written': self.rows_written,
+            'rows_rejected': self.rows_rejected,
+            'students_scored': self.students_scored,
+            'errors': self.errors,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class IngestionService:
+    """Runs ingestion jobs on a small worker pool, off the request threads."""
+
+    def __init__(self, inference_service, feature_store, workers=INGEST_WORKERS, chunk_size=INGEST_CHUNK_SIZE,
+                 on_complete=None):
+        self.inference_service = inference_service
+        self.feature_store = feature_store
+        # Called after a job has written rows, e.g. to invalidate cached responses
+        self.on_complete = on_complete
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._jobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, path, filename):
+        """Queue the workbook at ``path`` (deleted when done) and return its job."""
+        job = IngestionJob(filename)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ingest')
+            self._jobs[job.job_id] = job
+            finished = [job_id for job_id, j in self._jobs.items() if j.finished]
+            for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self._jobs[job_id]
+            self._executor.submit(self._run, job, path)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def _run(self, job, path):
+        job.status = 'running'
+        try:
+            touched = self.ingest(job, path)
+            job.sheet = None
+            job.status = 'scoring'
+            self.rescore(job, touched)
+            job.status = 'completed'
+            logger.info(f"Ingested {job.filename}: {job.rows_written} rows written, "
+                        f"{job.rows_rejected} rejected, {job.students_scored} students scored")
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            logger.error(f"Ingestion of {job.filename} failed: {e}")
+        finally:
+            job.finished_at = datetime.datetime.now()
+            if self.on_complete is not None and job.rows_written:
+                self.on_complete()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def ingest(self, job, path):
+        """Stream every known sheet of the workbook into the database. Returns the touched student IDs."""
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            sheets = {ws.title.strip().lower(): ws for ws in workbook.worksheets}
+            touched = set()
+            known = set()
+            matched = [(name, sheets[name], convert) for name, convert in SHEET_CONVERTERS.items() if name in sheets]
+            if not matched:
+                # Single-sheet records file
+                matched = [(workbook.worksheets[0].title, workbook.worksheets[0], _convert_record)]
+            for name, worksheet, convert in matched:
+                job.sheet = name
+                self._ingest_sheet(job, name, worksheet, convert, touched, known)
+            return touched
+        finally:
+            workbook.close()
+
+    def write_records(self, name, records):
+        """
+        Validate and write ``(row_number, record)`` pairs for one SHEET_CONVERTERS
+        table now, in transactions of chunk_size rows.
+
+        Rows that fail validation or name an unknown student are reported on the
+        returned job, one error per row. Returns ``(job, touched_student_ids)``;
+        scoring the touched students is left to the caller. Chunks committed
+        before a database error stay written.
+        """
+        job = IngestionJob(f'{name} records', max_errors=BULK_MAX_ROWS)
+        job.status = 'running'
+        job.sheet = name
+        touched = set()
+        self._ingest_records(job, name, records, SHEET_CONVERTERS[name], touched, set())
+        job.status = 'completed'
+        job.finished_at = datetime.datetime.now()
+        return job, touched
+
+    def _ingest_sheet(self, job, name, worksheet, convert, touched, known):
+        header, rows = _header_and_rows(worksheet)
+        if header is None:
+            return
+        records = ((row_number, dict(zip(header, cells))) for row_number, cells in enumerate(rows, start=2)
+                   if any(c is not None and str(c).strip() != '' for c in cells))
+        self._ingest_records(job, name, records, convert, touched, known)
+
+    def _ingest_records(self, job, name, records, convert, touched, known):
+        pending = []
+        for row_number, record in records:
+            job.rows_read += 1
+            try:
+                pending.append((row_number, convert(record)))
+            except ValueError as e:
+                job.reject(name, row_number, str(e))
+            if len(pending) >= self.chunk_size:
+                self._write_chunk(job, name, pending, touched, known)
+                pending = []
+        if pending:
+            self._write_chunk(job, name, pending, touched, known)
+
+    def _write_chunk(self, job, name, pending, touched, known):
+        """Write one chunk of converted rows in a single transaction."""
+        with db_cursor() as (conn, cursor):
+            # Rows for students that are neither in this upload nor in the database are rejected
+            new_students = {tables['students'][0][0] for _, tables in pending if 'students' in tables}
+            referenced = {row[0] for _, tables in pending for table, rows in tables.items()
+                          if table != 'students' for row in rows}
+            unknown = referenced - known - new_students
+            for chunk in chunked(sorted(unknown)):
+                cursor.execute(f"SELECT student_id FROM students WHERE student_id IN ({placeholders(len(chunk))})",
+                               chunk)
+                known.update(str(r[0]) for r in cursor.fetchall())
+
+            batches = collections.defaultdict(list)
+            accepted = 0
+            for row_number, tables in pending:
+                missing = {row[0] for table, rows in tables.items() if table != 'students' for row in rows}
+                missing -= known | new_students
+                if missing:
+                    job.reject(name, row_number, f"{UNKNOWN_STUDENT} {', '.join(sorted(missing))}")
+                    continue
+                accepted += 1
+                for table, rows in tables.items():
+                    batches[table].extend(rows)
+
+            # Upserts replace attendance values, so those students leave the rollup and re-enter it
+            attendance_ids = sorted({row[0] for row in batches['attendance']})
+            attendance_where = f"student_id IN ({placeholders(len(attendance_ids))})"
+            if attendance_ids:
+                subtract_attendance_from_rollup(cursor, attendance_where, attendance_ids)
+            for table, sql in TABLE_SQL.items():
+                if batches[table]:
+                    cursor.executemany(sql, batches[table])
+            if attendance_ids:
+                add_attendance_to_rollup(cursor, attendance_where, attendance_ids)
+            students = {row[0] for rows in batches.values() for row in rows}
+            if batches['performance']:
+                refresh_aggregates(cursor, {row[0] for row in batches['performance']})
+                # (subject_code, semester, academic_year, day, mark, max_mark)
+                add_rows_to_rollup(cursor, [(r[1], r[8], r[9], r[7], r[3], r[4]) for r in batches['performance']])
+            conn.commit()
+
+        known.update(new_students)
+        touched.update(students)
+        job.rows_written += accepted
+
+    def rescore(self, job, student_ids):
+        """Score every touched student once, in batches, and refresh their summary rows."""
+        for chunk in chunked(sorted(student_ids)):
+            with db_cursor() as (conn, cursor):
+                scored = self.inference_service.score(self.feature_store.refresh(cursor, chunk))
+                store_predictions(cursor, scored)
+                refresh_student_summary(cursor, chunk)
+                conn.commit()
+            job.students_scored += len(chunk)
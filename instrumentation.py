@@ -0,0 +1,266 @@
+"""
+Per-request SQL and latency instrumentation for the Flask API.
+
+Every cursor from the connection pool is wrapped (db.set_cursor_wrapper) to
+count and time its statements against the current request. Each response gets
+a ``Server-Timing`` header, e.g. ``db;dur=3.2;desc="4 queries", app;dur=9.8``,
+so browser dev tools and bench_endpoints.py can see the split. Statements
+slower than SLOW_QUERY_MS are logged with their parameters replaced by type
+placeholders, since they can hold personal data or passwords.
+
+``/metrics`` serves per-route histograms of request latency, queries per request
+and time spent in SQL, in the Prometheus text format, plus any metrics other
+components add with ``register``. Statements run outside a
+request (ingestion, recomputation, alerts) are counted under route
+``background``. Metrics are per process; scrape every worker.
+
+Streamed responses are counted when the server closes them, so their latency
+covers the whole body. For an SSE stream that is the connection's lifetime.
+Their Server-Timing header is sent before the body and covers only the view.
+Statements run while the body is produced count under ``background``.
+
+Per request the cost is a few ``perf_counter`` calls and counter increments;
+set INSTRUMENTATION_ENABLED=0 to turn it off.
+"""
+import bisect
+import collections
+import logging
+import os
+import re
+import threading
+import time
+
+from flask import g, request
+
+import db
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED', '1') != '0'
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+# Longest statement text written to the slow query log
+SLOW_QUERY_MAX_CHARS = 500
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+QUERY_COUNT_BUCKETS = [0, 1, 2, 3, 5, 8, 13, 21, 34, 55]
+
+BACKGROUND_ROUTE = 'background'
+
+_WHITESPACE = re.compile(r'\s+')
+_local = threading.local()
+
+
+def redact(params):
+    """Replace parameter values with their type names for logging."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: f'<{type(value).__name__}>' for key, value in params.items()}
+    return [f'<{type(value).__name__}>' for value in params]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label tuple."""
+
+    def __init__(self, name, help_text, buckets, labels):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for label_values, (counts, total, count) in sorted(series.items()):
+            labels = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + [float('inf')], counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = collections.Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            labels = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return lines
+
+
+class Gauge:
+    """A value read from ``fn()`` at scrape time."""
+
+    def __init__(self, name, help_text, fn):
+        self.name = name
+        self.help_text = help_text
+        self.fn = fn
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge', f'{self.name} {self.fn()}']
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestStats:
+    __slots__ = ('route', 'start', 'queries', 'db_seconds')
+
+    def __init__(self, route):
+        self.route = route
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times ``execute``/``executemany`` against the current request."""
+
+    def __init__(self, cursor, instrumentation):
+        self._cursor = cursor
+        self._instrumentation = instrumentation
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            self._instrumentation.record_query(operation, params, time.perf_counter() - start)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            self._instrumentation.record_query(operation, None, time.perf_counter() - start,
+                                               rows=len(seq_params) if hasattr(seq_params, '__len__') else None)
+
+
+class Instrumentation:
+    def __init__(self, app=None, enabled=INSTRUMENTATION_ENABLED, slow_query_ms=SLOW_QUERY_MS):
+        self.enabled = enabled
+        self.slow_query_seconds = slow_query_ms / 1000.0
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Request latency by route.', LATENCY_BUCKETS, ('route', 'method'))
+        self.request_queries = Histogram(
+            'http_request_db_queries', 'SQL statements issued per request by route.', QUERY_COUNT_BUCKETS,
+            ('route', 'method'))
+        self.request_db_duration = Histogram(
+            'http_request_db_duration_seconds', 'Time spent in SQL per request by route.', LATENCY_BUCKETS,
+            ('route', 'method'))
+        self.requests = Counter('http_requests_total', 'Requests by route and status.', ('route', 'method', 'status'))
+        self.queries = Counter('db_queries_total', 'SQL statements by route.', ('route',))
+        self.slow_queries = Counter('db_slow_queries_total', 'SQL statements slower than the slow query threshold.',
+                                    ('route',))
+        # Metrics of other components, rendered after the built-in ones
+        self.extra_metrics = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        db.set_cursor_wrapper(lambda cursor: InstrumentedCursor(cursor, self))
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        _local.stats = g._request_stats = RequestStats(route)
+
+    def _after_request(self, response):
+        stats = getattr(g, '_request_stats', None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.start
+        response.headers.add('Server-Timing', f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", '
+                                              f'app;dur={elapsed * 1000:.1f}')
+        if response.is_streamed:
+            # The body is produced after teardown (performance exports, SSE), so the
+            # request is counted when the server closes the response
+            g._request_stats = None
+            method, status = request.method, response.status_code
+            response.call_on_close(lambda: self._record(stats, method, time.perf_counter() - stats.start, status))
+        else:
+            self._finish(stats, elapsed, response.status_code)
+        return response
+
+    def _teardown_request(self, exc):
+        # Requests that raised past the error handlers never reach after_request
+        stats = getattr(g, '_request_stats', None)
+        if stats is not None:
+            self._finish(stats, time.perf_counter() - stats.start, 500)
+        _local.stats = None
+
+    def _finish(self, stats, elapsed, status):
+        g._request_stats = None
+        self._record(stats, request.method, elapsed, status)
+
+    def _record(self, stats, method, elapsed, status):
+        labels = (stats.route, method)
+        self.request_duration.observe(labels, elapsed)
+        self.request_queries.observe(labels, stats.queries)
+        self.request_db_duration.observe(labels, stats.db_seconds)
+        self.requests.inc(labels + (str(status),))
+
+    def record_query(self, operation, params, seconds, rows=None):
+        stats = getattr(_local, 'stats', None)
+        route = stats.route if stats is not None else BACKGROUND_ROUTE
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += seconds
+        self.queries.inc((route,))
+        if seconds >= self.slow_query_seconds:
+            self.slow_queries.inc((route,))
+            statement = _WHITESPACE.sub(' ', str(operation)).strip()[:SLOW_QUERY_MAX_CHARS]
+            detail = f"{rows} rows" if rows is not None else f"params {redact(params)}"
+            logger.warning(f"Slow query ({seconds * 1000:.0f} ms, {route}): {statement} [{detail}]")
+
+    def register(self, *metrics):
+        """Add Histogram/Counter/Gauge objects owned by other components to /metrics."""
+        self.extra_metrics.extend(metrics)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in (self.request_duration, self.request_queries, self.request_db_duration,
+                       self.requests, self.queries, self.slow_queries, *self.extra_metrics):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
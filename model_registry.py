@@ -0,0 +1,192 @@
+"""
+Lazy, versioned loading of the trained student risk model.
+
+The model is trained offline by python.py and saved as a joblib artifact. The
+registry loads it on first use (or up front via ``preload()`` before a server
+forks its workers) and keeps a single copy per process. Uncompressed artifacts
+are loaded with ``mmap_mode='r'`` so the numpy arrays inside the trees stay in
+the OS page cache and are shared between forked workers instead of copied.
+
+An artifact is only served with the metadata python.py writes next to it
+(``write_model_metadata``), and only if the metadata's sha256 matches the file.
+A model fitted on columns the API does not compute (inference.MODEL_FEATURES)
+is rejected too. Rejections are logged and reported by /api/model, and risk is
+then scored with the threshold bands instead.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import joblib
+
+from inference import MODEL_FEATURES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH = os.getenv('MODEL_PATH', 'student_risk_model.pkl')
+
+
+def metadata_path(model_path):
+    """Return the path of the JSON metadata file stored next to a model artifact."""
+    return os.path.splitext(model_path)[0] + '.json'
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the sha256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_model_metadata(model_path, **extra):
+    """
+    Write the metadata file for a freshly saved model and return it.
+
+    The version combines the training timestamp with a short content hash, so two
+    artifacts never share a version even if they were trained in the same second.
+    """
+    trained_at = datetime.datetime.now()
+    sha256 = file_digest(model_path)
+    metadata = {
+        'version': f"{trained_at:%Y%m%d%H%M%S}-{sha256[:8]}",
+        'trained_at': trained_at.isoformat(timespec='seconds'),
+        'sha256': sha256,
+    }
+    metadata.update(extra)
+    with open(metadata_path(model_path), 'w', encoding='utf-8') as fo:
+        json.dump(metadata, fo, indent=2, default=str)
+    return metadata
+
+
+class ModelRegistry:
+    """
+    Process-wide holder for the risk model.
+
+    ``get()`` is safe to call from any request thread; only the first call pays
+    the load cost. A failed load is remembered so a missing artifact is logged
+    once rather than on every request; call ``reload()`` after retraining.
+    """
+
+    def __init__(self, path=DEFAULT_MODEL_PATH, mmap_mode='r', features=MODEL_FEATURES):
+        self.path = path
+        self.mmap_mode = mmap_mode
+        # Columns the API can provide at prediction time
+        self.features = list(features)
+        self._lock = threading.Lock()
+        self._model = None
+        self._metadata = {}
+        self._load_seconds = None
+        self._loaded_at = None
+        self._error = None
+
+    def get(self):
+        """Return the loaded model, loading it on first use. Returns None if unavailable."""
+        if self._model is None and self._error is None:
+            with self._lock:
+                if self._model is None and self._error is None:
+                    self._load()
+        return self._model
+
+    def preload(self):
+        """Load the model now, e.g. in a pre-fork server hook, so workers share it."""
+        return self.get()
+
+    def reload(self):
+        """Drop the current model and load the artifact again."""
+        with self._lock:
+            self._model = None
+            self._error = None
+            self._load()
+        return self._model
+
+    @property
+    def version(self):
+        return self._metadata.get('version')
+
+    def _load(self):
+        start = time.perf_counter()
+        if not os.path.exists(self.path):
+            self._error = f"Model file '{self.path}' not found. Train one with python.py."
+            logger.error(self._error)
+            return
+        # Checked before unpickling, so an artifact nothing vouches for is never loaded
+        metadata = self._read_metadata()
+        self._error = self.check_metadata(metadata)
+        if self._error:
+            logger.error(self._error)
+            return
+        try:
+            model = joblib.load(self.path, mmap_mode=self.mmap_mode)
+        except Exception as e:
+            self._error = f"Failed to load model '{self.path}': {e}"
+            logger.error(self._error)
+            return
+
+        self._error = self.check_features(model)
+        if self._error:
+            logger.error(self._error)
+            return
+
+        self._metadata = metadata
+        self._model = model
+        self._load_seconds = time.perf_counter() - start
+        self._loaded_at = datetime.datetime.now()
+        logger.info(f"Model {self.version} loaded from {self.path} in {self._load_seconds:.3f}s")
+
+    def check_features(self, model):
+        """Return why ``model`` cannot be served with ``self.features``, or None if it can."""
+        names = getattr(model, 'feature_names_in_', None)
+        if names is not None:
+            unknown = [str(name) for name in names if name not in self.features]
+            if unknown:
+                return (f"Model '{self.path}' was trained on features the API does not compute: "
+                        f"{', '.join(unknown)}. Retrain it on {', '.join(self.features)} "
+                        f"(python.py --features).")
+            return None
+        n_features = getattr(model, 'n_features_in_', None)
+        if n_features is not None and n_features != len(self.features):
+            return (f"Model '{self.path}' expects {n_features} unnamed features; the API provides "
+                    f"{len(self.features)} ({', '.join(self.features)}).")
+        return None
+
+    def check_metadata(self, metadata):
+        """Return why the artifact's metadata does not vouch for it, or None if it does."""
+        if metadata is None:
+            return (f"Model '{self.path}' has no training metadata ({metadata_path(self.path)}); only "
+                    f"artifacts trained by python.py are served.")
+        if not metadata.get('version') or metadata.get('sha256') != file_digest(self.path):
+            return (f"Metadata {metadata_path(self.path)} does not match model '{self.path}'; "
+                    f"retrain with python.py.")
+        return None
+
+    def _read_metadata(self):
+        try:
+            with open(metadata_path(self.path), encoding='utf-8') as fh:
+                metadata = json.load(fh)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Unreadable model metadata {metadata_path(self.path)}: {e}")
+            return None
+        return metadata if isinstance(metadata, dict) else None
+
+    def info(self):
+        """Describe the model state for the /api/model endpoint."""
+        return {
+            'path': self.path,
+            'loaded': self._model is not None,
+            'version': self.version,
+            'metadata': self._metadata,
+            'load_seconds': round(self._load_seconds, 4) if self._load_seconds is not None else None,
+            'loaded_at': self._loaded_at.isoformat(timespec='seconds') if self._loaded_at else None,
+            'mmap_mode': self.mmap_mode,
+            'features': self.features,
+            'pid': os.getpid(),
+            'error': self._error,
+        }
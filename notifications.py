@@ -0,0 +1,172 @@
+"""
+In-process fan-out of new notifications to connected dashboards.
+
+Endpoints that insert into ``interventions`` publish the new row here. Clients
+either keep a Server-Sent Events stream open or long-poll with the cursor of the
+last event they saw, so they only receive deltas and never query the database
+on a timer. Events live in a bounded in-memory history; a client whose cursor
+has fallen out of that window is told to reload the full list once.
+
+The broker is per process. With several server workers, or rows inserted by
+other programs, set NOTIFICATION_POLL_SECONDS (gunicorn.conf.py does when it
+starts more than one worker): a NotificationFollower in each process then polls
+the table that often for rows it has not published yet. It re-reads the
+last FOLLOW_LOOKBACK ids, so rows that commit out of id order are still seen.
+Events carry a key (the intervention_id), and the broker publishes each key once.
+Sequence numbers are per process, so a cursor is only meaningful to the worker
+that issued it.
+
+Each open stream or long-poll holds a server thread, so at most
+NOTIFICATION_MAX_WAITERS of them may wait at once per process; the rest are
+turned away (streams) or answered immediately (long-polls) so other requests
+keep a thread.
+"""
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+HISTORY_SIZE = int(os.getenv('NOTIFICATION_HISTORY_SIZE', '500'))
+# Off by default; only needed when other processes insert interventions
+NOTIFICATION_POLL_SECONDS = float(os.getenv('NOTIFICATION_POLL_SECONDS', '0'))
+FOLLOW_LOOKBACK = 50
+# Streams and long-polls allowed to hold a server thread at once, per process
+NOTIFICATION_MAX_WAITERS = int(os.getenv('NOTIFICATION_MAX_WAITERS', '4'))
+# Seconds between SSE keep-alive comments, so proxies do not close idle streams
+KEEPALIVE_SECONDS = 15
+
+
+class NotificationBroker:
+    def __init__(self, history_size=HISTORY_SIZE, max_waiters=NOTIFICATION_MAX_WAITERS):
+        self._condition = threading.Condition()
+        self._waiter_slots = threading.BoundedSemaphore(max(1, max_waiters))
+        self._events = collections.deque(maxlen=history_size)
+        self._cursor = 0
+        # Keys of recent events, oldest first, so an event is not published twice
+        self._keys = collections.OrderedDict()
+        self._max_keys = history_size
+
+    @property
+    def cursor(self):
+        """Sequence number of the most recent event (0 before the first one)."""
+        return self._cursor
+
+    def reserve(self):
+        """
+        Claim one of the waiter slots without blocking. Returns a function that
+        frees it (safe to call more than once), or None when all slots are taken.
+        """
+        if not self._waiter_slots.acquire(blocking=False):
+            return None
+        once = threading.Lock()
+
+        def release():
+            if once.acquire(blocking=False):
+                self._waiter_slots.release()
+        return release
+
+    def publish(self, event, key=None):
+        """
+        Record an event and wake every waiting client. Returns its sequence
+        number, or None if an event with the same ``key`` was published recently.
+        """
+        with self._condition:
+            if key is not None:
+                if key in self._keys:
+                    return None
+                self._keys[key] = True
+                while len(self._keys) > self._max_keys:
+                    self._keys.popitem(last=False)
+            self._cursor += 1
+            self._events.append((self._cursor, event))
+            self._condition.notify_all()
+            return self._cursor
+
+    def _since(self, cursor, student_id):
+        # Caller holds the condition lock
+        oldest = self._events[0][0] if self._events else self._cursor + 1
+        # A cursor from before a server restart can be ahead of ours
+        reset = cursor < oldest - 1 or cursor > self._cursor
+        events = [(seq, event) for seq, event in self._events
+                  if seq > cursor and (student_id is None or str(event.get('student_id')) == str(student_id))]
+        return events, reset
+
+    def wait(self, cursor, timeout, student_id=None):
+        """
+        Return ``(events, cursor, reset)`` for events newer than ``cursor``,
+        blocking up to ``timeout`` seconds if there are none yet.
+
+        ``reset`` is True when events after ``cursor`` were already dropped from
+        the history and the client should reload the full list.
+        """
+        with self._condition:
+            events, reset = self._since(cursor, student_id)
+            if not events and not reset:
+                self._condition.wait_for(lambda: self._cursor > cursor, timeout=timeout)
+                # Events may have arrived for other students only; those still advance the cursor
+                events, reset = self._since(cursor, student_id)
+            return events, self._cursor, reset
+
+    def stream(self, cursor, student_id=None):
+        """Yield Server-Sent Events frames, starting after ``cursor``."""
+        while True:
+            events, cursor, reset = self.wait(cursor, KEEPALIVE_SECONDS, student_id)
+            if reset:
+                yield f"event: reset\nid: {cursor}\ndata: {{}}\n\n"
+            for seq, event in events:
+                yield f"event: notification\nid: {seq}\ndata: {json.dumps(event, default=str)}\n\n"
+            if not events and not reset:
+                yield ": keepalive\n\n"
+
+
+class NotificationFollower:
+    """Publishes events other processes created, polling ``fetch_after`` in a background thread."""
+
+    def __init__(self, broker, latest, fetch_after, poll_seconds=NOTIFICATION_POLL_SECONDS):
+        # latest() -> newest key now; fetch_after(key) -> [(key, event), ...] newer than key, oldest first
+        self.broker = broker
+        self.latest = latest
+        self.fetch_after = fetch_after
+        self.poll_seconds = poll_seconds
+        self._worker = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # Threads do not survive fork; the child starts its own follower
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.poll_seconds <= 0:
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='notification-follower', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        floor = last = None
+        failing = False
+        while True:
+            try:
+                if floor is None:
+                    # Only rows created from now on; older ones are in /api/notifications
+                    floor = last = self.latest()
+                else:
+                    for key, event in self.fetch_after(max(floor, last - FOLLOW_LOOKBACK)):
+                        self.broker.publish(event, key)
+                        last = max(last, key)
+                if failing:
+                    logger.info("Following notifications again")
+                failing = False
+            except Exception as e:
+                # Logged once per outage, not on every poll
+                if not failing:
+                    logger.error(f"Following notifications failed: {e}")
+                failing = True
+            time.sleep(self.poll_seconds)
@@ -0,0 +1,195 @@
+"""
+Reads of the performance table for GET /api/performance.
+
+Rows come back in performance_id order, so clients page with a keyset cursor
+(``after`` = last performance_id of the previous page) instead of OFFSET. The
+academic_year, semester, subject_code and lecturer_id filters are applied in
+SQL, using the indexes in schema.sql.
+
+``stream_performance`` runs the same query on an unbuffered (server-side)
+cursor and yields the rows in batches of PERFORMANCE_STREAM_BATCH_SIZE as a
+JSON array, NDJSON or CSV. Memory use stays flat however large the export is,
+and the first rows go out before the last are read. The stream holds a pooled
+connection until the response is closed.
+"""
+import csv
+import io
+import json
+import logging
+import os
+
+from db import get_db_connection, DatabaseUnavailable
+
+logger = logging.getLogger(__name__)
+
+PERFORMANCE_STREAM_BATCH_SIZE = int(os.getenv('PERFORMANCE_STREAM_BATCH_SIZE', '1000'))
+# Largest page for ?limit=; bigger reads should stream
+PERFORMANCE_MAX_LIMIT = 5000
+
+PERFORMANCE_COLUMNS = [
+    ('performance_id', 'p.performance_id'),
+    ('student_id', 'p.student_id'),
+    ('first_name', 's.first_name'),
+    ('last_name', 's.last_name'),
+    ('program', 's.program'),
+    ('subject_code', 'p.subject_code'),
+    ('subject_name', 'p.subject_name'),
+    ('mark', 'p.mark'),
+    ('max_mark', 'p.max_mark'),
+    ('percentage', 'ROUND((p.mark / p.max_mark) * 100, 2)'),
+    ('grade', 'p.grade'),
+    ('assessment_type', 'p.assessment_type'),
+    ('assessment_date', 'p.assessment_date'),
+    ('semester', 'p.semester'),
+    ('academic_year', 'p.academic_year'),
+    ('lecturer_id', 'p.lecturer_id'),
+    ('lecturer_name', 'l.full_name'),
+]
+
+# Query parameter -> column and parser
+PERFORMANCE_FILTERS = {
+    'academic_year': ('p.academic_year', int),
+    'semester': ('p.semester', str),
+    'subject_code': ('p.subject_code', str),
+    'lecturer_id': ('p.lecturer_id', str),
+}
+
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def parse_performance_args(args):
+    """
+    Validate ``after``, ``limit`` and the filters from request args.
+
+    Returns ``(after, limit, filters)``; raises ValueError with a message for the client.
+    """
+    def integer(name, value):
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f"{name} must be an integer")
+
+    after = integer('after', args['after']) if args.get('after') else None
+    limit = integer('limit', args['limit']) if args.get('limit') else None
+    if limit is not None and not 0 < limit <= PERFORMANCE_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {PERFORMANCE_MAX_LIMIT}")
+    filters = {}
+    for name, (_, parse) in PERFORMANCE_FILTERS.items():
+        if args.get(name):
+            filters[name] = integer(name, args[name]) if parse is int else args[name]
+    return after, limit, filters
+
+
+def performance_query(after=None, limit=None, filters=None):
+    """Return ``(sql, params)`` for one keyset page (or all rows when ``limit`` is None)."""
+    conditions = []
+    params = []
+    if after is not None:
+        conditions.append("p.performance_id > %s")
+        params.append(after)
+    for name, value in (filters or {}).items():
+        conditions.append(f"{PERFORMANCE_FILTERS[name][0]} = %s")
+        params.append(value)
+
+    query = f"""
+        SELECT {', '.join(f'{expr} AS {alias}' for alias, expr in PERFORMANCE_COLUMNS)}
+        FROM performance p
+        LEFT JOIN students s ON p.student_id = s.student_id
+        LEFT JOIN Lecturers l ON p.lecturer_id = l.lecturer_id
+    """
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY p.performance_id"
+    if limit:
+        query += " LIMIT %s"
+        params.append(int(limit))
+    return query, params
+
+
+def fetch_performance(cursor, after=None, limit=None, filters=None):
+    """One page of performance rows as dicts (``cursor`` must be a dictionary cursor)."""
+    cursor.execute(*performance_query(after, limit, filters))
+    return cursor.fetchall()
+
+
+def _batches(cursor, batch_size):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def _json_array(batches, dumps):
+    yield '['
+    first = True
+    for rows in batches:
+        chunk = ','.join(dumps(row) for row in rows)
+        yield chunk if first else ',' + chunk
+        first = False
+    yield ']\n'
+
+
+def _ndjson(batches, dumps):
+    for rows in batches:
+        yield ''.join(dumps(row) + '\n' for row in rows)
+
+
+def _csv(batches):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=[alias for alias, _ in PERFORMANCE_COLUMNS])
+    writer.writeheader()
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_performance(fmt, after=None, limit=None, filters=None, dumps=json.dumps,
+                       batch_size=PERFORMANCE_STREAM_BATCH_SIZE):
+    """
+    Start streaming rows in ``fmt`` (a STREAM_FORMATS key).
+
+    The query runs before this returns, so database errors surface to the caller.
+    Returns ``(chunks, close)``: an iterator of text chunks and a function that
+    returns the connection to the pool, to be called once the response is closed.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise DatabaseUnavailable("Database connection error")
+    cursor = None
+
+    def close():
+        try:
+            # Stopped early (client went away): drain what the server already sent
+            if conn.unread_result:
+                conn.consume_results()
+            if cursor is not None:
+                cursor.close()
+        except Exception as e:
+            logger.warning(f"Closing performance stream failed: {e}")
+        finally:
+            conn.close()
+
+    try:
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        cursor.execute(*performance_query(after, limit, filters))
+    except Exception:
+        close()
+        raise
+
+    batches = _batches(cursor, batch_size)
+    if fmt == 'ndjson':
+        chunks = _ndjson(batches, dumps)
+    elif fmt == 'csv':
+        chunks = _csv(batches)
+    else:
+        chunks = _json_array(batches, dumps)
+    return chunks, close
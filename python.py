@@ -2,11 +2,16 @@ import os
 import glob
 import argparse
 import json
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
 import pandas as pd
 import numpy as np
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (enables HalvingRandomSearchCV)
 from sklearn.model_selection import (train_test_split, StratifiedKFold,
                                      cross_val_score, cross_val_predict,
-                                     RandomizedSearchCV)
+                                     RandomizedSearchCV, HalvingRandomSearchCV)
 from sklearn.preprocessing import LabelEncoder
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import (accuracy_score, precision_score, recall_score,
@@ -17,17 +22,130 @@ from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 import joblib
+from model_registry import file_digest, write_model_metadata
+from feature_store import load_features
+from inference import MODEL_FEATURES
+
+# Search space shared by the random and halving searches
+PARAM_DISTRIBUTIONS = {
+    'clf__n_estimators': [100, 200, 400],
+    'clf__max_depth': [None, 5, 10, 20],
+    'clf__min_samples_leaf': [1, 2, 4],
+    # 'auto' is invalid in newer scikit-learn versions (raises InvalidParameterError).
+    # Use 'sqrt', 'log2', a float fraction (e.g. 0.5), an int, or None.
+    'clf__max_features': ['sqrt', 'log2', 0.5, None]
+}
+
+# Halving search: candidates sampled per round, and the tree counts it grows through
+HALVING_CANDIDATES_PER_ROUND = 24
+HALVING_MIN_TREES = 50
+HALVING_MAX_TREES = 400
+# A round must raise the best F1 by more than this to count as an improvement
+HALVING_MIN_IMPROVEMENT = 1e-3
+SEARCH_TRAJECTORY_PATH = 'search_trajectory.json'
+
+
+@contextmanager
+def stage(timings, name):
+    """Record the wall-clock seconds of a training stage in ``timings``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - start, 3)
+        print(f'[{name}] {timings[name]:.2f}s')
+
+
+# Columns read as categories; other float columns are downcast to float32
+CATEGORY_COLUMNS = ['program']
+CSV_CHUNK_ROWS = 100_000
+DATA_CACHE_DIR = os.getenv('DATA_CACHE_DIR', '.data_cache')
+
+try:
+    import pyarrow  # noqa: F401 (Feather support)
+    CACHE_FORMAT = 'feather'
+except ImportError:
+    CACHE_FORMAT = 'pickle'
+
+
+def _compact(frame):
+    """Store student_id as text, listed columns as categories and floats as float32, in place."""
+    if 'student_id' in frame.columns:
+        frame['student_id'] = frame['student_id'].astype(str)
+    for col in frame.columns:
+        if col in CATEGORY_COLUMNS:
+            frame[col] = frame[col].astype('category')
+        elif pd.api.types.is_float_dtype(frame[col]):
+            frame[col] = frame[col].astype(np.float32)
+    return frame
+
+
+def _concat_chunks(chunks):
+    """Concatenate chunks without categories decaying to object when their values differ."""
+    if not chunks:
+        return None
+    for col in chunks[0].columns:
+        if isinstance(chunks[0][col].dtype, pd.CategoricalDtype):
+            categories = pd.api.types.union_categoricals([c[col] for c in chunks]).categories
+            dtype = pd.CategoricalDtype(categories)
+            for chunk in chunks:
+                chunk[col] = chunk[col].astype(dtype)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def read_csv_chunked(csv_path, keep_ids=None, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Read a CSV in chunks with compact dtypes.
+
+    With ``keep_ids``, rows for other students are dropped chunk by chunk, so
+    they never accumulate in memory.
+    """
+    dtypes = {col: 'category' for col in CATEGORY_COLUMNS}
+    dtypes['student_id'] = str
+    chunks = []
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows, dtype=dtypes):
+        if keep_ids is not None and 'student_id' in chunk.columns:
+            chunk = chunk[chunk['student_id'].isin(keep_ids)]
+        chunks.append(_compact(chunk))
+    return _concat_chunks(chunks)
+
+
+def read_excel_cached(excel_path, cache_dir=DATA_CACHE_DIR):
+    """
+    Read the Students sheet (or the first sheet) of a workbook through a columnar cache.
+
+    The cache file is keyed by the workbook's mtime and content hash, so the slow
+    Excel parse only happens once per version of the file.
+    """
+    stat = os.stat(excel_path)
+    digest = file_digest(excel_path)[:16]
+    stem = os.path.splitext(os.path.basename(excel_path))[0]
+    cache_path = os.path.join(cache_dir, f'{stem}-{stat.st_mtime_ns}-{digest}.{CACHE_FORMAT}')
+    if os.path.exists(cache_path):
+        print(f'Loading cached Students sheet: {cache_path}')
+        if CACHE_FORMAT == 'feather':
+            return pd.read_feather(cache_path)
+        return pd.read_pickle(cache_path)
+
+    print(f"Loading Students sheet from Excel: {excel_path}")
+    xls = pd.ExcelFile(excel_path)
+    sheet = 'Students' if 'Students' in xls.sheet_names else xls.sheet_names[0]  # fallback to first sheet
+    df = _compact(pd.read_excel(xls, sheet, dtype={'student_id': str}))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Drop caches of older versions of this workbook
+        for old in glob.glob(os.path.join(cache_dir, f'{glob.escape(stem)}-*')):
+            os.remove(old)
+        if CACHE_FORMAT == 'feather':
+            df.to_feather(cache_path)
+        else:
+            df.to_pickle(cache_path)
+    except Exception as e:
+        print('Failed to cache excel data:', e)
+    return df
 
 
 def load_data(csv_path='student_records11.csv'):
-    # Try to load CSV
-    df_csv = None
-    if os.path.exists(csv_path):
-        print(f"Loading CSV: {csv_path}")
-        df_csv = pd.read_csv(csv_path)
-    else:
-        print(f"CSV not found at {csv_path}.")
-
     # Try to find latest unizulu Excel file (generated by the UI)
     excel_files = glob.glob('unizulu_*.xlsx') + glob.glob('*.xlsx')
     excel_files = [p for p in excel_files if os.path.basename(p).startswith('unizulu_')]
@@ -35,27 +153,31 @@ def load_data(csv_path='student_records11.csv'):
     if excel_files:
         # pick the most recently modified
         excel_files.sort(key=lambda p: os.path.getmtime(p), reverse=True)
-        excel_path = excel_files[0]
-        print(f"Loading Students sheet from Excel: {excel_path}")
         try:
-            xls = pd.ExcelFile(excel_path)
-            if 'Students' in xls.sheet_names:
-                df_xlsx = pd.read_excel(xls, 'Students')
-            else:
-                # fallback to first sheet
-                df_xlsx = pd.read_excel(xls, xls.sheet_names[0])
+            df_xlsx = read_excel_cached(excel_files[0])
         except Exception as e:
             print('Failed to read excel file:', e)
 
+    # Try to load CSV. When merging onto the Excel students (a left join), only
+    # their rows are kept while reading.
+    df_csv = None
+    if os.path.exists(csv_path):
+        print(f"Loading CSV: {csv_path}")
+        keep_ids = None
+        if df_xlsx is not None and 'student_id' in df_xlsx.columns:
+            keep_ids = set(df_xlsx['student_id'])
+        df_csv = read_csv_chunked(csv_path, keep_ids=keep_ids)
+    else:
+        print(f"CSV not found at {csv_path}.")
+
     # If both present, merge on student_id (prefer values from CSV for target)
     if df_csv is not None and df_xlsx is not None:
         if 'student_id' in df_csv.columns and 'student_id' in df_xlsx.columns:
-            merged = pd.merge(df_xlsx, df_csv, on='student_id', how='left', suffixes=('_xls', '_csv'))
-            # If Performance in csv, use that, else look for in xls
-            if 'Performance' in merged.columns:
-                df = merged
-            else:
-                df = merged
+            # join() on the CSV's index aligns rows without copying the CSV frame
+            # into an intermediate merge result
+            df = df_xlsx.join(df_csv.set_index('student_id'), on='student_id', how='left',
+                              lsuffix='_xls', rsuffix='_csv')
+            df.reset_index(drop=True, inplace=True)
         else:
             # Can't merge, just concat columns side-by-side
             df = pd.concat([df_xlsx, df_csv], axis=1)
@@ -69,56 +191,95 @@ def load_data(csv_path='student_records11.csv'):
     return df
 
 
-def preprocess(df, target_col='Performance'):
-    # Basic checks
-    if target_col not in df.columns:
-        # Attempt to create a fallback binary target from assessment_avg or assignment_avg
+def join_store_features(df, directory):
+    """
+    Left-join the exported feature store onto ``df`` by student_id, so training
+    sees the same feature definitions as inference. Store columns replace
+    same-named columns of ``df``.
+    """
+    features = load_features(directory)
+    print(f'Joining {len(features)} feature store rows from {directory}')
+    overlap = [c for c in features.columns if c in df.columns]
+    if overlap:
+        print(f'Replacing columns with feature store values: {overlap}')
+        df = df.drop(columns=overlap)
+    df['student_id'] = df['student_id'].astype(str)
+    return df.join(features, on='student_id')
+
+
+# Columns never used as features (identifiers and personal data)
+NON_FEATURE_COLUMNS = ['first_name', 'last_name', 'email', 'password_hash', 'student_id']
+# Target sources for the fallback Pass/Fail target, in order of preference
+FALLBACK_TARGET_SOURCES = ['assessment_avg', 'assignment_avg']
+PASS_LABELS = ['pass', 'passed', '1', 'true', 'yes']
+PASS_THRESHOLD = 50
+
+
+def derive_target(df, target_col='Performance', verbose=True):
+    """
+    Add a Pass/Fail ``target_col`` to ``df`` in place from the first available
+    fallback source (>= 50 -> Pass), if the target is missing.
+    """
+    if target_col in df.columns:
+        return df
+    source = next((c for c in FALLBACK_TARGET_SOURCES if c in df.columns), None)
+    if source is None:
+        raise ValueError(f"Target column '{target_col}' not found in data."
+                         " Please provide a dataset with a 'Performance' column (e.g. Pass/Fail),"
+                         " or include 'assessment_avg'/'assignment_avg' to derive one automatically.")
+    if verbose:
         print(f"Warning: Target column '{target_col}' not found. Attempting to create a fallback target from 'assessment_avg' or 'assignment_avg'.")
-        if 'assessment_avg' in df.columns:
-            df[target_col] = df['assessment_avg'].astype(float).apply(lambda v: 'Pass' if v >= 50 else 'Fail')
-            print("Created 'Performance' from 'assessment_avg' using threshold >=50 -> Pass")
-        elif 'assignment_avg' in df.columns:
-            df[target_col] = df['assignment_avg'].astype(float).apply(lambda v: 'Pass' if v >= 50 else 'Fail')
-            print("Created 'Performance' from 'assignment_avg' using threshold >=50 -> Pass")
-        else:
-            raise ValueError(f"Target column '{target_col}' not found in data."
-                             " Please provide a dataset with a 'Performance' column (e.g. Pass/Fail),"
-                             " or include 'assessment_avg'/'assignment_avg' to derive one automatically.")
+    passed = df[source].to_numpy(dtype=float) >= PASS_THRESHOLD
+    # Codes into ['Fail', 'Pass'], without materializing a string per row
+    df[target_col] = pd.Categorical.from_codes(passed.astype(np.int8), ['Fail', 'Pass'])
+    if verbose:
+        print(f"Created 'Performance' from '{source}' using threshold >={PASS_THRESHOLD} -> Pass")
+    return df
+
+
+def encode_target(y):
+    """Map a label Series to 1 (pass) / 0 (fail); numeric targets are returned unchanged."""
+    if pd.api.types.is_numeric_dtype(y):
+        return y
+    # Compare each distinct label once instead of every row
+    codes, uniques = pd.factorize(y)
+    passed = pd.Index(uniques).astype(str).str.lower().isin(PASS_LABELS)
+    encoded = np.zeros(len(y), dtype=np.int8)
+    valid = codes >= 0
+    encoded[valid] = passed[codes[valid]]
+    return pd.Series(encoded, index=y.index, name=y.name)
 
-    # Work on a copy
-    data = df.copy()
+
+def preprocess(df, target_col='Performance', inplace=False, verbose=True):
+    """
+    Split a frame into features ``X`` and a binary target ``y``.
+
+    Every step is row-local, so chunks of a larger frame can be preprocessed
+    independently (see preprocess_chunks). With ``inplace`` the caller's frame
+    is consumed: identifier and target columns are removed from it and it is
+    returned as ``X``, so no second copy of the data is held.
+    """
+    data = df if inplace else df.copy(deep=False)
+    derive_target(data, target_col, verbose=verbose)
 
     # Drop obvious non-feature and identifier columns early to avoid leakage
-    drop_cols = [c for c in ['first_name', 'last_name', 'email', 'password_hash', 'student_id'] if c in data.columns]
+    drop_cols = [c for c in NON_FEATURE_COLUMNS if c in data.columns]
     if drop_cols:
-        print(f"Dropping identifier/non-feature columns: {drop_cols}")
-        data = data.drop(columns=drop_cols)
+        if verbose:
+            print(f"Dropping identifier/non-feature columns: {drop_cols}")
+        data.drop(columns=drop_cols, inplace=True)
 
-    # Ensure target exists; if not try to derive
-    if target_col not in data.columns:
-        # Attempt to create a fallback binary target from assessment_avg or assignment_avg
-        print(f"Warning: Target column '{target_col}' not found. Attempting to create a fallback target from 'assessment_avg' or 'assignment_avg'.")
-        if 'assessment_avg' in data.columns:
-            data[target_col] = data['assessment_avg'].astype(float).apply(lambda v: 'Pass' if v >= 50 else 'Fail')
-            print("Created 'Performance' from 'assessment_avg' using threshold >=50 -> Pass")
-        elif 'assignment_avg' in data.columns:
-            data[target_col] = data['assignment_avg'].astype(float).apply(lambda v: 'Pass' if v >= 50 else 'Fail')
-            print("Created 'Performance' from 'assignment_avg' using threshold >=50 -> Pass")
-        else:
-            raise ValueError(f"Target column '{target_col}' not found in data. Please provide a dataset with a 'Performance' column or include 'assessment_avg'/'assignment_avg'.")
+    y = encode_target(data.pop(target_col))
+    return data, y
 
-    X = data.drop(columns=[target_col])
-    y = data[target_col]
 
-    # map target to binary if categorical
-    if y.dtype == 'object' or y.dtype.name == 'category':
-        y = y.astype(str)
-        y = y.map(lambda v: 1 if str(v).lower() in ['pass', 'passed', '1', 'true', 'yes'] else 0)
+def preprocess_chunks(chunks, target_col='Performance'):
+    """Preprocess an iterable of DataFrame chunks, yielding ``(X, y)`` per chunk."""
+    for chunk in chunks:
+        yield preprocess(chunk, target_col=target_col, inplace=True, verbose=False)
 
-    return X, y
 
-
-def build_pipeline(X):
+def build_pipeline(X, memory=None):
     # Determine column types
     numeric_cols = X.select_dtypes(include=[np.number]).columns.tolist()
     categorical_cols = X.select_dtypes(include=['object', 'category', 'bool']).columns.tolist()
@@ -139,15 +300,122 @@ def build_pipeline(X):
         ('cat', categorical_transformer, categorical_cols)
     ], remainder='drop')
 
+    # With ``memory`` the fitted preprocessor is cached per training fold, so search
+    # candidates that only change classifier parameters reuse it
     pipeline = Pipeline(steps=[
         ('preprocessor', preprocessor),
         ('clf', RandomForestClassifier(n_estimators=200, random_state=42))
-    ])
+    ], memory=memory)
 
     return pipeline
 
 
-def train_and_evaluate(X, y, model_path='student_risk_model.pkl'):
+def halving_search(pipeline, X, y, cv, n_jobs, resource='n_estimators', budget_seconds=None, patience=2,
+                   trajectory_path=SEARCH_TRAJECTORY_PATH):
+    """
+    Successive-halving search over PARAM_DISTRIBUTIONS in rounds.
+
+    Each round runs HalvingRandomSearchCV on a fresh sample of candidates, with
+    the forest's tree count (``resource='n_estimators'``) or the training rows
+    (``resource='n_samples'``) as the budget that grows for the survivors. Rounds
+    stop when the next one would not fit in ``budget_seconds``, or when the best
+    F1 has not improved for ``patience`` rounds. The best candidate is refitted
+    on the full data; every halving iteration is saved to ``trajectory_path``.
+    """
+    param_dist = dict(PARAM_DISTRIBUTIONS)
+    if resource == 'n_estimators':
+        param_dist.pop('clf__n_estimators')
+        search_kwargs = {'resource': 'clf__n_estimators', 'min_resources': HALVING_MIN_TREES,
+                         'max_resources': HALVING_MAX_TREES}
+    else:
+        search_kwargs = {'resource': 'n_samples'}
+
+    started = time.perf_counter()
+    best_score, best_params = -np.inf, None
+    trajectory = []
+    stale_rounds = 0
+    round_seconds = 0.0
+    stopped_because = 'patience'
+    for round_number in range(1, 1000):
+        elapsed = time.perf_counter() - started
+        if budget_seconds is not None and elapsed + round_seconds > budget_seconds:
+            stopped_because = 'budget'
+            break
+        round_start = time.perf_counter()
+        search = HalvingRandomSearchCV(pipeline, param_distributions=param_dist,
+                                       n_candidates=HALVING_CANDIDATES_PER_ROUND, factor=3, scoring='f1',
+                                       n_jobs=n_jobs, cv=cv, random_state=42 + round_number, refit=False,
+                                       verbose=0, **search_kwargs)
+        search.fit(X, y)
+        round_seconds = time.perf_counter() - round_start
+
+        results = search.cv_results_
+        for i in range(len(results['params'])):
+            trajectory.append({
+                'round': round_number,
+                'iteration': int(results['iter'][i]),
+                'n_resources': int(results['n_resources'][i]),
+                'params': {k: (v if v is None or isinstance(v, (str, int, float)) else str(v))
+                           for k, v in results['params'][i].items()},
+                'mean_f1': float(results['mean_test_score'][i]),
+                'elapsed_seconds': round(time.perf_counter() - started, 3),
+            })
+        print(f'Halving round {round_number}: best F1 {search.best_score_:.4f} '
+              f'({search.n_iterations_} iterations, {round_seconds:.1f}s)')
+
+        if search.best_score_ > best_score + HALVING_MIN_IMPROVEMENT:
+            best_score, best_params = search.best_score_, search.best_params_
+            stale_rounds = 0
+        else:
+            stale_rounds += 1
+            if stale_rounds >= patience:
+                break
+
+    if best_params is None:
+        raise RuntimeError(f'Search budget of {budget_seconds}s ran out before the first round')
+    if resource == 'n_estimators':
+        # Survivors may have stopped short of the cap; the final model gets the full tree count
+        best_params = dict(best_params, clf__n_estimators=HALVING_MAX_TREES)
+    print(f'Best params: {best_params} (F1 {best_score:.4f}, stopped on {stopped_because})')
+
+    try:
+        with open(trajectory_path, 'w', encoding='utf-8') as fo:
+            json.dump({'resource': resource, 'budget_seconds': budget_seconds, 'stopped_because': stopped_because,
+                       'best_f1': float(best_score), 'best_params': best_params, 'trajectory': trajectory},
+                      fo, indent=2, default=str)
+        print(f'Saved {trajectory_path}')
+    except Exception as e:
+        print('Failed to save search trajectory:', e)
+
+    best_model = pipeline.set_params(**best_params)
+    best_model.fit(X, y)
+    return best_model
+
+
+def train_and_evaluate(X, y, model_path='student_risk_model.pkl', n_jobs=-1, backend='loky', cache_dir=None,
+                       timings=None, search='random', **search_options):
+    """
+    Evaluate out-of-fold, tune and save the model.
+
+    Folds and search candidates run on ``n_jobs`` workers of the given joblib
+    backend. Fitted preprocessing is cached under ``cache_dir`` (a temporary
+    directory by default, removed afterwards). Stage wall-clock seconds are
+    added to ``timings`` and to evaluation_report.json. ``search`` is 'random'
+    or 'halving'; ``search_options`` are passed to halving_search.
+    """
+    timings = {} if timings is None else timings
+    own_cache = cache_dir is None
+    if own_cache:
+        cache_dir = tempfile.mkdtemp(prefix='risk_model_cache_')
+    try:
+        with joblib.parallel_config(backend=backend, n_jobs=n_jobs):
+            return _train_and_evaluate(X, y, model_path, n_jobs, cache_dir, timings, search, search_options)
+    finally:
+        if own_cache:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def _train_and_evaluate(X, y, model_path, n_jobs, cache_dir, timings, search, search_options):
     # Drop any id-like columns if present (safety)
     X = X.copy()
     X = X.drop(columns=[c for c in ['student_id', 'password_hash'] if c in X.columns], errors='ignore')
@@ -162,21 +430,27 @@ def train_and_evaluate(X, y, model_path='student_risk_model.pkl'):
 
     cv = StratifiedKFold(n_splits=cv_folds, shuffle=True, random_state=42)
 
-    pipeline = build_pipeline(X)
+    pipeline = build_pipeline(X, memory=cache_dir)
 
+    # One out-of-fold pass: labels are derived from the probabilities instead of
+    # fitting every fold a second time for predict()
     print('\nRunning cross-validated evaluation (out-of-fold)...')
-    try:
-        y_pred_cv = cross_val_predict(pipeline, X, y, cv=cv)
-    except Exception as e:
-        print('Cross-val predict failed:', e)
-        y_pred_cv = None
-
-    if y_pred_cv is not None:
+    y_pred_cv = None
+    # Stay None when cross-validation fails
+    cv_metrics = dict.fromkeys(['accuracy', 'precision', 'recall', 'f1', 'roc_auc', 'rmse'])
+    cm = None
+    report = None
+    with stage(timings, 'cross_validation'):
         try:
-            y_proba_cv = cross_val_predict(pipeline, X, y, cv=cv, method='predict_proba')[:, 1]
-        except Exception:
-            y_proba_cv = y_pred_cv
+            proba_cv = cross_val_predict(pipeline, X, y, cv=cv, method='predict_proba', n_jobs=n_jobs)
+        except Exception as e:
+            print('Cross-val predict failed:', e)
+        else:
+            classes = np.unique(y)
+            y_pred_cv = classes[np.argmax(proba_cv, axis=1)]
+            y_proba_cv = proba_cv[:, 1] if proba_cv.shape[1] > 1 else y_pred_cv
 
+    if y_pred_cv is not None:
         acc = accuracy_score(y, y_pred_cv)
         prec = precision_score(y, y_pred_cv, zero_division=0)
         rec = recall_score(y, y_pred_cv, zero_division=0)
@@ -203,63 +477,65 @@ def train_and_evaluate(X, y, model_path='student_risk_model.pkl'):
         print(cm)
         print('\nClassification Report:')
         print(classification_report(y, y_pred_cv, zero_division=0))
+        report = classification_report(y, y_pred_cv, output_dict=True, zero_division=0)
+        cv_metrics.update(accuracy=float(acc), precision=float(prec), recall=float(rec), f1=float(f1),
+                          roc_auc=float(roc_auc), rmse=float(rmse))
 
-    # Hyperparameter tuning with RandomizedSearchCV
-    param_dist = {
-        'clf__n_estimators': [100, 200, 400],
-        'clf__max_depth': [None, 5, 10, 20],
-        'clf__min_samples_leaf': [1, 2, 4],
-        # 'auto' is invalid in newer scikit-learn versions (raises InvalidParameterError).
-        # Use 'sqrt', 'log2', a float fraction (e.g. 0.5), an int, or None.
-        'clf__max_features': ['sqrt', 'log2', 0.5, None]
-    }
-
-    search = RandomizedSearchCV(pipeline, param_distributions=param_dist, n_iter=10,
-                                scoring='f1', n_jobs=1, cv=cv, random_state=42, verbose=1, refit=True)
-    print('\nRunning hyperparameter search (RandomizedSearchCV) ...')
-    try:
-        search.fit(X, y)
-    except Exception as e:
-        print('Hyperparameter search failed:', e)
-        # Fallback: fit base pipeline on full data
-        pipeline.fit(X, y)
-        best_model = pipeline
-    else:
-        best_model = search.best_estimator_
-        print(f'Best params: {search.best_params_}')
+    with stage(timings, 'hyperparameter_search'):
+        try:
+            if search == 'halving':
+                best_model = halving_search(pipeline, X, y, cv, n_jobs, **search_options)
+            else:
+                # Hyperparameter tuning with RandomizedSearchCV
+                random_search = RandomizedSearchCV(pipeline, param_distributions=PARAM_DISTRIBUTIONS, n_iter=10,
+                                                   scoring='f1', n_jobs=n_jobs, cv=cv, random_state=42,
+                                                   verbose=1, refit=True)
+                print('\nRunning hyperparameter search (RandomizedSearchCV) ...')
+                random_search.fit(X, y)
+                best_model = random_search.best_estimator_
+                print(f'Best params: {random_search.best_params_}')
+        except Exception as e:
+            print('Hyperparameter search failed:', e)
+            # Fallback: fit base pipeline on full data
+            pipeline.fit(X, y)
+            best_model = pipeline
+    # The saved model must not point at the temporary cache directory
+    best_model.set_params(memory=None)
 
     # Save evaluation artifacts
-    try:
-        report = classification_report(y, y_pred_cv, output_dict=True, zero_division=0)
-    except Exception:
-        report = None
-
     eval_out = {
         'n_samples': int(n_samples),
         'cv_folds': int(cv.get_n_splits()),
-        'cv_metrics': {
-            'accuracy': float(acc) if 'acc' in locals() else None,
-            'precision': float(prec) if 'prec' in locals() else None,
-            'recall': float(rec) if 'rec' in locals() else None,
-            'f1': float(f1) if 'f1' in locals() else None,
-            'roc_auc': float(roc_auc) if 'roc_auc' in locals() else None,
-            'rmse': float(rmse) if 'rmse' in locals() else None,
-        },
+        'cv_metrics': cv_metrics,
         'classification_report': report,
+        'stage_seconds': timings,
     }
+
+    # Save best model/pipeline. Left uncompressed so the app can mmap-load it.
+    with stage(timings, 'save_model'):
+        joblib.dump(best_model, model_path)
+    metadata = write_model_metadata(model_path, features=list(X.columns), n_samples=int(n_samples),
+                                    cv_f1=eval_out['cv_metrics']['f1'])
+    print(f"Model pipeline saved to {model_path} (version {metadata['version']})")
+    eval_out['model_version'] = metadata['version']
+
+    # Written after the model is saved, so stage_seconds includes save_model
     try:
         with open('evaluation_report.json', 'w', encoding='utf-8') as fo:
             json.dump(eval_out, fo, indent=2)
-        # save confusion matrix
-        import pandas as _pd
-        _pd.DataFrame(cm).to_csv('confusion_matrix.csv', index=False, header=False)
-        print('Saved evaluation_report.json and confusion_matrix.csv')
-    except Exception as e:
+        print('Saved evaluation_report.json')
+        if cm is None:
+            print('Cross-validation failed; confusion_matrix.csv not written')
+        else:
+            pd.DataFrame(cm).to_csv('confusion_matrix.csv', index=False, header=False)
+            print('Saved confusion_matrix.csv')
+    except OSError as e:
         print('Failed to save evaluation artifacts:', e)
 
-    # Save best model/pipeline
-    joblib.dump(best_model, model_path)
-    print(f'Model pipeline saved to {model_path}')
+    unservable = [c for c in X.columns if c not in MODEL_FEATURES]
+    if unservable:
+        print(f"Warning: the API will refuse this model, which uses columns it does not compute: {unservable}. "
+              f"Train with --features to use only {MODEL_FEATURES}.")
 
     return best_model
 
@@ -282,15 +558,44 @@ def main():
     parser.add_argument('--csv', default='student_records11.csv', help='Path to CSV file')
     parser.add_argument('--target', default='Performance', help='Name of the target column')
     parser.add_argument('--model-out', default='student_risk_model.pkl', help='Path to save trained model')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Parallel workers for CV and search (-1 = all cores)')
+    parser.add_argument('--backend', default='loky', help='joblib backend (loky, threading, multiprocessing)')
+    parser.add_argument('--cache-dir', default=None, help='Directory caching fitted preprocessing per fold')
+    parser.add_argument('--features', default=None,
+                        help='Feature store export (python feature_store.py --export DIR) to join on student_id '
+                             'and train on, so the API can serve the model')
+    parser.add_argument('--search', choices=['random', 'halving'], default='random',
+                        help='Hyperparameter search strategy')
+    parser.add_argument('--search-resource', choices=['n_estimators', 'n_samples'], default='n_estimators',
+                        help='Resource grown for the survivors of a halving search')
+    parser.add_argument('--search-budget-seconds', type=float, default=None,
+                        help='Wall-clock budget for the halving search')
+    parser.add_argument('--search-patience', type=int, default=2,
+                        help='Halving rounds without F1 improvement before stopping')
     args = parser.parse_args()
 
-    df = load_data(args.csv)
+    timings = {}
+    with stage(timings, 'load_data'):
+        df = load_data(args.csv)
+        if args.features:
+            df = join_store_features(df, args.features)
     print('\nData preview:')
     print(df.head())
 
-    X, y = preprocess(df, target_col=args.target)
-
-    model = train_and_evaluate(X, y, model_path=args.model_out)
+    with stage(timings, 'preprocess'):
+        X, y = preprocess(df, target_col=args.target, inplace=True)
+        if args.features:
+            # The API scores with the feature store columns only, so train on exactly those
+            X = X[MODEL_FEATURES]
+            print(f'Training on the serving features: {MODEL_FEATURES}')
+
+    model = train_and_evaluate(X, y, model_path=args.model_out, n_jobs=args.n_jobs,
+                               backend=args.backend, cache_dir=args.cache_dir, timings=timings,
+                               search=args.search, resource=args.search_resource,
+                               budget_seconds=args.search_budget_seconds, patience=args.search_patience)
+    print('\nWall-clock seconds per stage:')
+    for name, seconds in timings.items():
+        print(f'  {name}: {seconds:.2f}')
     explain_random_forest()
 
 
@@ -0,0 +1,256 @@
+"""
+Scheduled risk recomputation for the whole student population.
+
+Single-student writes rescore only that student, so predictions drift as time
+passes and models change. This job rescores everyone. Student IDs are split
+into chunks of RECOMPUTE_CHUNK_SIZE and handed to a pool of RECOMPUTE_WORKERS
+processes. Each worker pulls a chunk's features with one grouped query per
+source table (build_feature_matrix) and scores the chunk with one model call,
+falling back to the threshold bands for incomplete rows. It then writes
+risk_predictions with one executemany upsert and refreshes the chunk's
+student_summary rows in the same transaction.
+
+Workers are started with the ``spawn`` method, so a run can be started from the
+threaded API server, and each worker loads the model once. Progress and
+throughput are kept on the RecomputeRun.
+
+Run once, or every N seconds from cron or a supervisor:
+
+    python recompute.py [--workers 4] [--chunk-size 1000] [--every 86400]
+"""
+import argparse
+import collections
+import datetime
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from db import chunked, db_cursor
+from inference import InferenceService, build_feature_matrix, store_predictions
+from model_registry import ModelRegistry, DEFAULT_MODEL_PATH
+from summary import refresh_student_summary
+
+logger = logging.getLogger(__name__)
+
+RECOMPUTE_WORKERS = int(os.getenv('RECOMPUTE_WORKERS', str(min(4, os.cpu_count() or 1))))
+RECOMPUTE_CHUNK_SIZE = int(os.getenv('RECOMPUTE_CHUNK_SIZE', '1000'))
+# Errors kept per run; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+# Set in each worker process by _init_worker
+_worker_inference = None
+
+
+def _init_worker(model_path):
+    global _worker_inference
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    registry = ModelRegistry(model_path)
+    registry.preload()
+    _worker_inference = InferenceService(registry)
+
+
+def recompute_chunk(student_ids, inference_service=None):
+    """
+    Rescore one chunk of students and write the results; returns a summary dict.
+
+    Runs in a pool worker (using its model) or in-process with an explicit
+    ``inference_service``.
+    """
+    inference_service = inference_service or _worker_inference
+    start = time.perf_counter()
+    with db_cursor() as (conn, cursor):
+        features = build_feature_matrix(cursor, student_ids)
+        scored = inference_service.score(features)
+        store_predictions(cursor, scored)
+        refresh_student_summary(cursor, student_ids)
+        conn.commit()
+    return {
+        'students': len(scored),
+        'seconds': time.perf_counter() - start,
+        'risk_distribution': scored['risk_level'].value_counts().to_dict(),
+        'scored_by': scored['scored_by'].value_counts().to_dict(),
+    }
+
+
+class RecomputeRun:
+    """Progress of one population recomputation."""
+
+    def __init__(self, workers, chunk_size):
+        self.run_id = uuid.uuid4().hex
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.status = 'queued'
+        self.students_total = 0
+        self.students_done = 0
+        self.chunks_total = 0
+        self.chunks_done = 0
+        self.chunks_failed = 0
+        self.risk_distribution = collections.Counter()
+        self.scored_by = collections.Counter()
+        self.errors = []
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._started = None
+        self._finished = None
+        # Seconds spent inside workers, summed over chunks
+        self.worker_seconds = 0.0
+
+    @property
+    def finished(self):
+        return self.status in ('completed', 'failed')
+
+    def _add_chunk(self, result):
+        self.chunks_done += 1
+        self.students_done += result['students']
+        self.worker_seconds += result['seconds']
+        self.risk_distribution.update(result['risk_distribution'])
+        self.scored_by.update(result['scored_by'])
+
+    def to_dict(self):
+        end = self._finished or time.monotonic()
+        elapsed = end - self._started if self._started else 0.0
+        rate = self.students_done / elapsed if elapsed else None
+        remaining = self.students_total - self.students_done
+        return {
+            'run_id': self.run_id,
+            'status': self.status,
+            'workers': self.workers,
+            'chunk_size': self.chunk_size,
+            'students_total': self.students_total,
+            'students_done': self.students_done,
+            'chunks_total': self.chunks_total,
+            'chunks_done': self.chunks_done,
+            'chunks_failed': self.chunks_failed,
+            'progress': round(self.students_done / self.students_total, 4) if self.students_total else None,
+            'elapsed_seconds': round(elapsed, 2),
+            'students_per_second': round(rate, 1) if rate else None,
+            'eta_seconds': round(remaining / rate, 1) if rate and not self.finished else None,
+            'mean_chunk_seconds': round(self.worker_seconds / self.chunks_done, 3) if self.chunks_done else None,
+            'risk_distribution': dict(self.risk_distribution),
+            'scored_by': dict(self.scored_by),
+            'errors': self.errors,
+            'error': self.error,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+def recompute_population(run=None, workers=RECOMPUTE_WORKERS, chunk_size=RECOMPUTE_CHUNK_SIZE,
+                         model_path=DEFAULT_MODEL_PATH):
+    """Rescore every student, updating ``run`` as chunks finish; returns the run."""
+    run = run or RecomputeRun(workers, chunk_size)
+    run.status = 'running'
+    run.started_at = datetime.datetime.now()
+    run._started = time.monotonic()
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute("SELECT student_id FROM students ORDER BY student_id")
+            student_ids = [str(row[0]) for row in cursor.fetchall()]
+        chunks = list(chunked(student_ids, chunk_size))
+        run.students_total = len(student_ids)
+        run.chunks_total = len(chunks)
+
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(model_path,)) as executor:
+            futures = {executor.submit(recompute_chunk, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                try:
+                    run._add_chunk(future.result())
+                except Exception as e:
+                    chunk = futures[future]
+                    run.chunks_failed += 1
+                    if len(run.errors) < MAX_REPORTED_ERRORS:
+                        run.errors.append(f"Chunk {chunk[0]}..{chunk[-1]}: {e}")
+                    logger.error(f"Risk recomputation failed for chunk {chunk[0]}..{chunk[-1]}: {e}")
+        run.status = 'completed'
+        logger.info(f"Recomputed risk for {run.students_done} of {run.students_total} students "
+                    f"in {time.monotonic() - run._started:.1f}s ({run.chunks_failed} chunks failed)")
+    except Exception as e:
+        run.status = 'failed'
+        run.error = str(e)
+        logger.error(f"Risk recomputation failed: {e}")
+    finally:
+        run.finished_at = datetime.datetime.now()
+        run._finished = time.monotonic()
+    return run
+
+
+def check_run_options(workers, chunk_size):
+    """Raise ValueError, with a message for the client, unless both are usable integers."""
+    max_workers = os.cpu_count() or 1
+    if type(workers) is not int or not 1 <= workers <= max_workers:
+        raise ValueError(f"workers must be an integer between 1 and {max_workers}")
+    if type(chunk_size) is not int or chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+
+
+class RecomputeScheduler:
+    """Runs population recomputations in a background thread, one at a time."""
+
+    def __init__(self, workers=RECOMPUTE_WORKERS, chunk_size=RECOMPUTE_CHUNK_SIZE, model_path=DEFAULT_MODEL_PATH,
+                 on_complete=None):
+        self.workers = min(workers, os.cpu_count() or 1)
+        self.chunk_size = chunk_size
+        self.model_path = model_path
+        # Called after a run, e.g. to invalidate cached responses
+        self.on_complete = on_complete
+        self.current = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self.current = None
+        self._lock = threading.Lock()
+
+    def start(self, workers=None, chunk_size=None):
+        """
+        Start a run unless one is in progress; returns ``(run, started)``.
+
+        Raises ValueError for workers or chunk_size that check_run_options rejects.
+        """
+        workers = self.workers if workers is None else workers
+        chunk_size = self.chunk_size if chunk_size is None else chunk_size
+        check_run_options(workers, chunk_size)
+        with self._lock:
+            if self.current is not None and not self.current.finished:
+                return self.current, False
+            run = RecomputeRun(workers, chunk_size)
+            self.current = run
+        threading.Thread(target=self._run, args=(run,), name='risk-recompute', daemon=True).start()
+        return run, True
+
+    def _run(self, run):
+        recompute_population(run, run.workers, run.chunk_size, self.model_path)
+        if self.on_complete is not None and run.students_done:
+            self.on_complete()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute risk predictions for every student.')
+    parser.add_argument('--workers', type=int, default=RECOMPUTE_WORKERS, help='Worker processes')
+    parser.add_argument('--chunk-size', type=int, default=RECOMPUTE_CHUNK_SIZE, help='Students per chunk')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='Model artifact to score with')
+    parser.add_argument('--every', type=float, help='Repeat every N seconds instead of running once')
+    args = parser.parse_args()
+    try:
+        check_run_options(args.workers, args.chunk_size)
+    except ValueError as e:
+        parser.error(str(e))
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    while True:
+        run = recompute_population(workers=args.workers, chunk_size=args.chunk_size, model_path=args.model)
+        logger.info(f"Run {run.run_id}: {run.to_dict()}")
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    main()
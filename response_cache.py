@@ -0,0 +1,208 @@
+"""
+Response cache for the dashboard's read endpoints.
+
+Cached responses are keyed by endpoint, URL path and query string, and tagged
+(for example ``student:<id>``, ``students``, ``class_trends``). Each tag has a
+generation number that is part of the key, so a write endpoint invalidates every
+response carrying a tag by bumping its generation; old entries are never read
+again and age out of the LRU or expire with the TTL.
+
+Entries live in an in-process LRU by default. Set CACHE_REDIS_URL to share them
+through a local Redis-compatible server (needs the ``redis`` package); if it
+cannot be used, the in-process LRU is used instead.
+
+Every cached response carries an ETag, and a matching If-None-Match is answered
+with 304 Not Modified.
+"""
+import collections
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import request, make_response
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '2048'))
+CACHE_TTL_SECONDS = float(os.getenv('CACHE_TTL_SECONDS', '300'))
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+CACHE_ENABLED = os.getenv('CACHE_ENABLED', '1') != '0'
+
+# Bumped by invalidate_all(); part of every key
+GLOBAL_TAG = '*'
+
+
+class LRUBackend:
+    """Thread-safe in-process LRU with per-entry expiry."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._generations = collections.defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generations(self, tags):
+        with self._lock:
+            return [self._generations[tag] for tag in tags]
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """The same interface over a Redis-compatible server."""
+
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._client.ping()
+
+    def get(self, key):
+        value = self._client.get(f'cache:{key}')
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.setex(f'cache:{key}', max(1, int(ttl)), json.dumps(value))
+
+    def generations(self, tags):
+        values = self._client.mget([f'cache-gen:{tag}' for tag in tags])
+        return [int(v) if v is not None else 0 for v in values]
+
+    def bump(self, tags):
+        pipe = self._client.pipeline(transaction=False)
+        for tag in tags:
+            pipe.incr(f'cache-gen:{tag}')
+        pipe.execute()
+
+    def __len__(self):
+        return self._client.dbsize()
+
+
+def _make_backend():
+    if CACHE_REDIS_URL:
+        try:
+            backend = RedisBackend(CACHE_REDIS_URL)
+            logger.info(f"Response cache using Redis at {CACHE_REDIS_URL}")
+            return backend
+        except Exception as e:
+            logger.warning(f"Redis cache unavailable ({e}); using the in-process cache")
+    return LRUBackend()
+
+
+class ResponseCache:
+    def __init__(self, backend=None, ttl_seconds=CACHE_TTL_SECONDS, enabled=CACHE_ENABLED):
+        self.backend = backend or _make_backend()
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._counts = collections.defaultdict(lambda: {'hits': 0, 'misses': 0, 'not_modified': 0})
+        self.invalidations = 0
+
+    def cached(self, *tag_templates):
+        """
+        Cache a GET view's 200 responses.
+
+        Tag templates are formatted with the view's keyword arguments, e.g.
+        ``'student:{student_id}'``.
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+                tags = [GLOBAL_TAG] + [t.format(**kwargs) for t in tag_templates]
+                generations = self.backend.generations(tags)
+                query = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+                key = f"{request.endpoint}:{request.path}?{query}:" + ','.join(
+                    f'{tag}={gen}' for tag, gen in zip(tags, generations))
+                counts = self._counts[request.endpoint]
+
+                entry = self.backend.get(key)
+                if entry is not None:
+                    counts['hits'] += 1
+                    return self._respond(entry, counts)
+
+                counts['misses'] += 1
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                entry = {
+                    'body': body.decode('utf-8'),
+                    'mimetype': response.mimetype,
+                    'headers': {k: v for k, v in response.headers.items() if k.startswith('X-')},
+                    'etag': hashlib.sha1(body).hexdigest(),
+                }
+                self.backend.set(key, entry, self.ttl_seconds)
+                return self._respond(entry, counts)
+            return wrapper
+        return decorator
+
+    def _respond(self, entry, counts):
+        if request.if_none_match.contains(entry['etag']):
+            counts['not_modified'] += 1
+            response = make_response('', 304)
+        else:
+            response = make_response(entry['body'], 200)
+            response.mimetype = entry['mimetype']
+            response.headers.update(entry['headers'])
+        response.set_etag(entry['etag'])
+        # Let clients revalidate instead of reusing a copy the server has invalidated
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def invalidate(self, *tags):
+        """Drop every cached response carrying any of the tags."""
+        tags = [tag for tag in tags if tag]
+        if tags:
+            self.backend.bump(tags)
+            self.invalidations += len(tags)
+
+    def invalidate_students(self, student_ids, *tags):
+        """Invalidate the given students' entries plus any other tags."""
+        self.invalidate(*[f'student:{sid}' for sid in dict.fromkeys(student_ids)], *tags)
+
+    def invalidate_all(self):
+        self.invalidate(GLOBAL_TAG)
+
+    def stats(self):
+        hits = sum(c['hits'] for c in self._counts.values())
+        misses = sum(c['misses'] for c in self._counts.values())
+        return {
+            'enabled': self.enabled,
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'ttl_seconds': self.ttl_seconds,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+            'invalidations': self.invalidations,
+            'endpoints': {endpoint: dict(c) for endpoint, c in self._counts.items()},
+        }
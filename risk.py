@@ -0,0 +1,122 @@
+"""
+Risk bands shared by the single-student and batch risk endpoints.
+
+Without a model, a student's band is decided by their average performance
+percentage. The scalar helper is used when scoring one student; the vectorized
+helper scores a whole cohort at once with numpy instead of a Python loop. When
+the ML model scores a student, its at-risk probability is banded the same way.
+"""
+import numpy as np
+import pandas as pd
+
+NO_DATA = "No Data"
+
+# (minimum average percentage, risk level), checked top to bottom
+RISK_BANDS = [
+    (75, "Low"),
+    (60, "Medium"),
+    (50, "High"),
+]
+LOWEST_BAND = "Very High"
+
+RECOMMENDATIONS = {
+    "Low": "Student is performing excellently. Continue current support and consider advanced opportunities.",
+    "Medium": "Student is performing adequately but could benefit from additional support and monitoring.",
+    "High": "Student is at risk of academic failure. Implement immediate intervention strategies.",
+    "Very High": "Student is in critical academic danger. Urgent and comprehensive intervention required.",
+    NO_DATA: "No performance data found for this student. Please add performance records to assess risk.",
+}
+
+# Shorter wording stored in risk_predictions.recommendation
+STORED_RECOMMENDATIONS = {
+    "Low": "Student is performing excellently.",
+    "Medium": "Student is performing adequately but could benefit from additional support.",
+    "High": "Student is at risk of academic failure.",
+    "Very High": "Student is in critical academic danger.",
+    NO_DATA: "No performance data found for this student.",
+}
+
+
+# (minimum percentage, grade), checked top to bottom
+GRADE_BANDS = [
+    (75, "A"),
+    (70, "B"),
+    (60, "C"),
+    (50, "D"),
+]
+LOWEST_GRADE = "F"
+
+
+def grade_for_percentage(percentage):
+    """Return the letter grade stored with a performance record."""
+    for minimum, grade in GRADE_BANDS:
+        if percentage >= minimum:
+            return grade
+    return LOWEST_GRADE
+
+
+def classify_average(average_percentage):
+    """Return the risk level for one average percentage (None means no data)."""
+    if average_percentage is None:
+        return NO_DATA
+    for minimum, level in RISK_BANDS:
+        if average_percentage >= minimum:
+            return level
+    return LOWEST_BAND
+
+
+def classify_averages(average_percentages):
+    """
+    Vectorized classify_average over an array or Series of averages.
+
+    NaN entries (students without performance rows) are classified as "No Data".
+    """
+    averages = np.asarray(average_percentages, dtype=float)
+    conditions = [np.isnan(averages)] + [averages >= minimum for minimum, _ in RISK_BANDS]
+    choices = [NO_DATA] + [level for _, level in RISK_BANDS]
+    return np.select(conditions, choices, default=LOWEST_BAND)
+
+
+# How much each model class contributes to a student's risk score. Label models
+# (trained on risk levels) and python.py's pass/fail pipeline (1 = pass) are both
+# reduced to one expected-risk number in [0, 1].
+CLASS_RISK_WEIGHTS = {
+    "Low": 0.0,
+    "Medium": 0.5,
+    "High": 1.0,
+    "Very High": 1.0,
+    0: 1.0,
+    1: 0.0,
+}
+
+# (minimum risk score, risk level), checked top to bottom
+PROBABILITY_BANDS = [
+    (0.75, "Very High"),
+    (0.5, "High"),
+    (0.25, "Medium"),
+]
+LOWEST_PROBABILITY_BAND = "Low"
+
+
+def classify_probabilities(probabilities):
+    """Vectorized risk level for risk scores in [0, 1]."""
+    probabilities = np.asarray(probabilities, dtype=float)
+    conditions = [probabilities >= minimum for minimum, _ in PROBABILITY_BANDS]
+    choices = [level for _, level in PROBABILITY_BANDS]
+    return np.select(conditions, choices, default=LOWEST_PROBABILITY_BAND)
+
+
+def summarize_performance(performance):
+    """
+    Average percentage and record count per student from performance rows.
+
+    ``performance`` is a DataFrame with student_id, mark and max_mark columns;
+    rows with a NULL mark (students without records, from a LEFT JOIN) count
+    towards neither the average nor the record count.
+    """
+    percentage = performance['mark'].astype(float) / performance['max_mark'].astype(float) * 100
+    grouped = percentage.groupby(performance['student_id'], sort=False)
+    return pd.DataFrame({
+        'average_percentage': grouped.mean(),
+        'performance_count': grouped.count(),
+    })
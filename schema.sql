@@ -0,0 +1,58 @@
+-- Tables and indexes maintained by the API on top of the core Unizulu_db schema.
+-- Applied at startup by db.apply_schema(); every statement must be idempotent.
+
+-- One precomputed row per student for /api/students, kept current by the write
+-- endpoints (see summary.py).
+CREATE TABLE IF NOT EXISTS student_summary (
+    student_id VARCHAR(20) NOT NULL PRIMARY KEY,
+    first_name VARCHAR(100),
+    last_name VARCHAR(100),
+    program VARCHAR(150),
+    last_login DATETIME NULL,
+    risk_level VARCHAR(20) NOT NULL DEFAULT 'No Data',
+    prediction_date DATE NULL,
+    risk_score DECIMAL(10, 4) NULL,
+    attendance_rate DECIMAL(6, 2) NULL,
+    assignment_avg DECIMAL(6, 2) NULL,
+    lms_activity DECIMAL(10, 2) NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    KEY idx_student_summary_program (program, student_id),
+    KEY idx_student_summary_risk (risk_level, student_id)
+);
+
+-- Running sum of performance percentages and record count per student, kept
+-- alongside risk_predictions and adjusted by delta on every performance write
+-- (see aggregates.py), so a student's average never needs a full re-read.
+CREATE TABLE IF NOT EXISTS performance_aggregates (
+    student_id VARCHAR(20) NOT NULL PRIMARY KEY,
+    percentage_sum DOUBLE NOT NULL DEFAULT 0,
+    record_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Performance percentages summed per subject, semester, academic year and
+-- assessment day for /api/analysis/class_trends. Adjusted by the same deltas as
+-- performance_aggregates; undated records fall on 1000-01-01.
+CREATE TABLE IF NOT EXISTS performance_rollup (
+    subject_code VARCHAR(20) NOT NULL,
+    semester VARCHAR(10) NOT NULL,
+    academic_year INT NOT NULL,
+    day DATE NOT NULL,
+    percentage_sum DOUBLE NOT NULL DEFAULT 0,
+    record_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (subject_code, semester, academic_year, day),
+    KEY idx_performance_rollup_day (day)
+);
+
+-- Attendance percentages summed per course, for the class attendance average.
+CREATE TABLE IF NOT EXISTS attendance_rollup (
+    course_id INT NOT NULL PRIMARY KEY,
+    percentage_sum DOUBLE NOT NULL DEFAULT 0,
+    record_count INT NOT NULL DEFAULT 0
+);
+
+-- Filters of GET /api/performance (performance.py). InnoDB appends the primary
+-- key to secondary indexes, so each also serves the performance_id keyset order.
+CREATE INDEX idx_performance_year_semester ON performance (academic_year, semester);
+CREATE INDEX idx_performance_subject ON performance (subject_code);
+CREATE INDEX idx_performance_lecturer ON performance (lecturer_id);
@@ -0,0 +1,355 @@
+"""
+In-memory search index over student_id, names and program.
+
+Each field keeps a sorted list of its lowercase tokens and, per token, the
+sorted list of students having it. A prefix lookup is a bisect into the token
+list; the matching posting lists are merged lazily in student_id order, so a
+page only walks ``offset + limit`` results however common the term is.
+Single-term queries that need more results fall back to a substring scan of one
+lowercase string holding every student's fields (``str.find`` in C), which
+keeps ``LIKE '%term%'`` behaviour without an n-gram table per student.
+With several terms, every term must prefix-match. Students matching every
+term at its best tier come first: the smallest of those groups is walked in
+student_id order and checked against the other terms with substring tests on
+the student's own token strings, so a page stops after ``offset + limit`` of
+them. Lower totals are scored and sorted only if a page goes past that group.
+
+Results are ranked by where the term matched (see FIELD_WEIGHTS); exact token
+matches rank above prefixes, and substring matches come last. Ties are broken
+by student_id, so ``offset``/``limit`` pages are stable between keystrokes.
+
+The index is per process. It is rebuilt at startup, updated by the endpoints
+that change students, and reloaded in the background once it is older than
+SEARCH_INDEX_MAX_AGE_SECONDS so students added through other processes appear.
+"""
+import bisect
+import collections
+import heapq
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_MAX_AGE_SECONDS = float(os.getenv('SEARCH_INDEX_MAX_AGE_SECONDS', '600'))
+
+SEARCH_FIELDS = ['student_id', 'first_name', 'last_name', 'program']
+# Score of a prefix match per field; an exact token match scores double
+FIELD_WEIGHTS = {'student_id': 8, 'last_name': 4, 'first_name': 4, 'program': 1}
+SUBSTRING_SCORE = 0.5
+
+_TOKEN_SPLIT = re.compile(r'[^\w@.]+')
+# Separates students in the substring haystack; never part of a query
+_RECORD_SEPARATOR = '\x1e'
+# Separates tokens in a student's field strings; never part of a token
+_TOKEN_BOUNDARY = '\0'
+
+
+def _merged(lists):
+    """Union of sorted posting lists in order, possibly with repeats."""
+    # A few lists merge lazily; many (every student_id under a prefix) sort faster in C
+    if len(lists) <= 16:
+        return heapq.merge(*lists)
+    return sorted(itertools.chain.from_iterable(lists))
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_SPLIT.split(str(text or '').lower()) if t]
+
+
+class StudentSearchIndex:
+    def __init__(self, max_age_seconds=SEARCH_INDEX_MAX_AGE_SECONDS):
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.RLock()
+        self._reloading = False
+        self._reset({})
+        self.loaded_at = None
+
+    def _reset(self, documents):
+        # Caller holds the lock (or owns the index exclusively)
+        self._documents = {}
+        # student_id -> one '\0tok\0tok\0' string per field, for scoring multi-term candidates
+        self._document_fields = {}
+        self._tokens = {field: [] for field in SEARCH_FIELDS}
+        self._postings = {field: {} for field in SEARCH_FIELDS}
+        # Substring haystack: records are appended; a student's current record
+        # is the one at _record_of[student_id], older ones are skipped
+        self._haystack_parts = []
+        self._haystack = ''
+        self._offsets = []
+        self._ids = []
+        self._record_of = {}
+        self._haystack_length = 0
+        for student_id in sorted(documents):
+            self._add(documents[student_id])
+
+    def __len__(self):
+        return len(self._documents)
+
+    @property
+    def loaded(self):
+        return self.loaded_at is not None
+
+    # --- Maintenance ------------------------------------------------------
+
+    def load(self, cursor):
+        """Rebuild the index from the students table (``cursor`` is a tuple cursor)."""
+        cursor.execute(f"SELECT {', '.join(SEARCH_FIELDS)} FROM students")
+        documents = {str(row[0]): dict(zip(SEARCH_FIELDS, row), student_id=str(row[0])) for row in cursor.fetchall()}
+        fresh = StudentSearchIndex(self.max_age_seconds)
+        fresh._reset(documents)
+        fresh._flush_haystack()
+        with self._lock:
+            for name in ('_documents', '_document_fields', '_tokens', '_postings', '_haystack_parts', '_haystack', '_offsets',
+                         '_ids', '_record_of', '_haystack_length'):
+                setattr(self, name, getattr(fresh, name))
+            self.loaded_at = time.monotonic()
+        logger.info(f"Search index built for {len(documents)} students")
+
+    def maybe_reload(self, loader):
+        """Reload in a background thread with ``loader(index)`` once the index is too old."""
+        if not self.loaded or time.monotonic() - self.loaded_at < self.max_age_seconds:
+            return
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+
+        def run():
+            try:
+                loader(self)
+            except Exception as e:
+                logger.error(f"Search index reload failed: {e}")
+            finally:
+                self._reloading = False
+        threading.Thread(target=run, name='search-index-reload', daemon=True).start()
+
+    def _add(self, document):
+        student_id = document['student_id']
+        self._documents[student_id] = document
+        self._document_fields[student_id] = tuple(
+            _TOKEN_BOUNDARY + _TOKEN_BOUNDARY.join(tokenize(document.get(field))) + _TOKEN_BOUNDARY for field in SEARCH_FIELDS)
+        for field in SEARCH_FIELDS:
+            postings = self._postings[field]
+            for token in set(tokenize(document.get(field))):
+                if token not in postings:
+                    postings[token] = []
+                    bisect.insort(self._tokens[field], token)
+                bisect.insort(postings[token], student_id)
+        text = ' '.join(str(document.get(f) or '') for f in SEARCH_FIELDS).lower() + _RECORD_SEPARATOR
+        self._record_of[student_id] = len(self._offsets)
+        self._offsets.append(self._haystack_length)
+        self._ids.append(student_id)
+        self._haystack_parts.append(text)
+        self._haystack_length += len(text)
+
+    def _discard(self, student_id):
+        document = self._documents.pop(student_id, None)
+        if document is None:
+            return
+        self._record_of.pop(student_id, None)
+        self._document_fields.pop(student_id, None)
+        for field in SEARCH_FIELDS:
+            postings = self._postings[field]
+            for token in set(tokenize(document.get(field))):
+                ids = postings.get(token)
+                if ids is None:
+                    continue
+                i = bisect.bisect_left(ids, student_id)
+                if i < len(ids) and ids[i] == student_id:
+                    del ids[i]
+                if not ids:
+                    del postings[token]
+                    tokens = self._tokens[field]
+                    del tokens[bisect.bisect_left(tokens, token)]
+
+    def upsert(self, student_id, **fields):
+        """Add a student or update some of their fields."""
+        student_id = str(student_id)
+        with self._lock:
+            document = dict(self._documents.get(student_id, {}), **fields, student_id=student_id)
+            self._discard(student_id)
+            self._add(document)
+
+    def remove(self, student_id):
+        with self._lock:
+            self._discard(str(student_id))
+
+    def _flush_haystack(self):
+        # Caller holds the lock; joins records appended since the last search
+        if self._haystack_parts:
+            self._haystack += ''.join(self._haystack_parts)
+            self._haystack_parts = []
+
+    # --- Queries -----------------------------------------------------------
+
+    def _tiers(self, term):
+        """``[(score, posting lists)]`` of the exact and prefix matches of ``term``, best first."""
+        tiers = collections.defaultdict(list)
+        for field in SEARCH_FIELDS:
+            postings = self._postings[field]
+            weight = FIELD_WEIGHTS[field]
+            if term in postings:
+                tiers[weight * 2].append(postings[term])
+            tokens = self._tokens[field]
+            start = bisect.bisect_right(tokens, term)
+            end = bisect.bisect_left(tokens, term + '\uffff', start)
+            tiers[weight].extend(map(postings.__getitem__, tokens[start:end]))
+        return sorted(((score, lists) for score, lists in tiers.items() if lists), reverse=True,
+                      key=lambda tier: tier[0])
+
+    def _ranked(self, term):
+        """Yield ``(student_id, score)`` best first, each student once."""
+        seen = set()
+        for score, lists in self._tiers(term):
+            for student_id in heapq.merge(*lists):
+                if student_id not in seen:
+                    seen.add(student_id)
+                    yield student_id, score
+        yield from self._substring_matches(term, seen)
+
+    @staticmethod
+    def _needles(term, score=None):
+        """``[(field index, substring, score)]`` testing a field string for ``term``; only tiers scoring ``score`` if given."""
+        needles = []
+        for i, field in enumerate(SEARCH_FIELDS):
+            weight = FIELD_WEIGHTS[field]
+            for needle, needle_score in ((_TOKEN_BOUNDARY + term + _TOKEN_BOUNDARY, weight * 2), (_TOKEN_BOUNDARY + term, weight)):
+                if score is None or needle_score == score:
+                    needles.append((i, needle, needle_score))
+        return needles
+
+    def _score(self, student_id, term_needles):
+        """Sum of each term's best match in the student's fields, or None if a term does not match."""
+        fields = self._document_fields[student_id]
+        total = 0
+        for needles in term_needles:
+            best = max((score for i, needle, score in needles if needle in fields[i]), default=0)
+            if not best:
+                return None
+            total += best
+        return total
+
+    def _best_tier(self, term):
+        """``(score, ranges)`` of the best match of ``term``; ranges are ``(field, start, end)`` in the field's tokens."""
+        best, ranges = 0, []
+        for field in SEARCH_FIELDS:
+            tokens = self._tokens[field]
+            weight = FIELD_WEIGHTS[field]
+            start = bisect.bisect_left(tokens, term)
+            end = bisect.bisect_left(tokens, term + '\uffff', start)
+            matches = []
+            if start < end and tokens[start] == term:
+                matches.append((weight * 2, start, start + 1))
+                start += 1
+            if start < end:
+                matches.append((weight, start, end))
+            for score, start, end in matches:
+                if score > best:
+                    best, ranges = score, []
+                if score == best:
+                    ranges.append((field, start, end))
+        return best, ranges
+
+    def _range_lists(self, ranges):
+        return [ids for field, start, end in ranges
+                for ids in map(self._postings[field].__getitem__, self._tokens[field][start:end])]
+
+    def _ranked_all(self, terms):
+        """
+        Yield ``(student_id, score)`` best first for students matching every term.
+
+        A student's score is the sum of each term's best match.
+        """
+        best_tiers = [self._best_tier(term) for term in terms]
+        if not all(score for score, _ in best_tiers):
+            return
+        top = sum(score for score, _ in best_tiers)
+
+        # Students matching every term at its best tier come from the smallest such
+        # group. Each token has at least one posting, so a range with more tokens
+        # than the smallest group has postings is never counted.
+        def token_count(i):
+            return sum(end - start for _, start, end in best_tiers[i][1])
+        driver, driver_lists, driver_size = None, None, None
+        for i in sorted(range(len(terms)), key=token_count):
+            if driver_size is not None and token_count(i) >= driver_size:
+                break
+            lists = self._range_lists(best_tiers[i][1])
+            size = sum(map(len, lists))
+            if driver_size is None or size < driver_size:
+                driver, driver_lists, driver_size = i, lists, size
+        checks = [[(i, needle) for i, needle, _ in self._needles(term, score)]
+                  for n, (term, (score, _)) in enumerate(zip(terms, best_tiers)) if n != driver]
+
+        fields = self._document_fields
+        best = set()
+        previous = None
+        for student_id in _merged(driver_lists):
+            if student_id == previous:
+                continue
+            previous = student_id
+            document = fields[student_id]
+            for needles in checks:
+                for i, needle in needles:
+                    if needle in document[i]:
+                        break
+                else:
+                    break
+            else:
+                best.add(student_id)
+                yield student_id, top
+
+        # Only reached when a page goes past the best group
+        term_tiers = [self._tiers(term) for term in terms]
+        all_lists = min(([ids for _, lists in tiers for ids in lists] for tiers in term_tiers),
+                        key=lambda lists: sum(map(len, lists)))
+        term_needles = [self._needles(term) for term in terms]
+        lower = collections.defaultdict(list)
+        for student_id in sorted(set(itertools.chain.from_iterable(all_lists)) - best):
+            score = self._score(student_id, term_needles)
+            if score is not None:
+                lower[score].append(student_id)
+        for score in sorted(lower, reverse=True):
+            for student_id in lower[score]:
+                yield student_id, score
+
+    def _substring_matches(self, term, seen):
+        self._flush_haystack()
+        haystack = self._haystack
+        position = haystack.find(term)
+        while position != -1:
+            record = bisect.bisect_right(self._offsets, position) - 1
+            student_id = self._ids[record]
+            # Skip superseded records of updated or removed students
+            if self._record_of.get(student_id) == record and student_id not in seen:
+                seen.add(student_id)
+                yield student_id, SUBSTRING_SCORE
+            next_record = self._offsets[record + 1] if record + 1 < len(self._offsets) else len(haystack)
+            position = haystack.find(term, next_record)
+
+    def search(self, query, limit=50, offset=0):
+        """
+        Return ``(documents, next_offset)`` for a query; every term must match.
+
+        ``next_offset`` is None on the last page.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return [], None
+        with self._lock:
+            ranked = self._ranked(terms[0]) if len(terms) == 1 else self._ranked_all(terms)
+            page = list(itertools.islice(ranked, offset, offset + limit + 1))
+            results = [dict(self._documents[sid], score=score) for sid, score in page[:limit]]
+        next_offset = offset + limit if len(page) > limit else None
+        return results, next_offset
+
+    def stats(self):
+        return {
+            'students': len(self),
+            'tokens': sum(len(tokens) for tokens in self._tokens.values()),
+            'age_seconds': round(time.monotonic() - self.loaded_at, 1) if self.loaded else None,
+        }
@@ -1,7 +1,7 @@
 import os
 import argparse
-from app import send_risk_alert, app, mail
-from flask_mail import Message
+from app import send_risk_alert, alert_dispatcher
+from alerts import risk_alert_messages, MAIL_DEFAULT_SENDER
 
 
 def build_sample():
@@ -15,49 +15,17 @@ def build_sample():
 
 
 def dry_run_print(form_data):
-    # Build the same body the app uses so it's representative
-    subject = f"Unizulu Risk Alert - {form_data['riskLevel']} Risk Level - {form_data['studentName']}"
-    body = f"""
-UNIZULU RISK ALERT SYSTEM - NEW ALERT SUBMISSION
-
-STUDENT INFORMATION:
--------------------
-Name: {form_data['studentName']}
-Email: {form_data.get('studentEmail', 'Not provided')}
-
-RISK ASSESSMENT:
-----------------
-Risk Level: {form_data['riskLevel']}
-
-ALERT DETAILS:
---------------
-{form_data['alertMessage']}
-
-RECOMMENDATIONS & NEXT STEPS:
------------------------------
-{form_data.get('recommendations', 'Not provided')}
-
----
-This alert was submitted through the Unizulu Risk Alert System.
-"""
-
-    # Determine recipients like the app does
-    student_email = form_data.get('studentEmail', '').strip()
-    recipients = []
-    to_mail_env = os.getenv('TO_MAIL')
-
-    if student_email and '@' in student_email:
-        recipients.append(student_email)
-
-    if to_mail_env and to_mail_env not in recipients:
-        recipients.append(to_mail_env)
+    # Build the same messages the app queues so it's representative
+    messages = risk_alert_messages(form_data)
 
     print('DRY RUN - Message would be sent with:')
-    print('Subject:', subject)
-    print('Sender:', app.config.get('MAIL_DEFAULT_SENDER'))
-    print('Recipients:', recipients)
-    print('Body:')
-    print(body)
+    print('Sender:', MAIL_DEFAULT_SENDER)
+    print('Recipients:', [recipient for recipient, _, _ in messages])
+    if messages:
+        _, subject, body = messages[0]
+        print('Subject:', subject)
+        print('Body:')
+        print(body)
 
 
 def main(dry_run=False):
@@ -69,6 +37,9 @@ def main(dry_run=False):
 
     ok = send_risk_alert(sample)
     print('send_risk_alert returned:', ok)
+    # Send now instead of waiting for the background worker
+    print('Alerts attempted:', alert_dispatcher.drain())
+    print('Outbox:', alert_dispatcher.stats())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,150 @@
+"""
+Maintenance of the student_summary table behind /api/students.
+
+Each write endpoint calls ``refresh_student_summary`` for the students it touched,
+inside its own transaction, so the summary row is recomputed from that student's
+indexed rows only. ``rebuild_student_summary`` recomputes every row and is used
+on first start or to repair drift.
+
+Run ``python summary.py --rebuild`` to rebuild the table by hand.
+"""
+import argparse
+import logging
+
+from db import chunked, placeholders
+
+logger = logging.getLogger(__name__)
+
+# Columns a client may request with /api/students?fields=...
+SUMMARY_FIELDS = [
+    'student_id', 'first_name', 'last_name', 'program', 'last_login',
+    'risk_level', 'prediction_date', 'risk_score',
+    'attendance_rate', 'assignment_avg', 'lms_activity',
+]
+
+REFRESH_SQL = """
+    INSERT INTO student_summary (
+        student_id, first_name, last_name, program, last_login,
+        risk_level, prediction_date, risk_score,
+        attendance_rate, assignment_avg, lms_activity
+    )
+    SELECT
+        s.student_id,
+        s.first_name,
+        s.last_name,
+        s.program,
+        s.last_login,
+        COALESCE(p.risk_level, 'No Data'),
+        p.prediction_date,
+        p.risk_score,
+        (SELECT ROUND(AVG(a.attendance_percentage), 2) FROM attendance a WHERE a.student_id = s.student_id),
+        (SELECT ROUND(AVG(ass.score / ass.max_score) * 100, 2) FROM assessments ass WHERE ass.student_id = s.student_id),
+        (SELECT AVG(l.lms_activity_score) FROM lms_activity l WHERE l.student_id = s.student_id)
+    FROM students s
+    LEFT JOIN risk_predictions p ON p.student_id = s.student_id
+    {where}
+    ON DUPLICATE KEY UPDATE
+        first_name = VALUES(first_name),
+        last_name = VALUES(last_name),
+        program = VALUES(program),
+        last_login = VALUES(last_login),
+        risk_level = VALUES(risk_level),
+        prediction_date = VALUES(prediction_date),
+        risk_score = VALUES(risk_score),
+        attendance_rate = VALUES(attendance_rate),
+        assignment_avg = VALUES(assignment_avg),
+        lms_activity = VALUES(lms_activity)
+"""
+
+
+def refresh_student_summary(cursor, student_ids):
+    """Recompute the summary rows of the given students. The caller commits."""
+    student_ids = list(dict.fromkeys(str(sid) for sid in student_ids))
+    for chunk in chunked(student_ids):
+        cursor.execute(REFRESH_SQL.format(where=f"WHERE s.student_id IN ({placeholders(len(chunk))})"), chunk)
+    return len(student_ids)
+
+
+def delete_student_summary(cursor, student_id):
+    cursor.execute("DELETE FROM student_summary WHERE student_id = %s", (student_id,))
+
+
+def rebuild_student_summary(cursor):
+    """Recompute every summary row and drop rows of students that no longer exist."""
+    cursor.execute(REFRESH_SQL.format(where=""))
+    cursor.execute("""
+        DELETE ss FROM student_summary ss
+        LEFT JOIN students s ON s.student_id = ss.student_id
+        WHERE s.student_id IS NULL
+    """)
+
+
+def ensure_student_summary(cursor):
+    """Rebuild the summary if its row count does not match the students table."""
+    cursor.execute("SELECT (SELECT COUNT(*) FROM students), (SELECT COUNT(*) FROM student_summary)")
+    students, summaries = cursor.fetchone()
+    if students != summaries:
+        logger.info(f"student_summary has {summaries} rows for {students} students; rebuilding")
+        rebuild_student_summary(cursor)
+        return True
+    return False
+
+
+def fetch_students(cursor, fields=None, after=None, limit=None, program=None, risk_level=None):
+    """
+    Read summary rows ordered by student_id with keyset pagination.
+
+    ``after`` is the last student_id of the previous page. Unknown field names
+    raise ValueError.
+    """
+    fields = fields or SUMMARY_FIELDS
+    unknown = [f for f in fields if f not in SUMMARY_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if 'student_id' not in fields:
+        fields = ['student_id'] + list(fields)
+
+    conditions = []
+    params = []
+    if after:
+        conditions.append("student_id > %s")
+        params.append(after)
+    if program:
+        conditions.append("program = %s")
+        params.append(program)
+    if risk_level:
+        conditions.append("risk_level = %s")
+        params.append(risk_level)
+
+    query = f"SELECT {', '.join(fields)} FROM student_summary"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY student_id"
+    if limit:
+        query += " LIMIT %s"
+        params.append(int(limit))
+
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+
+def main():
+    from db import apply_schema, db_cursor
+
+    parser = argparse.ArgumentParser(description='Maintain the student_summary table.')
+    parser.add_argument('--rebuild', action='store_true', help='Recompute every summary row')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    apply_schema()
+    with db_cursor() as (conn, cursor):
+        if args.rebuild:
+            rebuild_student_summary(cursor)
+            logger.info("student_summary rebuilt")
+        else:
+            ensure_student_summary(cursor)
+        conn.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Shared fixtures for the unit tests.
+
+Run from the repository root with the ``pytest`` command. ``python -m pytest``
+runs the repository's own pytest.py script instead of the test runner.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class RecordingCursor:
+    """DB-API cursor stand-in that records statements and returns scripted results."""
+
+    def __init__(self, results=()):
+        # One entry per fetchall()/fetchone() call, in order
+        self.results = list(results)
+        self.executed = []
+        self.rowcount = 0
+
+    def execute(self, query, params=None):
+        self.executed.append((' '.join(query.split()), params))
+
+    def executemany(self, query, rows):
+        self.executed.append((' '.join(query.split()), list(rows)))
+
+    def fetchall(self):
+        return self.results.pop(0) if self.results else []
+
+    def fetchone(self):
+        rows = self.fetchall()
+        return rows[0] if rows else None
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def recording_cursor():
+    return RecordingCursor
@@ -0,0 +1,179 @@
+import time
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import accounts
+from accounts import (HashingBusy, LoginThrottle, PasswordHasher, RateLimiter, SessionManager, find_account,
+                      verify_password)
+
+LECTURER = {'role': 'lecturer', 'user_id': 7, 'full_name': 'Dr N. Zulu', 'first_name': None}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(accounts.time, 'monotonic', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def sessions():
+    return SessionManager(secret='test-secret', session_ttl=60, login_cache_ttl=60, account_check_seconds=60)
+
+
+def test_find_account_prefers_roles_in_login_order(recording_cursor):
+    cursor = recording_cursor([[
+        ('student', 'S1', None, 'Anna', 'pw1'),
+        ('admin', 3, 'Admin', None, 'pw2'),
+    ]])
+    account = find_account(cursor, 'anna@example.com')
+
+    assert account == {'role': 'admin', 'user_id': 3, 'full_name': 'Admin', 'first_name': None, 'credential': 'pw2'}
+    (query, params), = cursor.executed
+    assert query.count('UNION ALL') == 3
+    assert params == {'username': 'anna@example.com'}
+
+
+def test_find_account_returns_none_for_unknown_users(recording_cursor):
+    assert find_account(recording_cursor([[]]), 'nobody') is None
+
+
+def test_verify_password_handles_plain_and_hashed_credentials():
+    hashed = generate_password_hash('s3cret', method='pbkdf2:sha256:1000')
+    assert verify_password('s3cret', 's3cret')
+    assert verify_password(hashed, 's3cret')
+    assert not verify_password(hashed, 'wrong')
+    # A plain-text password that is not a hash never reaches the hash check
+    assert not verify_password('other', 's3cret')
+    assert not verify_password(None, 's3cret')
+
+
+def test_tokens_round_trip_and_can_be_revoked(sessions):
+    token = sessions.issue(LECTURER)
+    assert sessions.verify(token) == LECTURER
+
+    sessions.revoke(token)
+    assert sessions.verify(token) is None
+    assert sessions.verify('not-a-token') is None
+    assert sessions.verify(None) is None
+
+
+def test_tokens_expire(sessions, monkeypatch):
+    token = sessions.issue(LECTURER)
+    issued = time.time()
+    monkeypatch.setattr(time, 'time', lambda: issued + sessions.session_ttl + 5)
+    assert sessions.verify(token) is None
+
+
+def test_tokens_from_another_secret_are_rejected(sessions):
+    other = SessionManager(secret='other-secret')
+    assert sessions.verify(other.issue(LECTURER)) is None
+
+
+def test_login_cache_is_keyed_by_username_and_password(sessions):
+    sessions.remember_login('zulu@example.com', 'pw', LECTURER)
+
+    assert sessions.cached_login('zulu@example.com', 'pw') == LECTURER
+    assert sessions.cached_login('zulu@example.com', 'PW') is None
+    assert sessions.stats()['login_cache_hits'] == 1 and sessions.stats()['login_cache_misses'] == 1
+
+
+def test_forget_user_drops_cached_logins_and_earlier_tokens(sessions, monkeypatch):
+    token = sessions.issue(LECTURER)
+    sessions.remember_login('zulu@example.com', 'pw', LECTURER)
+
+    sessions.forget_user('lecturer', 7)
+
+    assert sessions.verify(token) is None
+    assert sessions.cached_login('zulu@example.com', 'pw') is None
+    # Tokens issued after the account was forgotten (e.g. re-created) are valid
+    later = time.time() + 2
+    monkeypatch.setattr(time, 'time', lambda: later)
+    assert sessions.verify(sessions.issue(LECTURER)) == LECTURER
+
+
+def test_deleted_accounts_are_found_out_by_the_account_check(sessions):
+    token = sessions.issue(LECTURER)
+    checks = []
+
+    def exists(account):
+        checks.append(account['user_id'])
+        return True
+
+    assert sessions.verify(token, exists) == LECTURER
+    assert sessions.verify(token, exists) == LECTURER
+    # Confirmed accounts are not looked up again within account_check_seconds
+    assert checks == [7]
+
+    gone = SessionManager(secret='test-secret', account_check_seconds=60)
+    assert gone.verify(token, lambda account: False) is None
+    assert gone.verify(token) is None
+
+
+def test_failed_account_check_accepts_the_token_and_retries(sessions):
+    token = sessions.issue(LECTURER)
+
+    def unavailable(account):
+        raise ConnectionError('database down')
+
+    assert sessions.verify(token, unavailable) == LECTURER
+    assert sessions.verify(token, lambda account: False) is None
+
+
+def test_rate_limiter_allows_limit_hits_per_window(clock):
+    limiter = RateLimiter(limit=2, window=10)
+
+    assert limiter.hit('1.2.3.4') == 0
+    clock[0] += 4
+    assert limiter.hit('1.2.3.4') == 0
+    assert limiter.hit('1.2.3.4') == pytest.approx(6)
+    assert limiter.hit('5.6.7.8') == 0
+
+    # The oldest attempt leaves the window; refused attempts were not counted
+    clock[0] += 6
+    assert limiter.hit('1.2.3.4') == 0
+    assert limiter.hit('1.2.3.4') == pytest.approx(4)
+
+
+def test_rate_limiter_drops_least_recently_seen_keys(clock):
+    limiter = RateLimiter(limit=1, window=60, max_keys=2)
+    limiter.hit('a')
+    limiter.hit('b')
+    limiter.hit('a')
+    limiter.hit('c')
+
+    assert len(limiter) == 2
+    # 'b' was evicted, so it starts a fresh window; 'c' is still limited
+    assert limiter.hit('b') == 0
+    assert limiter.hit('c') > 0
+
+
+def test_login_throttle_limits_addresses_and_usernames(clock):
+    throttle = LoginThrottle(ip_limit=2, ip_window=60, account_limit=1, account_window=60)
+
+    assert throttle.check('10.0.0.1', 'Zulu@Example.com') == 0
+    # Usernames are compared case-insensitively
+    assert throttle.check('10.0.0.2', ' zulu@example.com') > 0
+    assert throttle.check('10.0.0.1', 'other@example.com') == 0
+    assert throttle.check('10.0.0.1', 'third@example.com') > 0
+    assert throttle.stats()['tracked_ips'] == 2
+    rendered = throttle.limited.render()
+    assert 'login_rate_limited_total{scope="account"} 1' in rendered
+    assert 'login_rate_limited_total{scope="ip"} 1' in rendered
+
+
+def test_password_hasher_generates_and_verifies_inline():
+    hasher = PasswordHasher(workers=0, max_pending=1)
+    stored = hasher.generate('s3cret')
+
+    assert verify_password(stored, 's3cret', hasher)
+    assert not verify_password(stored, 'wrong', hasher)
+    assert hasher.stats()['completed'] == 3 and hasher.stats()['pending'] == 0
+
+
+def test_password_hasher_refuses_work_beyond_max_pending():
+    hasher = PasswordHasher(workers=0, max_pending=0)
+    with pytest.raises(HashingBusy):
+        hasher.generate('s3cret')
+    assert 'password_hash_rejected_total{operation="generate",reason="queue_full"} 1' in hasher.rejected.render()
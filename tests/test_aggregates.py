@@ -0,0 +1,55 @@
+import pytest
+
+from aggregates import UNDATED_DAY, add_rows_to_rollup, reconcile_aggregates
+
+
+def test_add_rows_to_rollup_sums_rows_per_key(recording_cursor):
+    cursor = recording_cursor()
+    add_rows_to_rollup(cursor, [
+        ('MTH101', 'S1', 2024, '2024-03-01', 40, 50),
+        ('MTH101', 'S1', 2024, '2024-03-01', 30, 60),
+        (None, None, None, None, 5, 10),
+    ])
+
+    (query, rows), = cursor.executed
+    assert query.startswith('INSERT INTO performance_rollup')
+    assert rows == [
+        ('MTH101', 'S1', 2024, '2024-03-01', 130.0, 2),
+        # NULL key columns map to the fixed values used in the primary key
+        ('', '', 0, UNDATED_DAY, 50.0, 1),
+    ]
+
+
+def test_add_rows_to_rollup_skips_empty_batches(recording_cursor):
+    cursor = recording_cursor()
+    add_rows_to_rollup(cursor, [])
+    assert cursor.executed == []
+
+
+def test_reconcile_reports_drift_without_repairing(recording_cursor):
+    actual = [('S1', 150.0, 2), ('S2', 80.0, 1), ('S3', 60.0, 1)]
+    stored = [('S1', 150.0 + 1e-9, 2), ('S2', 70.0, 1), ('S4', 50.0, 1)]
+    cursor = recording_cursor([actual, stored])
+
+    report = reconcile_aggregates(cursor, repair=False)
+
+    assert report['students_checked'] == 4
+    assert report['repaired'] is False
+    # S1 differs by rounding only; S3 is missing from the table and S4 has no rows left
+    drifted = {row['student_id']: row for row in report['drifted_students']}
+    assert sorted(drifted) == ['S2', 'S3', 'S4']
+    assert report['drifted'] == 3
+    assert drifted['S3']['stored_count'] == 0
+    assert drifted['S4']['actual_sum'] == pytest.approx(0.0)
+    assert not any(query.startswith('DELETE') for query, _ in cursor.executed)
+
+
+def test_reconcile_repair_rewrites_aggregates_and_rollups(recording_cursor):
+    cursor = recording_cursor([[('S1', 50.0, 1)], [('S1', 50.0, 1)]])
+
+    report = reconcile_aggregates(cursor)
+
+    assert report['drifted'] == 0 and report['repaired'] is True
+    deletes = [query for query, _ in cursor.executed if query.startswith('DELETE')]
+    assert deletes == ['DELETE FROM performance_aggregates', 'DELETE FROM performance_rollup',
+                       'DELETE FROM attendance_rollup']
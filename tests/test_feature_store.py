@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import feature_store
+from feature_store import FeatureStore, load_features
+
+COLUMNS = ['attendance_rate', 'test_score']
+
+
+def frame(rows):
+    ids = list(rows)
+    return pd.DataFrame([rows[sid] for sid in ids], index=pd.Index(ids, name='student_id'), columns=COLUMNS)
+
+
+def test_get_features_keeps_request_order_and_fills_missing():
+    store = FeatureStore(columns=COLUMNS, capacity=2)
+    store.put(frame({'S1': [90.0, 70.0], 'S2': [50.0, 40.0], 'S3': [10.0, 20.0]}))
+
+    features = store.get_features(['S3', 'missing', 'S1', 'S3'])
+
+    assert list(features.index) == ['S3', 'missing', 'S1']
+    assert features.loc['S1'].tolist() == [90.0, 70.0]
+    assert features.loc['missing'].isna().all()
+
+
+def test_put_overwrites_existing_rows():
+    store = FeatureStore(columns=COLUMNS)
+    store.put(frame({'S1': [90.0, 70.0]}))
+    store.put(frame({'S1': [80.0, 60.0]}))
+
+    assert len(store) == 1
+    assert store.get_features(['S1']).loc['S1'].tolist() == [80.0, 60.0]
+
+
+def test_discard_moves_last_row_into_the_gap():
+    store = FeatureStore(columns=COLUMNS)
+    store.put(frame({'S1': [1.0, 1.0], 'S2': [2.0, 2.0], 'S3': [3.0, 3.0]}))
+
+    store.discard('S1')
+    store.discard('unknown')
+
+    ids, values = store.view()
+    assert list(ids) == ['S3', 'S2']
+    assert values.tolist() == [[3.0, 3.0], [2.0, 2.0]]
+    assert 'S1' not in store
+    assert store.get_features(['S3']).loc['S3'].tolist() == [3.0, 3.0]
+
+
+def test_view_is_read_only():
+    store = FeatureStore(columns=COLUMNS)
+    store.put(frame({'S1': [1.0, 1.0]}))
+    _, values = store.view()
+    with pytest.raises(ValueError):
+        values[0, 0] = 5.0
+
+
+def test_cursor_rereads_missing_and_expired_rows(monkeypatch):
+    reads = []
+
+    def build(cursor, student_ids):
+        reads.append(list(student_ids))
+        return frame({sid: [99.0, 99.0] for sid in student_ids})
+
+    monkeypatch.setattr(feature_store, 'build_feature_matrix', build)
+    store = FeatureStore(columns=COLUMNS, ttl_seconds=60)
+    store.put(frame({'fresh': [1.0, 1.0], 'old': [2.0, 2.0]}))
+    store._refreshed[store._index['old']] -= 120
+
+    features = store.get_features(['fresh', 'old', 'new'], cursor=object())
+
+    assert reads == [['old', 'new']]
+    assert features['attendance_rate'].tolist() == [1.0, 99.0, 99.0]
+    assert store.stats()['hits'] == 1 and store.stats()['misses'] == 2
+
+
+def test_export_round_trips_through_a_memory_map(tmp_path):
+    store = FeatureStore(columns=COLUMNS)
+    store.put(frame({'S1': [1.0, np.nan], 'S2': [2.0, 3.0]}))
+
+    store.export(tmp_path)
+    loaded = load_features(tmp_path)
+
+    pd.testing.assert_frame_equal(loaded, store.to_frame(), check_index_type=False)
+    assert not loaded.to_numpy().flags.writeable
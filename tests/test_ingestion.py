@@ -0,0 +1,211 @@
+import contextlib
+import datetime
+import io
+
+import openpyxl
+import pytest
+
+import ingestion
+from ingestion import (DEFAULT_PROGRAM, SHEET_CONVERTERS, UNKNOWN_STUDENT, IngestionJob, IngestionService,
+                       _convert_record, _header_and_rows, csv_records)
+from risk import grade_for_percentage
+
+
+class Worksheet:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def iter_rows(self, values_only=True):
+        return iter(self.rows)
+
+
+def test_student_rows_default_the_program():
+    tables = SHEET_CONVERTERS['students']({'student_id': 20240001.0, 'first_name': ' Anna ', 'last_name': 'Zulu',
+                                           'year_of_study': '2'})
+    assert tables == {'students': [('20240001', 'Anna', 'Zulu', DEFAULT_PROGRAM, None, 2)]}
+
+
+def test_performance_rows_get_a_grade_and_defaults():
+    (row,) = SHEET_CONVERTERS['performance']({
+        'student_id': 'S1', 'subject_code': 'MTH101', 'subject_name': 'Maths', 'mark': '45', 'max_mark': 50,
+        'assessment_type': 'Test', 'assessment_date': datetime.datetime(2024, 3, 1, 9, 30),
+    })['performance']
+
+    assert row == ('S1', 'MTH101', 'Maths', 45.0, 50.0, grade_for_percentage(90), 'Test',
+                   datetime.date(2024, 3, 1), '2', datetime.date.today().year)
+
+
+@pytest.mark.parametrize('table, record, message', [
+    ('students', {'student_id': 'S1', 'first_name': 'Anna'}, 'last_name is required'),
+    ('performance', {'student_id': 'S1', 'subject_code': 'M', 'subject_name': 'M', 'mark': 60, 'max_mark': 50,
+                     'assessment_type': 'Test'}, 'exceeds max_mark'),
+    ('performance', {'student_id': 'S1', 'subject_code': 'M', 'subject_name': 'M', 'mark': 1, 'max_mark': 0,
+                     'assessment_type': 'Test'}, 'max_mark must be positive'),
+    ('performance', {'student_id': 'S1', 'subject_code': 'M', 'subject_name': 'M', 'mark': 1, 'max_mark': 5,
+                     'assessment_type': 'Test', 'assessment_date': '01/03/2024'}, 'YYYY-MM-DD'),
+    ('attendance', {'student_id': 'S1', 'attendance_percentage': 101}, 'at most 100'),
+    ('attendance', {'student_id': 'S1', 'attendance_percentage': 'abc'}, 'must be a number'),
+    ('lms_activity', {'student_id': 'S1', 'lms_activity_score': -1}, 'at least 0'),
+    ('lms_activity', {'lms_activity_score': 3}, 'student_id is required'),
+    ('assessments', {'student_id': 'S1', 'assessment_type': 'Quiz', 'score': 30, 'max_score': 20}, 'at most 20'),
+])
+def test_converters_reject_invalid_rows(table, record, message):
+    with pytest.raises(ValueError, match=message):
+        SHEET_CONVERTERS[table](record)
+
+
+def test_records_file_rows_expand_to_students_marks_and_attendance():
+    tables = _convert_record({'student_number': '2024001', 'first_name': 'Anna', 'surname': 'Zulu',
+                              'test1': '70', 'quiz1': '15', 'assignment': '', 'attendance': '0.85',
+                              'email': 'anna@example.com', 'password': 'not imported'})
+
+    assert tables['students'] == [('2024001', 'Anna', 'Zulu', DEFAULT_PROGRAM, 'anna@example.com', None)]
+    assert [(row[3], row[4], row[6]) for row in tables['performance']] == [(70.0, 100, 'Test'), (15.0, 20, 'Quiz')]
+    # Fractions are stored as percentages
+    assert tables['attendance'] == [('2024001', 1, 85.0)]
+
+
+def test_records_file_rejects_marks_above_their_maximum():
+    with pytest.raises(ValueError, match='Quiz1 must be at most 20'):
+        _convert_record({'student_number': '1', 'first_name': 'A', 'surname': 'B', 'quiz1': 25})
+
+
+def test_header_and_rows_normalises_the_header():
+    header, rows = _header_and_rows(Worksheet([(' Student_ID', 'First_Name', None), ('S1', 'Anna', None)]))
+    assert header == ['student_id', 'first_name', '']
+    assert list(rows) == [('S1', 'Anna', None)]
+
+
+def test_header_and_rows_splits_comma_joined_records():
+    header, rows = _header_and_rows(Worksheet([('Student_Number,First_Name,Surname', None),
+                                               ('1,Anna,Zulu', None), (None, None)]))
+    assert header == ['student_number', 'first_name', 'surname']
+    assert list(rows) == [['1', 'Anna', 'Zulu'], []]
+
+
+def test_header_and_rows_handles_empty_sheets():
+    header, rows = _header_and_rows(Worksheet([]))
+    assert header is None and list(rows) == []
+
+
+class Database:
+    """Patched in for ingestion.db_cursor; ``existing`` students are in the students table."""
+
+    def __init__(self, recording_cursor, existing=()):
+        self.existing = set(existing)
+        self.cursors = []
+        self.commits = 0
+        # (table, rows) of every executemany, in order
+        self.batches = []
+        self._recording_cursor = recording_cursor
+
+    @contextlib.contextmanager
+    def __call__(self, dictionary=False):
+        database = self
+
+        class Cursor(self._recording_cursor):
+            def execute(self, query, params=None):
+                super().execute(query, params)
+                if query.startswith('SELECT student_id FROM students'):
+                    self.results.append([(sid,) for sid in params if sid in database.existing])
+
+            def executemany(self, query, rows):
+                super().executemany(query, rows)
+                database.batches.append((query.split()[2], list(rows)))
+
+        class Connection:
+            def commit(self):
+                database.commits += 1
+
+        cursor = Cursor()
+        self.cursors.append(cursor)
+        yield Connection(), cursor
+
+    def written(self, table):
+        """Rows passed to executemany for ``table``, across every transaction."""
+        return [row for name, rows in self.batches if name == table for row in rows]
+
+
+@pytest.fixture
+def database(monkeypatch, recording_cursor):
+    database = Database(recording_cursor, existing={'S9'})
+    monkeypatch.setattr(ingestion, 'db_cursor', database)
+    return database
+
+
+def test_ingest_streams_every_sheet_and_rejects_unknown_students(database, tmp_path):
+    workbook = openpyxl.Workbook()
+    students = workbook.active
+    students.title = 'Students'
+    students.append(['student_id', 'first_name', 'last_name'])
+    students.append(['S1', 'Anna', 'Zulu'])
+    students.append([None, None, None])
+    students.append(['S2', 'Sipho'])
+    attendance = workbook.create_sheet('Attendance')
+    attendance.append(['student_id', 'attendance_percentage'])
+    for row in [['S1', 80], ['S9', 90], ['S404', 70], ['S1', 'n/a']]:
+        attendance.append(row)
+    path = tmp_path / 'unizulu_upload.xlsx'
+    workbook.save(path)
+
+    job = IngestionJob('unizulu_upload.xlsx')
+    service = IngestionService(inference_service=None, feature_store=None, chunk_size=2)
+    touched = service.ingest(job, str(path))
+
+    assert touched == {'S1', 'S9'}
+    assert job.rows_read == 6 and job.rows_written == 3 and job.rows_rejected == 3
+    errors = {(e['sheet'], e['row']): e['error'] for e in job.errors}
+    assert sorted(errors) == [('attendance', 4), ('attendance', 5), ('students', 4)]
+    assert errors['attendance', 4] == 'Unknown student S404'
+    assert [row[0] for row in database.written('students')] == ['S1']
+    assert database.written('attendance') == [('S1', 1, 80.0), ('S9', 1, 90.0)]
+
+
+def test_csv_records_skip_blank_lines_and_keep_line_numbers():
+    stream = io.StringIO('Student_ID, Attendance_Percentage\nS1,80\n\n , \nS2,90\n', newline='')
+    assert list(csv_records(stream)) == [
+        (2, {'student_id': 'S1', 'attendance_percentage': '80'}),
+        (5, {'student_id': 'S2', 'attendance_percentage': '90'}),
+    ]
+    assert list(csv_records(io.StringIO(''))) == []
+
+
+def test_write_records_reports_each_bad_row_and_writes_the_rest(database):
+    service = IngestionService(inference_service=None, feature_store=None, chunk_size=2)
+    job, touched = service.write_records('lms_activity', [
+        (1, {'student_id': 'S9', 'lms_activity_score': '4'}),
+        (2, {'student_id': 'S404', 'lms_activity_score': 2}),
+        (3, {'student_id': 'S9', 'lms_activity_score': -1}),
+        (4, {'student_id': 'S9', 'lms_activity_score': 6}),
+    ])
+
+    assert job.status == 'completed'
+    assert touched == {'S9'}
+    assert (job.rows_read, job.rows_written, job.rows_rejected) == (4, 2, 2)
+    assert sorted((e['row'], e['error'].startswith(UNKNOWN_STUDENT)) for e in job.errors) == [(2, True), (3, False)]
+    assert database.written('lms_activity') == [('S9', 4.0), ('S9', 6.0)]
+    # One transaction per chunk of two records
+    assert database.commits == 2
+
+
+def test_write_records_updates_aggregates_and_rollups(database):
+    service = IngestionService(inference_service=None, feature_store=None)
+    service.write_records('performance', [(1, {
+        'student_id': 'S9', 'subject_code': 'MTH101', 'subject_name': 'Maths', 'mark': 30, 'max_mark': 60,
+        'assessment_type': 'Test', 'assessment_date': '2024-03-01', 'semester': '1', 'academic_year': 2024,
+    })])
+
+    queries = [query for query, _ in database.cursors[0].executed]
+    assert any(query.startswith('INSERT INTO performance_aggregates') for query in queries)
+    assert database.written('performance_rollup') == [('MTH101', '1', 2024, datetime.date(2024, 3, 1), 50.0, 1)]
+
+
+def test_write_records_replaces_attendance_in_the_rollup(database):
+    service = IngestionService(inference_service=None, feature_store=None)
+    service.write_records('attendance', [(1, {'student_id': 'S9', 'attendance_percentage': 75})])
+
+    queries = [query for query, _ in database.cursors[0].executed]
+    rollup = [i for i, query in enumerate(queries) if query.startswith('INSERT INTO attendance_rollup')]
+    upsert = queries.index(next(q for q in queries if q.startswith('INSERT INTO attendance (')))
+    # The old value leaves the rollup before the upsert and the new one enters after it
+    assert len(rollup) == 2 and rollup[0] < upsert < rollup[1]
@@ -0,0 +1,114 @@
+import pytest
+from flask import Flask, Response
+
+import db
+from instrumentation import BACKGROUND_ROUTE, Counter, Gauge, Histogram, Instrumentation, InstrumentedCursor, redact
+
+
+def test_histogram_renders_cumulative_buckets_per_series():
+    histogram = Histogram('latency_seconds', 'Latency.', [0.1, 1.0], ('route',))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(('/b',), value)
+    histogram.observe(('/a',), 2.0)
+
+    assert histogram.render() == [
+        '# HELP latency_seconds Latency.',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{route="/a",le="0.1"} 0',
+        'latency_seconds_bucket{route="/a",le="1.0"} 0',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 1',
+        'latency_seconds_sum{route="/a"} 2.0',
+        'latency_seconds_count{route="/a"} 1',
+        # A value equal to a bound falls in that bucket (le is inclusive)
+        'latency_seconds_bucket{route="/b",le="0.1"} 2',
+        'latency_seconds_bucket{route="/b",le="1.0"} 3',
+        'latency_seconds_bucket{route="/b",le="+Inf"} 4',
+        'latency_seconds_sum{route="/b"} 3.65',
+        'latency_seconds_count{route="/b"} 4',
+    ]
+
+
+def test_counter_renders_sorted_escaped_labels():
+    counter = Counter('requests_total', 'Requests.', ('route', 'status'))
+    counter.inc(('/x', '200'))
+    counter.inc(('/x', '200'), 2)
+    counter.inc(('/a"b\\c\n', '500'))
+
+    assert counter.render() == [
+        '# HELP requests_total Requests.',
+        '# TYPE requests_total counter',
+        'requests_total{route="/a\\"b\\\\c\\n",status="500"} 1',
+        'requests_total{route="/x",status="200"} 3',
+    ]
+
+
+def test_gauge_reads_its_value_at_render_time():
+    values = iter([1, 2])
+    gauge = Gauge('queue_depth', 'Queued jobs.', lambda: next(values))
+    assert gauge.render()[-1] == 'queue_depth 1'
+    assert gauge.render()[-1] == 'queue_depth 2'
+
+
+def test_redact_keeps_only_types():
+    assert redact(None) is None
+    assert redact(('S1', 3, None)) == ['<str>', '<int>', '<NoneType>']
+    assert redact({'password': 'secret'}) == {'password': '<str>'}
+
+
+@pytest.fixture
+def instrumented(monkeypatch, recording_cursor):
+    monkeypatch.setattr(db, '_cursor_wrapper', None)
+    app = Flask(__name__)
+    instrumentation = Instrumentation(app, enabled=True, slow_query_ms=1000)
+
+    def cursor():
+        return InstrumentedCursor(recording_cursor(), instrumentation)
+
+    @app.route('/students/<student_id>')
+    def student(student_id):
+        c = cursor()
+        c.execute("SELECT 1")
+        c.executemany("INSERT INTO t VALUES (%s)", [(1,), (2,)])
+        return {'student_id': student_id}
+
+    @app.route('/stream')
+    def stream():
+        return Response(iter(['a', 'b']), mimetype='text/plain')
+
+    return app.test_client(), instrumentation, cursor
+
+
+def test_requests_get_server_timing_and_per_route_metrics(instrumented):
+    client, instrumentation, _ = instrumented
+    response = client.get('/students/S1')
+
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+    assert 'desc="2 queries"' in response.headers['Server-Timing']
+    metrics = instrumentation.render()
+    assert 'http_requests_total{route="/students/<student_id>",method="GET",status="200"} 1' in metrics
+    assert 'http_request_db_queries_bucket{route="/students/<student_id>",method="GET",le="2"} 1' in metrics
+    assert 'db_queries_total{route="/students/<student_id>"} 2' in metrics
+
+
+def test_queries_outside_requests_count_as_background(instrumented):
+    _, instrumentation, cursor = instrumented
+    cursor().execute("SELECT 1")
+    assert f'db_queries_total{{route="{BACKGROUND_ROUTE}"}} 1' in instrumentation.render()
+
+
+def test_streamed_responses_are_counted_when_closed(instrumented):
+    client, instrumentation, _ = instrumented
+    response = client.get('/stream', buffered=False)
+    assert 'route="/stream"' not in instrumentation.render()
+
+    response.close()
+    assert 'http_requests_total{route="/stream",method="GET",status="200"} 1' in instrumentation.render()
+
+
+def test_slow_queries_are_logged_without_parameter_values(instrumented, caplog):
+    _, instrumentation, _ = instrumented
+    instrumentation.record_query("SELECT *\n  FROM accounts WHERE password = %s", ('hunter2',), 2.0)
+
+    assert 'db_slow_queries_total{route="background"} 1' in instrumentation.render()
+    assert "SELECT * FROM accounts WHERE password = %s [params ['<str>']]" in caplog.text
+    assert 'hunter2' not in caplog.text
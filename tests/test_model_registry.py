@@ -0,0 +1,81 @@
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+import model_registry
+from inference import MODEL_FEATURES
+from model_registry import ModelRegistry, metadata_path, write_model_metadata
+
+
+def train(columns):
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.uniform(0, 100, size=(40, len(columns))), columns=columns)
+    return LogisticRegression().fit(X, (X.iloc[:, 0] > 50).astype(int))
+
+
+@pytest.fixture
+def artifact(tmp_path):
+    path = str(tmp_path / 'student_risk_model.pkl')
+    joblib.dump(train(MODEL_FEATURES), path)
+    return path
+
+
+def test_artifact_with_matching_metadata_is_served(artifact):
+    metadata = write_model_metadata(artifact, cv_f1=0.9)
+    registry = ModelRegistry(artifact)
+
+    assert registry.get() is not None
+    assert registry.version == metadata['version']
+    assert registry.info()['metadata']['cv_f1'] == 0.9 and registry.info()['error'] is None
+
+
+def test_artifact_without_metadata_is_never_unpickled(artifact, monkeypatch):
+    def load(*args, **kwargs):
+        raise AssertionError('unpickled an artifact without metadata')
+
+    monkeypatch.setattr(model_registry.joblib, 'load', load)
+    registry = ModelRegistry(artifact)
+
+    assert registry.get() is None
+    assert 'has no training metadata' in registry.info()['error']
+
+
+def test_artifact_changed_after_training_is_refused(artifact):
+    write_model_metadata(artifact)
+    joblib.dump(train(MODEL_FEATURES[::-1]), artifact)
+    registry = ModelRegistry(artifact)
+
+    assert registry.get() is None
+    assert 'does not match' in registry.info()['error']
+
+
+def test_unreadable_metadata_is_treated_as_missing(artifact):
+    with open(metadata_path(artifact), 'w', encoding='utf-8') as fo:
+        fo.write('{not json')
+    registry = ModelRegistry(artifact)
+
+    assert registry.get() is None
+    assert 'has no training metadata' in registry.info()['error']
+
+
+def test_model_trained_on_other_features_is_refused(artifact):
+    joblib.dump(train(MODEL_FEATURES[:-1] + ['gpa']), artifact)
+    write_model_metadata(artifact)
+    registry = ModelRegistry(artifact)
+
+    assert registry.get() is None
+    assert 'gpa' in registry.info()['error']
+
+
+def test_missing_artifact_is_reported_once_and_reload_retries(tmp_path):
+    path = str(tmp_path / 'missing.pkl')
+    registry = ModelRegistry(path)
+    assert registry.get() is None and 'not found' in registry.info()['error']
+
+    joblib.dump(train(MODEL_FEATURES), path)
+    write_model_metadata(path)
+    # The failure is remembered until reload()
+    assert registry.get() is None
+    assert registry.reload() is not None
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from notifications import NotificationBroker, NotificationFollower
+
+
+def test_wait_returns_events_after_the_cursor():
+    broker = NotificationBroker(history_size=10)
+    broker.publish({'student_id': 'S1', 'message': 'a'})
+    broker.publish({'student_id': 'S2', 'message': 'b'})
+
+    events, cursor, reset = broker.wait(0, timeout=0)
+    assert [event['message'] for _, event in events] == ['a', 'b']
+    assert cursor == 2 and not reset
+
+    events, cursor, reset = broker.wait(0, timeout=0, student_id='S2')
+    assert [seq for seq, _ in events] == [2]
+
+
+def test_wait_blocks_until_a_publish():
+    broker = NotificationBroker()
+    threading.Timer(0.05, broker.publish, args=({'student_id': 'S1'},)).start()
+
+    start = time.monotonic()
+    events, cursor, _ = broker.wait(0, timeout=5)
+    assert len(events) == 1 and cursor == 1
+    assert time.monotonic() - start < 5
+
+
+def test_events_for_other_students_still_advance_the_cursor():
+    broker = NotificationBroker()
+    broker.publish({'student_id': 'S2'})
+
+    events, cursor, reset = broker.wait(0, timeout=0, student_id='S1')
+    assert events == [] and cursor == 1 and not reset
+
+
+def test_cursors_outside_the_history_ask_for_a_reload():
+    broker = NotificationBroker(history_size=2)
+    for i in range(4):
+        broker.publish({'student_id': 'S1', 'n': i})
+
+    assert broker.wait(1, timeout=0)[2] is True
+    assert broker.wait(2, timeout=0)[2] is False
+    # A cursor from before a server restart
+    assert broker.wait(99, timeout=0)[2] is True
+
+
+def test_events_with_a_key_are_published_once():
+    broker = NotificationBroker()
+    assert broker.publish({'id': 1}, key=1) == 1
+    assert broker.publish({'id': 1}, key=1) is None
+    assert broker.publish({'id': 2}, key=2) == 2
+
+
+def test_stream_frames_events_with_their_ids():
+    broker = NotificationBroker()
+    broker.publish({'student_id': 'S1'})
+
+    frame = next(broker.stream(0))
+    assert frame == 'event: notification\nid: 1\ndata: {"student_id": "S1"}\n\n'
+
+
+def test_reserve_caps_waiting_clients():
+    broker = NotificationBroker(max_waiters=2)
+    first = broker.reserve()
+    second = broker.reserve()
+
+    assert first and second
+    assert broker.reserve() is None
+
+    first()
+    first()  # Releasing twice frees one slot only
+    third = broker.reserve()
+    assert third is not None
+    assert broker.reserve() is None
+
+
+def test_follower_publishes_rows_from_other_processes_once():
+    broker = NotificationBroker()
+    rows = {11: {'intervention_id': 11}, 12: {'intervention_id': 12}}
+    # Published locally before the follower sees it in the table
+    broker.publish(rows[11], key=11)
+
+    follower = NotificationFollower(broker, latest=lambda: 10, poll_seconds=0.01,
+                                    fetch_after=lambda key: [(k, rows[k]) for k in sorted(rows) if k > key])
+    follower.start()
+    deadline = time.monotonic() + 5
+    while broker.cursor < 2 and time.monotonic() < deadline:
+        broker.wait(broker.cursor, timeout=0.1)
+    time.sleep(0.05)
+
+    events, cursor, _ = broker.wait(0, timeout=0)
+    assert [event['intervention_id'] for _, event in events] == [11, 12]
+    assert cursor == 2
+
+
+def test_follower_is_off_without_a_poll_interval():
+    follower = NotificationFollower(NotificationBroker(), latest=lambda: 0, fetch_after=lambda key: [],
+                                    poll_seconds=0)
+    follower.start()
+    assert follower._worker is None
@@ -0,0 +1,120 @@
+import csv
+import io
+import json
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import performance
+from db import DatabaseUnavailable
+from performance import PERFORMANCE_MAX_LIMIT, parse_performance_args, performance_query, stream_performance
+
+
+def test_parse_performance_args_reads_cursor_limit_and_filters():
+    args = MultiDict({'after': '120', 'limit': '50', 'academic_year': '2024', 'semester': 'S1', 'subject_code': ''})
+
+    assert parse_performance_args(args) == (120, 50, {'academic_year': 2024, 'semester': 'S1'})
+    assert parse_performance_args(MultiDict()) == (None, None, {})
+
+
+@pytest.mark.parametrize('args, message', [
+    ({'after': 'abc'}, 'after must be an integer'),
+    ({'limit': '1.5'}, 'limit must be an integer'),
+    ({'limit': '0'}, 'limit must be between'),
+    ({'limit': str(PERFORMANCE_MAX_LIMIT + 1)}, 'limit must be between'),
+    ({'academic_year': 'last'}, 'academic_year must be an integer'),
+])
+def test_parse_performance_args_rejects_bad_values(args, message):
+    with pytest.raises(ValueError, match=message):
+        parse_performance_args(MultiDict(args))
+
+
+def test_performance_query_pages_by_performance_id():
+    query, params = performance_query(after=120, limit=50, filters={'semester': 'S1', 'academic_year': 2024})
+    query = ' '.join(query.split())
+
+    assert query.endswith("WHERE p.performance_id > %s AND p.semester = %s AND p.academic_year = %s "
+                          "ORDER BY p.performance_id LIMIT %s")
+    assert params == [120, 'S1', 2024, 50]
+
+
+def test_performance_query_without_cursor_reads_everything():
+    query, params = performance_query()
+    assert 'WHERE' not in query and 'LIMIT' not in query
+    assert params == []
+
+
+ROWS = [{alias: None for alias, _ in performance.PERFORMANCE_COLUMNS} | {'performance_id': i, 'student_id': f'S{i}'}
+        for i in range(1, 6)]
+
+
+class StreamingConnection:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.executed = []
+        self.closed = False
+        self.unread_result = False
+
+    def cursor(self, **kwargs):
+        assert kwargs == {'dictionary': True, 'buffered': False}
+        return self
+
+    def execute(self, query, params):
+        self.executed.append(params)
+        self.unread_result = True
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        self.unread_result = bool(self.rows)
+        return batch
+
+    def consume_results(self):
+        self.rows = []
+        self.unread_result = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    conn = StreamingConnection(ROWS)
+    monkeypatch.setattr(performance, 'get_db_connection', lambda: conn)
+    return conn
+
+
+@pytest.mark.parametrize('fmt', ['json', 'ndjson', 'csv'])
+def test_stream_performance_yields_every_row_in_batches(connection, fmt):
+    chunks, close = stream_performance(fmt, after=0, filters={'semester': 'S1'}, batch_size=2)
+    body = ''.join(chunks)
+    close()
+
+    if fmt == 'json':
+        rows = json.loads(body)
+    elif fmt == 'ndjson':
+        rows = [json.loads(line) for line in body.splitlines()]
+    else:
+        rows = list(csv.DictReader(io.StringIO(body)))
+    assert [str(row['performance_id']) for row in rows] == ['1', '2', '3', '4', '5']
+    assert connection.executed == [[0, 'S1']]
+    assert connection.closed
+
+
+def test_stream_performance_with_no_rows_is_valid_json(monkeypatch):
+    monkeypatch.setattr(performance, 'get_db_connection', lambda: StreamingConnection([]))
+    chunks, close = stream_performance('json')
+    assert json.loads(''.join(chunks)) == []
+
+
+def test_closing_early_drains_and_returns_the_connection(connection):
+    chunks, close = stream_performance('ndjson', batch_size=2)
+    next(chunks)
+    close()
+
+    assert connection.rows == [] and connection.closed
+
+
+def test_stream_performance_needs_a_connection(monkeypatch):
+    monkeypatch.setattr(performance, 'get_db_connection', lambda: None)
+    with pytest.raises(DatabaseUnavailable):
+        stream_performance('json')
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+from recompute import RecomputeRun, check_run_options
+
+
+def test_check_run_options_accepts_usable_integers():
+    check_run_options(1, 1)
+    check_run_options(os.cpu_count() or 1, 5000)
+
+
+@pytest.mark.parametrize('workers', [0, -1, (os.cpu_count() or 1) + 1, 2.0, '2', True, None])
+def test_check_run_options_rejects_bad_workers(workers):
+    with pytest.raises(ValueError, match='workers'):
+        check_run_options(workers, 100)
+
+
+@pytest.mark.parametrize('chunk_size', [0, -5, 10.5, '100', False, None])
+def test_check_run_options_rejects_bad_chunk_size(chunk_size):
+    with pytest.raises(ValueError, match='chunk_size'):
+        check_run_options(1, chunk_size)
+
+
+def test_run_adds_up_chunk_results():
+    run = RecomputeRun(workers=2, chunk_size=2)
+    run.students_total = 5
+    run._add_chunk({'students': 2, 'seconds': 0.5, 'risk_distribution': {'High': 1, 'Low': 1},
+                    'scored_by': {'model': 2}})
+    run._add_chunk({'students': 2, 'seconds': 1.5, 'risk_distribution': {'High': 2},
+                    'scored_by': {'model': 1, 'thresholds': 1}})
+
+    report = run.to_dict()
+    assert report['students_done'] == 4 and report['chunks_done'] == 2
+    assert report['progress'] == 0.8
+    assert report['mean_chunk_seconds'] == 1.0
+    assert report['risk_distribution'] == {'High': 3, 'Low': 1}
+    assert report['scored_by'] == {'model': 3, 'thresholds': 1}
+    assert report['status'] == 'queued' and report['started_at'] is None
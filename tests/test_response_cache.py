@@ -0,0 +1,119 @@
+import pytest
+from flask import Flask, jsonify
+
+from response_cache import LRUBackend, ResponseCache
+
+
+@pytest.fixture
+def served():
+    app = Flask(__name__)
+    cache = ResponseCache(backend=LRUBackend(), ttl_seconds=60, enabled=True)
+    calls = []
+
+    @app.route('/students/<student_id>')
+    @cache.cached('student:{student_id}', 'students')
+    def student(student_id):
+        calls.append(student_id)
+        response = jsonify({'student_id': student_id, 'version': len(calls)})
+        response.headers['X-Total'] = '1'
+        return response
+
+    @app.route('/missing')
+    @cache.cached('students')
+    def missing():
+        calls.append('missing')
+        return jsonify({'error': 'not found'}), 404
+
+    return app.test_client(), cache, calls
+
+
+def test_second_request_is_served_from_cache(served):
+    client, cache, calls = served
+    first = client.get('/students/S1')
+    second = client.get('/students/S1')
+
+    assert calls == ['S1']
+    assert second.json == first.json
+    assert second.headers['X-Total'] == '1'
+    assert second.headers['Cache-Control'] == 'no-cache'
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_query_string_is_part_of_the_key(served):
+    client, _, calls = served
+    client.get('/students/S1?fields=a&page=2')
+    client.get('/students/S1?page=2&fields=a')
+    client.get('/students/S1?page=3')
+
+    assert calls == ['S1', 'S1']
+
+
+def test_invalidating_a_tag_only_drops_entries_carrying_it(served):
+    client, cache, calls = served
+    client.get('/students/S1')
+    client.get('/students/S2')
+
+    cache.invalidate_students(['S1'])
+    assert client.get('/students/S1').json['version'] == 3
+    assert client.get('/students/S2').json['version'] == 2
+
+    cache.invalidate('students')
+    client.get('/students/S2')
+    assert calls == ['S1', 'S2', 'S1', 'S2']
+
+    cache.invalidate_all()
+    client.get('/students/S1')
+    assert calls[-1] == 'S1' and len(calls) == 5
+
+
+def test_matching_etag_gets_304(served):
+    client, cache, _ = served
+    etag = client.get('/students/S1').headers['ETag']
+
+    revalidated = client.get('/students/S1', headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+    assert revalidated.headers['ETag'] == etag
+    assert client.get('/students/S1', headers={'If-None-Match': '"other"'}).status_code == 200
+    assert cache.stats()['endpoints']['student']['not_modified'] == 1
+
+
+def test_etag_changes_with_the_body(served):
+    client, cache, _ = served
+    etag = client.get('/students/S1').headers['ETag']
+    cache.invalidate('student:S1')
+
+    response = client.get('/students/S1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_errors_are_not_cached(served):
+    client, _, calls = served
+    assert client.get('/missing').status_code == 404
+    client.get('/missing')
+    assert calls == ['missing', 'missing']
+
+
+def test_disabled_cache_calls_the_view_every_time(served):
+    client, cache, calls = served
+    cache.enabled = False
+    client.get('/students/S1')
+    response = client.get('/students/S1')
+
+    assert calls == ['S1', 'S1']
+    assert 'ETag' not in response.headers
+
+
+def test_lru_backend_evicts_oldest_and_expires():
+    backend = LRUBackend(max_entries=2)
+    backend.set('a', 1, ttl=60)
+    backend.set('b', 2, ttl=60)
+    backend.get('a')
+    backend.set('c', 3, ttl=60)
+
+    assert backend.get('b') is None
+    assert backend.get('a') == 1 and backend.get('c') == 3
+
+    backend.set('short', 4, ttl=-1)
+    assert backend.get('short') is None
@@ -0,0 +1,141 @@
+import random
+
+import pytest
+
+from search_index import FIELD_WEIGHTS, SEARCH_FIELDS, SUBSTRING_SCORE, StudentSearchIndex, tokenize
+
+STUDENTS = [
+    ('201', 'Anna', 'Smith', 'BSc Computer Science'),
+    ('202', 'Thandi', 'Annandale', 'BCom Accounting'),
+    ('2010', 'Sipho', 'Anna', 'BSc Physics'),
+    ('305', 'Joanna', 'Dlamini', 'BA Education'),
+]
+
+
+class StudentsCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+
+@pytest.fixture
+def index():
+    index = StudentSearchIndex()
+    index.load(StudentsCursor(STUDENTS))
+    return index
+
+
+def ids(results):
+    return [doc['student_id'] for doc in results[0]]
+
+
+def reference_ranking(students, query):
+    """Brute-force ranking the index must reproduce: best total first, then student_id."""
+    terms = tokenize(query)
+    if not terms:
+        return []
+    ranked = []
+    for row in students:
+        document = dict(zip(SEARCH_FIELDS, row))
+        total = 0
+        for term in terms:
+            best = 0
+            for field in SEARCH_FIELDS:
+                tokens = tokenize(document[field])
+                if term in tokens:
+                    best = max(best, FIELD_WEIGHTS[field] * 2)
+                elif any(token.startswith(term) for token in tokens):
+                    best = max(best, FIELD_WEIGHTS[field])
+            if not best and len(terms) == 1 and term in ' '.join(str(v) for v in row).lower():
+                best = SUBSTRING_SCORE
+            if not best:
+                break
+            total += best
+        else:
+            ranked.append((-total, document['student_id']))
+    return [student_id for _, student_id in sorted(ranked)]
+
+
+def test_exact_matches_rank_above_prefixes_and_substrings(index):
+    results, next_offset = index.search('anna')
+
+    # Exact last name and first name (tie broken by id), prefix of a last name,
+    # then a substring inside a first name
+    assert ids((results, next_offset)) == ['201', '2010', '202', '305']
+    assert [doc['score'] for doc in results] == [8, 8, 4, SUBSTRING_SCORE]
+    assert next_offset is None
+
+
+def test_student_id_outranks_names(index):
+    assert ids(index.search('201')) == ['201', '2010']
+    assert [doc['score'] for doc in index.search('201')[0]] == [16, 8]
+
+
+def test_every_term_must_match(index):
+    assert ids(index.search('anna bsc')) == ['201', '2010']
+    assert ids(index.search('anna bcom')) == ['202']
+    assert index.search('anna education') == ([], None)
+
+
+def test_pages_are_stable(index):
+    first, next_offset = index.search('anna', limit=2)
+    second, last = index.search('anna', limit=2, offset=next_offset)
+
+    assert next_offset == 2 and last is None
+    assert [doc['student_id'] for doc in first + second] == ids(index.search('anna'))
+
+
+def test_blank_query_matches_nothing(index):
+    assert index.search('  ,, ') == ([], None)
+
+
+def test_upsert_reindexes_changed_fields(index):
+    index.upsert('201', last_name='Mokoena')
+
+    assert '201' not in ids(index.search('smith'))
+    assert ids(index.search('mokoena')) == ['201']
+    # Unchanged fields are kept
+    assert index.search('mokoena')[0][0]['first_name'] == 'Anna'
+    # The substring haystack skips the superseded record
+    assert ids(index.search('mith')) == []
+
+
+def test_upsert_adds_and_remove_drops_students(index):
+    index.upsert(999, first_name='Zanele', last_name='Khumalo', program='BSc Physics')
+    assert ids(index.search('zan')) == ['999']
+    assert len(index) == 5
+
+    index.remove('999')
+    index.remove('unknown')
+    assert index.search('zan') == ([], None)
+    assert index.search('khumalo') == ([], None)
+    assert len(index) == 4
+
+
+def test_matches_brute_force_ranking():
+    rng = random.Random(7)
+    first = ['Anna', 'Andile', 'Sipho', 'Thandi', 'Joanna', 'Lwazi', 'Nandi', 'Sanele']
+    last = ['Smith', 'Annandale', 'Dlamini', 'Ndlovu', 'Zulu', 'Mkhize', 'Anderson']
+    programs = ['BSc Computer Science', 'BCom Accounting', 'BA Education', 'BSc Physics']
+    students = [(f'2{rng.randrange(10000):04d}', rng.choice(first), rng.choice(last), rng.choice(programs))
+                for _ in range(300)]
+    students = list({row[0]: row for row in students}.values())
+    index = StudentSearchIndex()
+    index.load(StudentsCursor(students))
+
+    tokens = sorted({token for row in students for value in row for token in tokenize(value)})
+    queries = ['', 'and', 'ndi', 'ann', 'bsc sc', 'zulu bsc', 'an an', '20']
+    for _ in range(60):
+        picked = rng.sample(tokens, rng.choice([1, 2]))
+        queries.append(' '.join(token[:rng.randint(1, len(token))] for token in picked))
+
+    for query in queries:
+        expected = reference_ranking(students, query)
+        assert ids(index.search(query, limit=len(students))) == expected, query
+        # A page that starts past the best group still continues in rank order
+        assert ids(index.search(query, limit=5, offset=3)) == expected[3:8], query
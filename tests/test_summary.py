@@ -0,0 +1,49 @@
+import pytest
+
+from db import IN_CLAUSE_CHUNK_SIZE
+from summary import SUMMARY_FIELDS, ensure_student_summary, fetch_students, refresh_student_summary
+
+
+def test_fetch_students_pages_by_student_id(recording_cursor):
+    cursor = recording_cursor([[{'student_id': '102'}]])
+    rows = fetch_students(cursor, fields=['risk_level'], after='101', limit=50, program='BSc')
+
+    assert rows == [{'student_id': '102'}]
+    query, params = cursor.executed[0]
+    assert query == ("SELECT student_id, risk_level FROM student_summary "
+                     "WHERE student_id > %s AND program = %s ORDER BY student_id LIMIT %s")
+    assert params == ['101', 'BSc', 50]
+
+
+def test_fetch_students_defaults_to_every_field(recording_cursor):
+    cursor = recording_cursor()
+    fetch_students(cursor)
+
+    query, params = cursor.executed[0]
+    assert query == f"SELECT {', '.join(SUMMARY_FIELDS)} FROM student_summary ORDER BY student_id"
+    assert params == []
+
+
+def test_fetch_students_rejects_unknown_fields(recording_cursor):
+    cursor = recording_cursor()
+    with pytest.raises(ValueError, match='password'):
+        fetch_students(cursor, fields=['first_name', 'password'])
+    assert cursor.executed == []
+
+
+def test_refresh_student_summary_dedupes_and_chunks(recording_cursor):
+    cursor = recording_cursor()
+    ids = [str(i) for i in range(IN_CLAUSE_CHUNK_SIZE + 1)]
+
+    assert refresh_student_summary(cursor, ids + [int(ids[0])]) == IN_CLAUSE_CHUNK_SIZE + 1
+    assert [params for _, params in cursor.executed] == [ids[:IN_CLAUSE_CHUNK_SIZE], ids[IN_CLAUSE_CHUNK_SIZE:]]
+
+
+def test_ensure_student_summary_rebuilds_only_on_count_mismatch(recording_cursor):
+    cursor = recording_cursor([[(3, 3)]])
+    assert ensure_student_summary(cursor) is False
+    assert len(cursor.executed) == 1
+
+    cursor = recording_cursor([[(3, 2)]])
+    assert ensure_student_summary(cursor) is True
+    assert any(query.startswith('DELETE ss FROM student_summary') for query, _ in cursor.executed)